@@ -0,0 +1,149 @@
+"""Benchmark: end-to-end time of every route of both addons against mockserver.py.
+
+Each run is a fresh interpreter, as in Kodi, with the stand-in Kodi
+modules from benchmarks/stubs. The child resolves every host name to the
+local MockServer and skips the TLS handshake, so the addons' own HTTP
+client, caches and probing run unchanged over the simulated network. It
+reports percentiles of the time until the plugin hands its result to Kodi
+(endOfDirectory or setResolvedUrl), of the whole process, and the number of
+requests each run sent.
+
+With --cache cold every run starts with an empty profile; with warm the
+profile is kept between runs of a route, as it is in Kodi.
+
+    python benchmarks/bench_e2e.py [--runs 20] [--cache cold|warm|both] [--latency 80]
+                                   [--bandwidth 500] [--no-gzip] [--fail-rate 0.1]
+                                   [--fail HOST[=STATUS]] [--addon nextgenrt] [--route play]
+                                   [--setting async_resolver=true]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import mockserver
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+STUBS = os.path.join(BENCH_DIR, 'stubs')
+CORE = os.path.join(ROOT, 'script.module.nextgenrt.core', 'lib')
+
+SERIES_URL = 'https://en.rtdoc.tv/serials/1000-truth-history-war'
+EPISODE_URL = SERIES_URL + '/episodes/1-1-secret-road'
+
+# addon -> [(route name, plugin query)]
+ROUTES = [
+    ('plugin.video.nextgenrt', [
+        ('root', ''),
+        ('play', '?action=play&url=https://www.rt.com/on-air/'),
+        ('play-rtd', '?action=play&url=https://rtd.rt.com/on-air/'),
+        ('play-iframe', '?action=play&url=https://rt.rs/livetv/'),
+    ]),
+    ('plugin.video.nextgenrttvseries', [
+        ('root', ''),
+        ('episodes', '?action=episodes&url=' + SERIES_URL),
+        ('season_episodes', '?action=season_episodes&url=%s&season=2' % SERIES_URL),
+        ('play', '?action=play&url=' + EPISODE_URL),
+    ]),
+]
+
+CHILD = """
+import json, os, socket, ssl, sys, time
+start = time.perf_counter()
+
+# Every host name resolves to the mock server, which speaks plain HTTP
+port = int(os.environ['MOCK_PORT'])
+_getaddrinfo = socket.getaddrinfo
+socket.getaddrinfo = lambda host, _, *args, **kwargs: _getaddrinfo('127.0.0.1', port, *args, **kwargs)
+ssl.SSLContext.wrap_socket = lambda self, sock, *args, **kwargs: sock
+
+import xbmcaddon, xbmcplugin
+xbmcaddon.SETTINGS.update(json.loads(os.environ.get('BENCH_SETTINGS') or '{}'))
+finished = []
+def _finish(original):
+    def wrapper(*args, **kwargs):
+        finished.append(time.perf_counter())
+        return original(*args, **kwargs)
+    return wrapper
+xbmcplugin.endOfDirectory = _finish(xbmcplugin.endOfDirectory)
+xbmcplugin.setResolvedUrl = _finish(xbmcplugin.setResolvedUrl)
+sys.argv = [sys.argv[1], '1', sys.argv[2]]
+from resources.lib import main
+main.run()
+ended = time.perf_counter()
+resolved = [item for item in xbmcplugin.RESOLVED if item[0]]
+print(json.dumps({'result': finished[0] - start, 'process': ended - start,
+                  'items': len(xbmcplugin.ITEMS), 'resolved': len(resolved)}))
+"""
+
+def _run(addon, query, profile, port, settings):
+    plugin = os.path.join(ROOT, addon)
+    env = dict(os.environ, STUB_PROFILE=profile, MOCK_PORT=str(port), BENCH_SETTINGS=json.dumps(settings),
+               PYTHONPATH=os.pathsep.join([STUBS, CORE, plugin]), PYTHONDONTWRITEBYTECODE='')
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD, 'plugin://%s/' % addon, query], env=env, cwd=plugin)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+def percentile(values, p):
+    """Nearest-rank percentile of values, p in 0..100."""
+    values = sorted(values)
+    rank = max(1, int(round(p / 100.0 * len(values) + 0.5 - 1e-9)))
+    return values[min(rank, len(values)) - 1]
+
+def _bench_route(server, addon, query, runs, cache, settings):
+    samples = []
+    profile = tempfile.mkdtemp(prefix='nextgenrt-e2e-')
+    try:
+        for _ in range(runs):
+            if cache == 'cold':
+                shutil.rmtree(profile, ignore_errors=True)
+                os.makedirs(profile)
+            server.reset()
+            result = _run(addon, query, profile, server.port, settings)
+            result['requests'] = sum(server.reset().values())
+            samples.append(result)
+    finally:
+        shutil.rmtree(profile, ignore_errors=True)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--cache', choices=['cold', 'warm', 'both'], default='both')
+    parser.add_argument('--addon', action='append', default=[], help='only this addon (nextgenrt or nextgenrttvseries)')
+    parser.add_argument('--route', action='append', default=[], help='only this route')
+    parser.add_argument('--setting', action='append', default=[], metavar='ID=VALUE',
+                        help='addon setting for every run, e.g. async_resolver=true')
+    mockserver.add_condition_arguments(parser)
+    args = parser.parse_args()
+    settings = dict(setting.partition('=')[::2] for setting in args.setting)
+
+    server = mockserver.MockServer(0, mockserver.conditions_from_args(args)).start()
+    caches = ['cold', 'warm'] if args.cache == 'both' else [args.cache]
+    try:
+        print('%-31s %-16s %-5s %9s %9s %9s %11s %9s %6s' % (
+            'addon', 'route', 'cache', 'p50 ms', 'p90 ms', 'p99 ms', 'process p50', 'requests', 'ok'))
+        for addon, routes in ROUTES:
+            if args.addon and addon.split('.')[-1] not in args.addon:
+                continue
+            for name, query in routes:
+                if args.route and name not in args.route:
+                    continue
+                for cache in caches:
+                    samples = _bench_route(server, addon, query, args.runs, cache, settings)
+                    results = [s['result'] * 1000 for s in samples]
+                    # A route succeeded if it listed items or resolved a stream
+                    ok = sum(1 for s in samples if s['items'] or s['resolved'])
+                    print('%-31s %-16s %-5s %9.1f %9.1f %9.1f %11.1f %9.1f %3d/%-2d' % (
+                        addon, name, cache, percentile(results, 50), percentile(results, 90),
+                        percentile(results, 99), percentile([s['process'] * 1000 for s in samples], 50),
+                        sum(s['requests'] for s in samples) / float(len(samples)), ok, len(samples)))
+    finally:
+        server.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
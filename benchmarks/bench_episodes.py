@@ -0,0 +1,84 @@
+"""Benchmark: series page episode parser vs the old DOTALL regex.
+
+Builds synthetic series pages of growing size (three seasons of episode
+cards followed by a footer of ordinary links) and times the single-pass
+parser against the regex the episode list used before. The regex retries
+its lazy .*? from every closing link, so its time grows roughly with the
+square of the page size; the parser's grows linearly.
+
+    python benchmarks/bench_episodes.py [--sizes 50,200,800] [--number 3]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, 'plugin.video.nextgenrttvseries')
+
+LEGACY_PATTERN = r'>([^<]*?)<\/a>\s*(?:</li>)?.*?href=["\']([^"\']*\/episodes\/[^"\']*)'
+
+def legacy_matches(html):
+    """The (title, url) pairs the old extractor split into seasons."""
+    return re.findall(LEGACY_PATTERN, html, re.IGNORECASE | re.DOTALL)
+
+def build_page(episodes_per_season, seasons=3, footer_links=None):
+    """Return a synthetic series page with the given number of episode cards."""
+    if footer_links is None:
+        footer_links = episodes_per_season * seasons
+    parts = ['<html><head><title>Series</title></head><body>',
+             '<nav><a href="/films">Films</a><a href="/serials">TV series</a></nav>']
+    for season in range(seasons, 0, -1):
+        parts.append('<section><h2>%d Season</h2><ul>' % season)
+        for number in range(1, episodes_per_season + 1):
+            url = '/serials/100-series/episodes/%d-%d-episode' % (season, number)
+            parts.append('<li class="card"><a href="%s"><img src="/img/%d-%d.jpg" alt=""></a>'
+                         '<a href="%s">Episode %d. A documentary title</a>'
+                         '<p class="card__text">Short description of the episode.</p></li>'
+                         % (url, season, number, url, number))
+        parts.append('</ul></section>')
+    parts.append('<footer><ul>')
+    for number in range(footer_links):
+        parts.append('<li><a href="/page/%d">Footer link %d</a></li>' % (number, number))
+    parts.append('</ul></footer></body></html>')
+    return ''.join(parts)
+
+def best_time(func, arg, number):
+    best = None
+    for _ in range(number):
+        start = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None or elapsed < best else best
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='50,200,800', help='episodes per season, comma separated')
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+
+    # scraper logs through xbmc; outside Kodi the log calls go nowhere
+    if 'xbmc' not in sys.modules:
+        sys.modules['xbmc'] = types.SimpleNamespace(
+            log=lambda msg, level=0: None, LOGDEBUG=0, LOGINFO=1, LOGWARNING=2, LOGERROR=3)
+    sys.path.insert(0, PLUGIN)
+    from resources.lib import scraper
+
+    print('%10s %10s %9s %12s %12s %8s' % ('episodes', 'bytes', 'found', 'regex ms', 'parser ms', 'speedup'))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        html = build_page(size)
+        episodes = scraper.parse_episodes(html)
+        if len(episodes) != size * 3:
+            print('%10d parser found %d episodes, expected %d' % (size * 3, len(episodes), size * 3))
+            return 1
+        legacy = best_time(legacy_matches, html, args.number)
+        parsed = best_time(scraper.parse_episodes, html, args.number)
+        print('%10d %10d %9d %12.1f %12.1f %7.1fx' % (
+            size * 3, len(html), len(episodes), legacy * 1000, parsed * 1000, legacy / parsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Microbenchmark: stream URL extraction engine vs the old regex chain.
+
+Runs both over the saved channel pages in benchmarks/pages and prints the
+time per page. The legacy chain is the sequence of re.search calls the
+resolvers used before the engine, kept here for comparison.
+
+    python benchmarks/bench_extract.py [--number 200]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE = os.path.join(ROOT, 'script.module.nextgenrt.core', 'lib')
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+LEGACY_PATTERNS = [
+    ('m3u8', r'(https?://[^"\s]+\.m3u8[^"\s]*)'),
+    ('file', r"file:\s*['\"]([^'\"]+)['\"]"),
+    ('url', r'url:\s*["\']([^"\']+\.m3u8[^"\']*)["\']'),
+    ('source', r'<source[^>]+src=["\']([^"\']+)["\']'),
+    ('iframe', r'<iframe[^>]+src=["\']([^"\']+)["\']'),
+]
+
+def legacy_extract(html):
+    """The sequential extractor chain, one full-document search per pattern."""
+    for name, pattern in LEGACY_PATTERNS:
+        m = re.search(pattern, html, re.DOTALL)
+        if m:
+            return name, m.group(1)
+    return None
+
+def load_pages():
+    pages = []
+    for name in sorted(os.listdir(PAGES_DIR)):
+        if name.endswith('.html'):
+            with open(os.path.join(PAGES_DIR, name), 'r') as f:
+                pages.append((name[:-5], f.read()))
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    sys.path.insert(0, CORE)
+    from nextgenrt_core import extract
+
+    print('%-12s %8s %-8s %10s %10s %8s' % ('page', 'bytes', 'rule', 'legacy us', 'engine us', 'speedup'))
+    total_legacy = total_engine = 0.0
+    for name, html in load_pages():
+        expected = legacy_extract(html)
+        candidate = extract.STANDARD.best(html)
+        got = (candidate.rule, candidate.url) if candidate else None
+        if got != expected:
+            print('%-12s MISMATCH legacy=%r engine=%r' % (name, expected, got))
+            return 1
+        legacy = timeit.timeit(lambda: legacy_extract(html), number=args.number) / args.number
+        engine = timeit.timeit(lambda: extract.STANDARD.best(html), number=args.number) / args.number
+        total_legacy += legacy
+        total_engine += engine
+        print('%-12s %8d %-8s %10.1f %10.1f %7.1fx' % (
+            name, len(html), got[0] if got else '-', legacy * 1e6, engine * 1e6, legacy / engine))
+    print('%-12s %8s %-8s %10.1f %10.1f %7.1fx' % (
+        'total', '', '', total_legacy * 1e6, total_engine * 1e6, total_legacy / total_engine))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Benchmark: cold start of plugin.video.nextgenrt and plugin.video.nextgenrttvseries per action.
+
+Each run is a fresh interpreter, as in Kodi, with the stand-in Kodi
+modules from benchmarks/stubs. It reports how long importing
+resources.lib.main takes and how long until the plugin hands its result
+to Kodi (endOfDirectory or setResolvedUrl). Each addon gets a throwaway
+profile that is filled first, so no action touches the network: for the
+news plugin the stream cache and the HLS playlist cache, for the series
+plugin the library and the search index, synced from the saved pages in
+benchmarks/pages.
+
+    python benchmarks/bench_startup.py [--runs 20]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+PAGES_DIR = os.path.join(BENCH_DIR, 'pages')
+STUBS = os.path.join(BENCH_DIR, 'stubs')
+CORE = os.path.join(ROOT, 'script.module.nextgenrt.core', 'lib')
+
+SERIES_URL = 'https://en.rtdoc.tv/serials/1000-truth-history-war'
+
+NEWS_SEED = """
+import sys
+sys.argv = ['plugin://plugin.video.nextgenrt/', '1', '']
+from nextgenrt_core import cache, hls
+from resources.lib import main
+stream_cache = cache.StreamCache.open()
+for url, _, _ in main.channels.RT_STREAMS:
+    stream_cache.put(url, 'https://example.invalid/live.m3u8', ttl=86400)
+stream_cache.save()
+hls.CACHE_TTL = 86400
+hls.PlaylistCache.open().variants('https://example.invalid/live.m3u8', lambda url: b'#EXTM3U')
+"""
+
+# Every series of the saved catalog gets the saved series page
+SERIES_SEED = """
+import os, sys
+pages_dir = sys.argv[1]
+sys.argv = ['plugin://plugin.video.nextgenrttvseries/', '1', '']
+from resources.lib import library, scraper, search_index, sync
+def page(name):
+    with open(os.path.join(pages_dir, name + '.html'), 'rb') as f:
+        return f.read()
+pages = {scraper.SERIALS_URL: page('rtdoc-serials')}
+series_page = page('rtdoc-series')
+db = library.Library.open()
+search = search_index.SearchIndex.open()
+sync.sync(db, lambda url: pages.get(url, series_page), search=search)
+db.close()
+"""
+
+# (name, addon directory, seed, [(action, query), ...])
+ADDONS = [
+    ('news', 'plugin.video.nextgenrt', NEWS_SEED, [
+        ('root', ''),
+        ('play', '?action=play&url=https://www.rt.com/on-air/'),
+    ]),
+    ('series', 'plugin.video.nextgenrttvseries', SERIES_SEED, [
+        ('root', ''),
+        ('episodes', '?action=episodes&url=%s' % SERIES_URL),
+        ('season', '?action=season_episodes&url=%s&season=3' % SERIES_URL),
+        ('search', '?action=search&query=frontier'),
+    ]),
+]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import xbmcplugin
+finished = []
+def _finish(original):
+    def wrapper(*args, **kwargs):
+        finished.append(time.perf_counter())
+        return original(*args, **kwargs)
+    return wrapper
+xbmcplugin.endOfDirectory = _finish(xbmcplugin.endOfDirectory)
+xbmcplugin.setResolvedUrl = _finish(xbmcplugin.setResolvedUrl)
+sys.argv = ['plugin://%s/' % sys.argv[1], '1', sys.argv[2]]
+from resources.lib import main
+imported = time.perf_counter()
+main.run()
+print(json.dumps({'import': imported - start, 'result': finished[0] - start, 'modules': len(sys.modules)}))
+"""
+
+def _run(code, addon, profile, *args):
+    plugin = os.path.join(ROOT, addon)
+    env = dict(os.environ, STUB_PROFILE=profile, PYTHONPATH=os.pathsep.join([STUBS, CORE, plugin]),
+               PYTHONDONTWRITEBYTECODE='')
+    return subprocess.check_output([sys.executable, '-c', code] + list(args), env=env, cwd=plugin)
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    print('%-15s %11s %11s %11s %8s' % ('action', 'process ms', 'import ms', 'result ms', 'modules'))
+    for addon_name, addon, seed, actions in ADDONS:
+        profile = tempfile.mkdtemp(prefix='nextgenrt-bench-')
+        try:
+            _run(seed, addon, profile, PAGES_DIR)
+            for name, query in actions:
+                samples = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    result = json.loads(_run(CHILD, addon, profile, addon, query).decode('utf-8'))
+                    result['process'] = time.perf_counter() - start
+                    samples.append(result)
+                print('%-15s %11.1f %11.1f %11.1f %8d' % (
+                    '%s/%s' % (addon_name, name),
+                    _median([s['process'] for s in samples]) * 1000,
+                    _median([s['import'] for s in samples]) * 1000,
+                    _median([s['result'] for s in samples]) * 1000,
+                    samples[-1]['modules']))
+        finally:
+            shutil.rmtree(profile, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Harness for running the plugins' extractors under pytest, outside Kodi.
+
+The Kodi modules are replaced by the stand-ins in benchmarks/stubs, and
+each test module loads one plugin with load_plugin(). Both plugins ship a
+top-level package named resources, so loading one unloads the other. The
+shared nextgenrt_core package is reloaded with it, so module state set by
+one plugin's tests does not leak into the other's.
+"""
+import importlib
+import json
+import os
+import sys
+import tracemalloc
+import warnings
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+PAGES_DIR = os.path.join(BENCH_DIR, 'pages')
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+CORE_DIR = os.path.join(ROOT, 'script.module.nextgenrt.core', 'lib')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+
+PLUGINS = ('plugin.video.nextgenrt', 'plugin.video.nextgenrttvseries')
+
+for path in (STUBS_DIR, CORE_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+def load_plugin(name, *modules):
+    """Import resources.lib.<module> of one plugin and return the modules in order."""
+    packages = ('resources', 'nextgenrt_core')
+    for loaded in [m for m in sys.modules if m.split('.')[0] in packages]:
+        del sys.modules[loaded]
+    for plugin in PLUGINS:
+        path = os.path.join(ROOT, plugin)
+        while path in sys.path:
+            sys.path.remove(path)
+    sys.path.insert(0, os.path.join(ROOT, name))
+    # main.py reads the plugin URL and handle from sys.argv at import time
+    argv, sys.argv = sys.argv, ['plugin://%s/' % name, '1', '']
+    try:
+        return [importlib.import_module('resources.lib.' + module) for module in modules]
+    finally:
+        sys.argv = argv
+
+def read_page(name):
+    with open(os.path.join(PAGES_DIR, name + '.html'), 'r') as f:
+        return f.read()
+
+def pytest_addoption(parser):
+    group = parser.getgroup('nextgenrt')
+    group.addoption('--update-baseline', action='store_true',
+                    help='store the measured extractor latencies and allocations as the new baseline')
+    group.addoption('--baseline-tolerance', type=float, default=0.5,
+                    help='fraction an extractor may exceed its baseline before it is flagged')
+    group.addoption('--baseline-strict', action='store_true',
+                    help='fail instead of warn when an extractor exceeds its baseline')
+
+try:
+    import pytest_benchmark
+except ImportError:
+    @pytest.fixture
+    def benchmark():
+        pytest.skip('pytest-benchmark is not installed')
+
+@pytest.fixture(scope='session', autouse=True)
+def stub_profile(tmp_path_factory):
+    """Point the stub addon profile at a throwaway directory."""
+    path = str(tmp_path_factory.mktemp('profile'))
+    previous = os.environ.get('STUB_PROFILE')
+    os.environ['STUB_PROFILE'] = path
+    yield path
+    if previous is None:
+        os.environ.pop('STUB_PROFILE', None)
+    else:
+        os.environ['STUB_PROFILE'] = previous
+
+@pytest.fixture(scope='session')
+def expected():
+    with open(os.path.join(PAGES_DIR, 'expected.json'), 'r') as f:
+        return json.load(f)
+
+def peak_allocation(func, *args):
+    """Return the peak bytes allocated while func(*args) runs once."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+@pytest.fixture
+def measure(request, benchmark, baseline):
+    """Benchmark func(*args), record its peak allocation and compare both with the baseline.
+
+    The result is stored under key for --update-baseline. A median latency
+    or peak allocation more than --baseline-tolerance above the baseline is
+    reported as a warning, or a failure with --baseline-strict.
+    """
+    config = request.config
+    data, measured = baseline
+
+    def run(key, func, *args):
+        peak = peak_allocation(func, *args)
+        result = benchmark(func, *args)
+        benchmark.extra_info['peak_bytes'] = peak
+        stats = getattr(benchmark, 'stats', None)
+        median_us = round(stats.stats.median * 1e6, 2) if stats else None
+        measured[key] = {'median_us': median_us, 'peak_bytes': peak}
+        reference = data.get(key)
+        if reference is None or config.getoption('--update-baseline'):
+            return result
+        limit = 1 + config.getoption('--baseline-tolerance')
+        problems = []
+        if median_us is not None and median_us > reference['median_us'] * limit:
+            problems.append('median %.1fus vs baseline %.1fus' % (median_us, reference['median_us']))
+        if peak > reference['peak_bytes'] * limit:
+            problems.append('peak %d bytes vs baseline %d bytes' % (peak, reference['peak_bytes']))
+        if problems:
+            message = '%s regressed: %s' % (key, ', '.join(problems))
+            if config.getoption('--baseline-strict'):
+                pytest.fail(message)
+            warnings.warn(message)
+        return result
+
+    return run
+
+@pytest.fixture(scope='session')
+def baseline(request):
+    """Baseline measurements keyed by benchmark id; rewritten at the end with --update-baseline."""
+    try:
+        with open(BASELINE_FILE, 'r') as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        data = {}
+    measured = {}
+    yield data, measured
+    if request.config.getoption('--update-baseline') and measured:
+        data.update(measured)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,298 @@
+"""Local stand-in for the RT and rtdoc.tv web servers.
+
+Serves the saved channel pages in benchmarks/pages, the iframe embed of
+rt.rs, the rtdoc.tv serials, series and episode pages and HLS playlists,
+choosing the content by the Host header and path of each request, so one
+port stands in for every host the addons talk to. Network conditions are
+configurable: latency before each response, bandwidth while sending the
+body, gzip on or off, and failures injected per host or at random.
+
+    python benchmarks/mockserver.py [--port 8080] [--latency 80] [--bandwidth 500]
+                                    [--no-gzip] [--fail-rate 0.1] [--fail HOST[=STATUS]]
+
+Clients must send plain HTTP to the server's port, with the real host name
+in the Host header; bench_e2e.py arranges that for the addons.
+"""
+import argparse
+import email.utils
+import gzip
+import hashlib
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(BENCH_DIR, 'pages')
+
+# (host, path) -> saved page, as listed in channels.RT_STREAMS of plugin.video.nextgenrt
+CHANNEL_PAGES = {
+    ('www.rt.com', '/on-air/'): 'rt-global.html',
+    ('www.rt.com', '/on-air/rt-america-air'): 'rt-america.html',
+    ('rtd.rt.com', '/on-air/'): 'rtd.html',
+    ('actualidad.rt.com', '/en_vivo2'): 'actualidad.html',
+    ('arabic.rt.com', '/live/'): 'arabic.html',
+    ('de.rt.com', '/livetv/'): 'de.html',
+    ('francais.rt.com', '/en-direct/rt'): 'francais.html',
+    ('rt.rs', '/livetv/'): 'rt-rs.html',
+}
+
+RTDOC_HOST = 'en.rtdoc.tv'
+
+EMBED_PAGE = """<!DOCTYPE html>
+<html><head><title>RT Live</title></head>
+<body><div id="player"></div>
+<script>
+  jwplayer("player").setup({file: "https://rt-srb.rttv.com/live/rtsrb/playlist.m3u8", autostart: true});
+</script>
+</body></html>
+"""
+
+EPISODE_PAGE = """<!DOCTYPE html>
+<html><head><title>%(slug)s</title></head>
+<body><div class="player" data-id="%(slug)s"></div>
+<script>
+  window.__PLAYER__ = {id: "%(slug)s", streams_hls: [{quality: "auto", url: "https://rtd-vod.rttv.com/vod/%(slug)s/playlist.m3u8"}]};
+</script>
+</body></html>
+"""
+
+MASTER_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+360p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1800000,RESOLUTION=1280x720
+720p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=4500000,RESOLUTION=1920x1080
+1080p/index.m3u8
+"""
+
+MEDIA_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:%(sequence)d
+#EXTINF:6.0,
+segment%(sequence)d.ts
+#EXTINF:6.0,
+segment%(next)d.ts
+"""
+
+# Bytes written per socket send when the bandwidth is limited
+SEND_CHUNK = 4096
+
+_EPISODE_PATH = re.compile(r'^/serials/[^/]+/episodes/([^/?#]+)')
+_SERIES_PATH = re.compile(r'^/serials/[^/?#]+/?$')
+
+def _read_page(name):
+    with open(os.path.join(PAGES_DIR, name), 'rb') as f:
+        return f.read()
+
+class Conditions(object):
+    """Network conditions of a MockServer, changeable while it runs.
+
+    latency is in seconds, bandwidth in bytes per second (0 for no limit).
+    failures maps a host to the status it always answers with, 0 meaning
+    the connection is closed without an answer; fail_rate is the share of
+    the remaining requests answered with 503.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, gzip=True, fail_rate=0.0, failures=None, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.gzip = gzip
+        self.fail_rate = fail_rate
+        self.failures = dict(failures or {})
+        self.random = random.Random(seed)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'nextgenrt-mock/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        conditions = self.server.conditions
+        host = (self.headers.get('Host') or '').split(':')[0].lower()
+        self.server.count(host, self.path)
+        if conditions.latency:
+            time.sleep(conditions.latency)
+
+        status = conditions.failures.get(host)
+        if status is None and conditions.fail_rate and conditions.random.random() < conditions.fail_rate:
+            status = 503
+        if status == 0:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if status is not None:
+            self._send(status, b'Injected failure\n', 'text/plain', send_body)
+            return
+
+        location = self.server.redirects.get((host, self.path))
+        if location is not None:
+            self.send_response(302)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        content = self.server.content(host, self.path)
+        if content is None:
+            self._send(404, b'Not found\n', 'text/plain', send_body)
+            return
+        body, content_type = content
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', content_type, False, etag)
+            return
+        self._send(200, body, content_type, send_body, etag)
+
+    def _send(self, status, body, content_type, send_body, etag=None):
+        conditions = self.server.conditions
+        encoding = None
+        if body and conditions.gzip and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(body, 6)
+            encoding = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', email.utils.formatdate(self.server.started, usegmt=True))
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not send_body or not body:
+            return
+        if not conditions.bandwidth:
+            self.wfile.write(body)
+            return
+        for offset in range(0, len(body), SEND_CHUNK):
+            chunk = body[offset:offset + SEND_CHUNK]
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            time.sleep(len(chunk) / float(conditions.bandwidth))
+
+class MockServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering for every RT and rtdoc.tv host.
+
+    requests counts the requests received per host since the last reset().
+    redirects maps (host, path) to the Location a request for it is sent
+    on to with a 302.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, conditions=None, verbose=False):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+        self.conditions = conditions or Conditions()
+        self.verbose = verbose
+        self.started = time.time()
+        self.requests = {}
+        self.redirects = {}
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, host, path):
+        with self._lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+    def reset(self):
+        """Clear the request counters and return their previous values."""
+        with self._lock:
+            requests, self.requests = self.requests, {}
+        return requests
+
+    def _page(self, name):
+        if name not in self._pages:
+            self._pages[name] = _read_page(name)
+        return self._pages[name]
+
+    def content(self, host, path):
+        """Return (body, content type) for a request, or None for a 404."""
+        path = path.split('?', 1)[0]
+        name = CHANNEL_PAGES.get((host, path))
+        if name is not None:
+            return self._page(name), 'text/html; charset=utf-8'
+        if host == 'player.rt.rs' and path.startswith('/embed/'):
+            return EMBED_PAGE.encode('utf-8'), 'text/html; charset=utf-8'
+        if '.m3u8' in path:
+            if path.rsplit('/', 1)[-1].startswith('playlist.m3u8'):
+                return MASTER_PLAYLIST.encode('utf-8'), 'application/vnd.apple.mpegurl'
+            sequence = int(time.time() // 6)
+            playlist = MEDIA_PLAYLIST % {'sequence': sequence, 'next': sequence + 1}
+            return playlist.encode('utf-8'), 'application/vnd.apple.mpegurl'
+        if host == RTDOC_HOST:
+            if path.rstrip('/') == '/serials':
+                return self._page('rtdoc-serials.html'), 'text/html; charset=utf-8'
+            m = _EPISODE_PATH.match(path)
+            if m:
+                return (EPISODE_PAGE % {'slug': m.group(1)}).encode('utf-8'), 'text/html; charset=utf-8'
+            if _SERIES_PATH.match(path):
+                return self._page('rtdoc-series.html'), 'text/html; charset=utf-8'
+        return None
+
+    def start(self):
+        """Serve on a background thread and return self."""
+        self._thread = threading.Thread(target=self.serve_forever, name='nextgenrt-mock')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def add_condition_arguments(parser):
+    """Add the network condition options shared with bench_e2e.py."""
+    parser.add_argument('--latency', type=float, default=0.0, help='milliseconds before each response')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='KiB/s per response, 0 for no limit')
+    parser.add_argument('--no-gzip', action='store_true', help='send bodies uncompressed')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--fail', action='append', default=[], metavar='HOST[=STATUS]',
+                        help='answer every request to HOST with STATUS (default 503, 0 drops the connection)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random failures')
+
+def conditions_from_args(args):
+    failures = {}
+    for spec in args.fail:
+        host, _, status = spec.partition('=')
+        failures[host.lower()] = int(status) if status else 503
+    return Conditions(latency=args.latency / 1000.0, bandwidth=int(args.bandwidth * 1024),
+                      gzip=not args.no_gzip, fail_rate=args.fail_rate, failures=failures, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    add_condition_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(args.port, conditions_from_args(args), verbose=True)
+    print('Serving on http://127.0.0.1:%d/' % server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""Stand-in for Kodi's xbmc module, enough to run the plugins outside Kodi."""
+import itertools
+import time
+
+LOGDEBUG, LOGINFO, LOGWARNING, LOGERROR = 0, 1, 2, 3
+ISO_639_1 = 0
+
+LOG = []
+
+def log(msg, level=LOGDEBUG):
+    LOG.append((level, msg))
+
+def getCondVisibility(condition):
+    return False
+
+def getLanguage(format=None, region=False):
+    return 'en'
+
+def sleep(ms):
+    time.sleep(ms / 1000.0)
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        time.sleep(min(timeout, 0.01))
+        return False
+
+class Player(object):
+    """Reports a new file as playing every time it is asked."""
+    _files = itertools.count()
+
+    def isPlaying(self):
+        return True
+
+    def isPlayingVideo(self):
+        return True
+
+    def getPlayingFile(self):
+        return 'stub://playing/%d' % next(Player._files)
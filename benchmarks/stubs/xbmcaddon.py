@@ -0,0 +1,30 @@
+"""Stand-in for Kodi's xbmcaddon module.
+
+The profile directory comes from the STUB_PROFILE environment variable and
+settings from the SETTINGS dict.
+"""
+import os
+
+SETTINGS = {}
+
+class Addon(object):
+    def __init__(self, id=None):
+        pass
+
+    def getAddonInfo(self, key):
+        return {
+            'profile': os.environ.get('STUB_PROFILE', os.path.join(os.getcwd(), 'stub_profile')),
+            'id': 'stub', 'name': 'stub', 'version': '0.0.0', 'path': os.getcwd(),
+        }.get(key, '')
+
+    def getLocalizedString(self, string_id):
+        return 'String %d' % string_id
+
+    def getSetting(self, key):
+        return SETTINGS.get(key, '')
+
+    def getSettingBool(self, key):
+        return SETTINGS.get(key, 'false') == 'true'
+
+    def getSettingInt(self, key):
+        return int(SETTINGS.get(key) or 0)
@@ -0,0 +1,48 @@
+"""Stand-in for Kodi's xbmcgui module."""
+
+class _InfoTag(object):
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class ListItem(object):
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self.label = label
+        self.path = path
+        self.properties = {}
+
+    def getVideoInfoTag(self):
+        return _InfoTag()
+
+    def setInfo(self, type, info):
+        pass
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def setContentLookup(self, enable):
+        pass
+
+    def setMimeType(self, mimetype):
+        pass
+
+    def setArt(self, art):
+        pass
+
+class Window(object):
+    _properties = {}
+
+    def __init__(self, window_id=0):
+        pass
+
+    def getProperty(self, key):
+        return Window._properties.get(key, '')
+
+    def setProperty(self, key, value):
+        Window._properties[key] = value
+
+    def clearProperty(self, key):
+        Window._properties.pop(key, None)
+
+class Dialog(object):
+    def input(self, heading, defaultt='', type=0):
+        return ''
@@ -0,0 +1,32 @@
+"""Stand-in for Kodi's xbmcplugin module, recording what the plugin sends."""
+ITEMS = []
+RESOLVED = []
+ENDED = []
+
+SORT_METHOD_NONE = 0
+SORT_METHOD_LABEL = 1
+SORT_METHOD_EPISODE = 24
+SORT_METHOD_UNSORTED = 40
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    ITEMS.append((url, listitem, isFolder))
+    return True
+
+def addDirectoryItems(handle, items, totalItems=0):
+    ITEMS.extend(items)
+    return True
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    ENDED.append(handle)
+
+def setResolvedUrl(handle, succeeded, listitem):
+    RESOLVED.append((succeeded, listitem))
+
+def setContent(handle, content):
+    pass
+
+def addSortMethod(handle, sortMethod, labelMask=''):
+    pass
+
+def setPluginCategory(handle, category):
+    pass
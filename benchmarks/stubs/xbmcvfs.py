@@ -0,0 +1,4 @@
+"""Stand-in for Kodi's xbmcvfs module."""
+
+def translatePath(path):
+    return path
@@ -0,0 +1,290 @@
+"""Fetching in nextgenrt_core and the series response cache, against the mock server.
+
+Every host name resolves to the mock server, which picks the content by
+the Host header, so the URLs here are the addons' own with http:// and the
+default port.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import mockserver
+from conftest import load_plugin, read_page
+
+PAGE_URL = 'http://www.rt.com/on-air/'
+PLAYLIST_URL = 'http://rt-srb.rttv.com/live/rtsrb/playlist.m3u8'
+SERIALS_URL = 'http://en.rtdoc.tv/serials'
+SERIES_URL = 'http://en.rtdoc.tv/serials/1000-truth-history-war'
+
+@pytest.fixture(scope='module')
+def server():
+    server = mockserver.MockServer().start()
+    getaddrinfo = socket.getaddrinfo
+    socket.getaddrinfo = lambda host, _, *args, **kwargs: getaddrinfo('127.0.0.1', server.port, *args, **kwargs)
+    yield server
+    socket.getaddrinfo = getaddrinfo
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def clean_server(server):
+    server.conditions = mockserver.Conditions()
+    server.redirects.clear()
+    server.reset()
+
+@pytest.fixture(scope='module')
+def core():
+    httpcache, = load_plugin('plugin.video.nextgenrttvseries', 'httpcache')
+    from nextgenrt_core import aio, availability, httpclient, probe
+    return httpcache, aio, availability, httpclient, probe
+
+@pytest.fixture
+def client(core):
+    client = core[3].HttpClient(backoff=0)
+    yield client
+    client.close()
+
+def _page_bytes():
+    return read_page('rt-global').encode('utf-8')
+
+def test_http_client_decompresses_gzip(client):
+    with client.open(PAGE_URL) as response:
+        assert response.headers.get('Content-Encoding') == 'gzip'
+        body = response.read()
+    assert body == _page_bytes()
+    assert response.timing.bytes < response.timing.decoded == len(body)
+
+def test_http_client_caps_the_body(client):
+    with client.open(PAGE_URL) as response:
+        chunks = list(response.iter_content(chunk_size=1024, max_bytes=5000))
+    assert b''.join(chunks) == _page_bytes()[:5000]
+    assert max(len(chunk) for chunk in chunks) <= 1024
+    # The partly read response dropped its connection; the next request opens a new one
+    timings = []
+    client.on_timing = timings.append
+    assert client.get(PAGE_URL) == _page_bytes()
+    assert not timings[0].reused
+
+def test_http_client_follows_redirects(server, client):
+    server.redirects[('www.rt.com', '/live')] = '/on-air/'
+    server.redirects[('rt.com', '/live')] = 'http://www.rt.com/live'
+    assert client.get('http://rt.com/live') == _page_bytes()
+    assert server.reset() == {'rt.com': 1, 'www.rt.com': 2}
+
+def test_http_client_retries_server_errors(core, server, client):
+    httpclient = core[3]
+    server.conditions.failures['www.rt.com'] = 503
+    with pytest.raises(httpclient.HttpError) as raised:
+        client.get(PAGE_URL)
+    assert raised.value.status == 503
+    assert server.reset() == {'www.rt.com': client.retries + 1}
+    # A 404 is not retried
+    server.conditions.failures.clear()
+    with pytest.raises(httpclient.HttpError) as raised:
+        client.get('http://www.rt.com/missing')
+    assert raised.value.status == 404
+    assert server.reset() == {'www.rt.com': 1}
+
+def test_http_cache_revalidates_with_304(core, server, client, tmp_path):
+    httpcache = core[0]
+    cache = httpcache.HttpCache(str(tmp_path), client)
+    body = cache.get(SERIALS_URL)
+    assert body == read_page('rtdoc-serials').encode('utf-8')
+    # The mock server sends an ETag and no max-age, so every later use revalidates
+    reopened = httpcache.HttpCache(str(tmp_path), client)
+    assert reopened.get(SERIALS_URL) == body
+    assert reopened.stats == {'hits': 0, 'revalidated': 1, 'misses': 1}
+    assert server.reset() == {'en.rtdoc.tv': 2}
+
+def test_http_cache_evicts_least_recently_used(core, client, tmp_path):
+    httpcache = core[0]
+    cache = httpcache.HttpCache(str(tmp_path), client)
+    cache.get(SERIALS_URL)
+    size = cache._entries[SERIALS_URL][4]
+    cache.max_bytes = size + 1
+    cache.get(SERIES_URL)
+    index = json.loads((tmp_path / httpcache.INDEX_FILE).read_text())
+    assert list(index['entries']) == [SERIES_URL]
+    # A truncated body is served but not stored
+    cache.get(SERIALS_URL, max_bytes=100)
+    assert SERIALS_URL not in cache._entries
+
+def test_breaker_opens_and_half_opens(core, tmp_path):
+    availability = core[2]
+    state = availability.Availability(str(tmp_path / 'availability.json'))
+    host = 'www.rt.com'
+    for _ in range(availability.FAILURE_THRESHOLD - 1):
+        state.record_failure(PAGE_URL, now=0)
+    assert state.state(host, now=0) == availability.CLOSED
+    assert state.check(PAGE_URL, now=0) is None
+
+    state.record_failure(PAGE_URL, now=0)
+    assert state.state(host, now=1) == availability.OPEN
+    assert state.check(PAGE_URL, now=1) == 'host down'
+    assert state.unavailable(PAGE_URL, now=1) == 'host down'
+
+    # Once the open period is over, one caller is let through as the trial
+    later = availability.OPEN_SECONDS + 1
+    assert state.state(host, now=later) == availability.HALF_OPEN
+    assert state.check(PAGE_URL, now=later) is None
+    assert state.check(PAGE_URL, now=later + 1) == 'host down'
+    # A failed trial opens the circuit for twice as long
+    state.record_failure(PAGE_URL, now=later)
+    assert state.state(host, now=later + availability.OPEN_SECONDS + 1) == availability.OPEN
+    assert state.state(host, now=later + 2 * availability.OPEN_SECONDS + 1) == availability.HALF_OPEN
+
+    state.record_success(PAGE_URL)
+    assert state.state(host, now=later) == availability.CLOSED
+    state.save()
+    assert availability.Availability(state.path).state(host, now=later) == availability.CLOSED
+
+def test_prober_picks_a_healthy_stream_and_remembers_hosts(core, server, tmp_path):
+    probe = core[4]
+    memory = probe.HostMemory(str(tmp_path / 'probe_hosts.json'))
+    prober = probe.StreamProber(memory)
+    failing = 'http://down.example/live/playlist.m3u8'
+    server.conditions.failures['down.example'] = 503
+    # With no healthy candidate every probe is waited for
+    assert prober.choose([failing]) is None
+    assert memory.lookup('down.example') == (True, None)
+    # A host remembered as failed is not probed again
+    server.reset()
+    assert prober.choose(['ftp://elsewhere/stream', failing, PLAYLIST_URL]) == PLAYLIST_URL
+    assert server.reset() == {'rt-srb.rttv.com': 1}
+    known, latency = memory.lookup('rt-srb.rttv.com')
+    assert known and latency is not None
+    assert prober.known_healthy(PLAYLIST_URL) and not prober.known_healthy(failing)
+
+    # Remembered hosts are not probed again, also after a reload
+    server.reset()
+    again = probe.StreamProber(probe.HostMemory(memory.path))
+    assert again.choose([failing, PLAYLIST_URL]) == PLAYLIST_URL
+    assert again.choose([failing]) is None
+    assert server.reset() == {}
+
+def test_probe_rejects_a_page_that_is_not_a_playlist(core, tmp_path):
+    probe = core[4]
+    prober = probe.StreamProber(probe.HostMemory(str(tmp_path / 'probe_hosts.json')))
+    assert prober.probe('http://www.rt.com/on-air/?.m3u8') is None
+    assert prober.probe(PLAYLIST_URL) is not None
+
+def test_first_success_returns_the_first_truthy_result(core):
+    aio = core[1]
+    cancelled = []
+
+    async def answer(value, delay):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(value)
+            raise
+        return value
+
+    async def fail():
+        raise IOError('down')
+
+    runner = aio.loop_thread()
+    assert runner.run(aio.first_success([fail(), answer(None, 0), answer('slow', 5), answer('fast', 0.01)])) == 'fast'
+    # The loser sees its cancellation on the loop's next pass
+    runner.run(asyncio.sleep(0))
+    assert cancelled == ['slow']
+    assert runner.run(aio.first_success([fail(), answer('', 0)])) is None
+
+def test_crawl_yields_errors_and_cancels_on_close(core):
+    aio = core[1]
+    started = []
+
+    def fetch(url):
+        started.append(url)
+        if url == 'http://a/fail':
+            raise IOError('down')
+        time.sleep(0.05)
+        return url.upper()
+
+    results = sorted(aio.crawl(['http://a/1', 'http://a/fail', 'http://b/2'], fetch))
+    assert [(url, body, type(error)) for url, body, error in results] == [
+        ('http://a/1', 'HTTP://A/1', type(None)), ('http://a/fail', None, IOError), ('http://b/2', 'HTTP://B/2', type(None))]
+
+    # One at a time: closing after the first result leaves the rest unstarted
+    del started[:]
+    urls = ['http://a/%d' % n for n in range(6)]
+    pages = aio.crawl(urls, fetch, per_host=1, max_workers=1)
+    next(pages)
+    pages.close()
+    time.sleep(0.2)
+    assert len(started) <= 2
+
+def test_crawl_stops_waiting_on_abort(core):
+    aio = core[1]
+    release = threading.Event()
+    aborted = threading.Event()
+
+    class Monitor(object):
+        def abortRequested(self):
+            return aborted.is_set()
+
+    def fetch(url):
+        if url.endswith('hang'):
+            release.wait(5)
+        return url
+
+    threading.Timer(0.1, aborted.set).start()
+    start = time.time()
+    try:
+        assert [url for url, _, _ in aio.crawl(['http://a/ok', 'http://a/hang'], fetch, monitor=Monitor())] == ['http://a/ok']
+        assert time.time() - start < aio.CRAWL_POLL * 3
+    finally:
+        release.set()
+
+EMBED_URL = 'http://player.rt.rs/embed/live'
+
+class _EmbedOnly(object):
+    """An extractor that finds nothing on a page but the mock server's embedded player."""
+    name = 'embed'
+
+    def candidates(self, page):
+        from nextgenrt_core import extract
+        return [extract.Candidate('iframe', 0, 0, EMBED_URL)]
+
+def _page_resolver(core, client, tmp_path):
+    """A Resolver over the mock server whose pages hold only the embedded player."""
+    from nextgenrt_core import resolver
+    availability, probe = core[2], core[4]
+    page_resolver = resolver.Resolver('test', lambda page_url: _EmbedOnly())
+    page_resolver._http_client = client
+    page_resolver._availability = availability.Availability(str(tmp_path / 'availability.json'))
+    page_resolver._stream_prober = probe.StreamProber(probe.HostMemory(str(tmp_path / 'probe_hosts.json')))
+    page_resolver.page_candidates = lambda page_url, extractor: extractor.candidates(None)
+    return page_resolver
+
+def test_iframe_failure_counts_against_the_host(core, server, client, tmp_path):
+    availability, httpclient = core[2], core[3]
+    from nextgenrt_core import extract
+    page_resolver = _page_resolver(core, client, tmp_path)
+    assert page_resolver.follow_iframe(EMBED_URL) == 'https://rt-srb.rttv.com/live/rtsrb/playlist.m3u8'
+
+    server.conditions.failures['player.rt.rs'] = 503
+    with pytest.raises(httpclient.HttpError):
+        page_resolver.follow_iframe(EMBED_URL)
+    # A direct candidate is still the fallback
+    direct = extract.Candidate('m3u8', 0, 0, 'http://down.example/live.m3u8')
+    server.conditions.failures['down.example'] = 503
+    assert page_resolver.choose_stream([direct] + _EmbedOnly().candidates(None)) == direct.url
+
+    # Without one the page is not remembered as holding no stream; the failures open the circuit
+    for _ in range(availability.FAILURE_THRESHOLD):
+        assert page_resolver.get_stream_url(PAGE_URL) is None
+    assert page_resolver.availability().unavailable(PAGE_URL) == 'host down'
+
+def test_async_iframe_failure_counts_against_the_host(core, server, client, tmp_path, monkeypatch):
+    import xbmcaddon
+    availability = core[2]
+    monkeypatch.setitem(xbmcaddon.SETTINGS, 'async_resolver', 'true')
+    page_resolver = _page_resolver(core, client, tmp_path)
+    server.conditions.failures['player.rt.rs'] = 503
+    for _ in range(availability.FAILURE_THRESHOLD):
+        assert page_resolver.get_stream_url(PAGE_URL) is None
+    assert page_resolver.availability().unavailable(PAGE_URL) == 'host down'
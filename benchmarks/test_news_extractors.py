@@ -0,0 +1,72 @@
+"""Stream URL extraction of plugin.video.nextgenrt over the channel page corpus."""
+import pytest
+
+from bench_extract import legacy_extract
+from conftest import load_plugin, read_page
+
+CHANNELS = ['rt-global', 'rt-america', 'rtd', 'actualidad', 'arabic', 'de', 'francais', 'rt-rs']
+
+@pytest.fixture(scope='module')
+def news():
+    main, = load_plugin('plugin.video.nextgenrt', 'main')
+    from nextgenrt_core import extract
+    return extract, main
+
+def _extractor(extract, channel):
+    """The extractor get_stream_url uses for a channel page."""
+    return extract.RTD_PAGE if channel == 'rtd' else extract.STANDARD
+
+def test_every_channel_has_a_page(news):
+    _, main = news
+    assert len(CHANNELS) == len(main.channels.RT_STREAMS)
+
+@pytest.mark.parametrize('channel', CHANNELS)
+def test_best_candidate(news, expected, channel):
+    extract, _ = news
+    candidate = _extractor(extract, channel).best(read_page(channel))
+    assert candidate is not None
+    assert {'rule': candidate.rule, 'url': candidate.url} == expected['channels'][channel]
+
+@pytest.mark.parametrize('channel', CHANNELS)
+def test_streaming_scan_matches_whole_page(news, channel):
+    extract, _ = news
+    html = read_page(channel)
+    extractor = _extractor(extract, channel)
+    chunks = [html[i:i + 4096] for i in range(0, len(html), 4096)]
+    assert extract.scan_chunks(extractor, chunks) == extractor.best(html)
+
+@pytest.mark.parametrize('channel', CHANNELS)
+def test_bytes_scan_matches_text(news, channel):
+    extract, _ = news
+    html = read_page(channel)
+    extractor = _extractor(extract, channel)
+    page = html.encode('utf-8')
+    assert [c.url for c in extractor.candidates(memoryview(page))] == [c.url for c in extractor.candidates(html)]
+    chunks = [page[i:i + 4096] for i in range(0, len(page), 4096)]
+    assert extract.scan_chunks(extractor, chunks).url == extractor.best(html).url
+
+@pytest.mark.parametrize('channel', [c for c in CHANNELS if c != 'rtd'])
+def test_engine_matches_legacy_chain(news, channel):
+    extract, _ = news
+    html = read_page(channel)
+    candidate = extract.STANDARD.best(html)
+    assert legacy_extract(html) == (candidate.rule, candidate.url)
+
+def test_first_m3u8(news, expected):
+    extract, _ = news
+    assert extract.STANDARD.first(read_page('rt-global'), 'm3u8').url == expected['channels']['rt-global']['url']
+    assert extract.STANDARD.first(read_page('rt-america'), 'm3u8') is None
+
+def test_rtd_page_only_matches_rtd(news):
+    extract, _ = news
+    assert extract.RTD_PAGE.best(read_page('rt-global')) is None
+
+@pytest.mark.parametrize('channel', CHANNELS)
+def test_bench_best_candidate(news, measure, channel):
+    extract, _ = news
+    html = read_page(channel)
+    assert measure('news/best/' + channel, _extractor(extract, channel).best, html) is not None
+
+def test_bench_first_m3u8(news, measure):
+    extract, _ = news
+    measure('news/first_m3u8/rt-global', extract.STANDARD.first, read_page('rt-global'), 'm3u8')
@@ -0,0 +1,153 @@
+"""Stream caching, prefetching and variant selection behind plugin.video.nextgenrt's play route."""
+import json
+import threading
+import time
+
+import pytest
+
+import mockserver
+from conftest import load_plugin
+
+@pytest.fixture(scope='module')
+def news():
+    prefetch, warm = load_plugin('plugin.video.nextgenrt', 'prefetch', 'warm')
+    from nextgenrt_core import cache, hls
+    return cache, hls, prefetch, warm
+
+def test_stream_cache_evicts_least_recently_used(news, tmp_path):
+    cache = news[0]
+    stream_cache = cache.StreamCache(str(tmp_path / 'stream_cache.json'), max_entries=2)
+    stream_cache.put('page/a', 'stream/a', now=0)
+    stream_cache.put('page/b', 'stream/b', now=0)
+    assert stream_cache.get('page/a', now=1) == 'stream/a'
+    stream_cache.put('page/c', 'stream/c', now=1)
+    assert stream_cache.get('page/b', now=1) is None
+    stream_cache.save()
+    reloaded = cache.StreamCache(stream_cache.path, max_entries=2)
+    assert list(reloaded._entries) == ['page/a', 'page/c']
+    # An expired entry is dropped when it is looked up
+    assert reloaded.get('page/a', now=10 ** 10) is None
+
+def test_stream_cache_merges_on_save(news, tmp_path):
+    cache = news[0]
+    path = str(tmp_path / 'stream_cache.json')
+    first, second = cache.StreamCache(path), cache.StreamCache(path)
+    first.put('page/a', 'stream/a')
+    first.set_variant('page/a', 'stream/a', 'high', 'stream/a/1080p', {'key': 'value'})
+    second.put('page/b', 'stream/b')
+    first.save()
+    second.save()
+    merged = cache.StreamCache(path)
+    assert (merged.get('page/a'), merged.get('page/b')) == ('stream/a', 'stream/b')
+    assert merged.variant('page/a', 'stream/a', 'high') == ('stream/a/1080p', {'key': 'value'})
+    # A variant picked for another quality or stream URL does not count
+    assert merged.variant('page/a', 'stream/a', 'low') is None
+    assert merged.variant('page/a', 'stream/other', 'high') is None
+
+    # An entry dropped in one instance stays dropped when another saves
+    second.invalidate('page/a')
+    second.save()
+    first.put('page/c', 'stream/c')
+    first.save()
+    merged = cache.StreamCache(path)
+    assert [merged.get(page) for page in ('page/a', 'page/b', 'page/c')] == [None, 'stream/b', 'stream/c']
+
+def test_wait_for_returns_the_prefetched_stream(news):
+    cache, _, prefetch, _ = news
+    page_url = 'https://www.rt.com/prefetch/%f' % time.time()
+    # Nothing in flight: no waiting
+    assert prefetch.wait_for(page_url) is None
+
+    started = threading.Event()
+
+    def resolver(url):
+        started.set()
+        time.sleep(0.2)
+        return url + '/playlist.m3u8'
+
+    prefetcher = prefetch.Prefetcher([page_url], resolver, cache.StreamCache.open()).start()
+    started.wait(1)
+    begin = time.time()
+    assert prefetch.wait_for(page_url) == page_url + '/playlist.m3u8'
+    assert time.time() - begin < prefetch.PREFETCH_DEADLINE
+    prefetcher.join()
+
+def test_wait_for_gives_up_at_the_deadline(news):
+    cache, _, prefetch, _ = news
+    page_url = 'https://www.rt.com/stalled/%f' % time.time()
+    release = threading.Event()
+    prefetcher = prefetch.Prefetcher([page_url], lambda url: release.wait(2) and None,
+                                     cache.StreamCache.open(), deadline=0.3).start()
+    begin = time.time()
+    try:
+        assert prefetch.wait_for(page_url) is None
+        assert 0.2 < time.time() - begin < 1.5
+    finally:
+        release.set()
+        prefetcher.join()
+
+MASTER_WITH_AUDIO = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac",NAME="English",URI="audio/en.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720,CODECS="avc1.4d401f,mp4a.40.2",AUDIO="aac"
+https://cdn.example/720p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=500000,RESOLUTION=640x360,AUDIO="aac"
+360p.m3u8
+"""
+
+def test_parse_master_playlist(news):
+    hls = news[1]
+    variants = hls.parse_master(mockserver.MASTER_PLAYLIST, 'https://rt.example/live/playlist.m3u8')
+    assert [(v.bandwidth, v.width, v.height) for v in variants] == [
+        (800000, 640, 360), (1800000, 1280, 720), (4500000, 1920, 1080)]
+    assert variants[0].url == 'https://rt.example/live/360p/index.m3u8'
+    assert all(v.audio is None for v in variants)
+
+    variants = hls.parse_master(MASTER_WITH_AUDIO, 'https://rt.example/live/playlist.m3u8')
+    assert [v.url for v in variants] == ['https://rt.example/live/360p.m3u8', 'https://cdn.example/720p.m3u8']
+    assert set(v.audio for v in variants) == {'aac'}
+    # A media playlist has no variants
+    assert hls.parse_master(mockserver.MEDIA_PLAYLIST % {'sequence': 1, 'next': 2}, 'https://rt.example/') == []
+
+def test_select_variant_by_quality(news):
+    hls = news[1]
+    variants = hls.parse_master(mockserver.MASTER_PLAYLIST, 'https://rt.example/live/playlist.m3u8')
+    assert [hls.select(variants, quality).height for quality in hls.QUALITIES] == [360, 720, 1080]
+    assert hls.select(variants[:2], 'medium').height == 360
+    assert hls.select([], 'high') is None
+
+def test_playlist_cache_skips_malformed_entries(news, tmp_path):
+    hls = news[1]
+    path = tmp_path / 'hls_cache.json'
+    later = time.time() + 60
+    path.write_text(json.dumps({
+        'empty': [], 'text': ['soon', []], 'short': [later], 'rows': [later, [[1, 2]]],
+        'good': [later, [[800000, 640, 360, 'https://rt.example/360p.m3u8', None]]],
+        'expired': [0, []]}))
+    cache = hls.PlaylistCache(str(path))
+    assert list(cache._entries) == ['good']
+    assert cache.variants('good', None)[0].height == 360
+    # A file that is not a table at all is ignored
+    path.write_text('[1, 2]')
+    assert hls.PlaylistCache(str(path))._entries == {}
+
+def test_warm_table_trusts_entries_until_they_expire(news, tmp_path):
+    warm = news[3]
+    table = warm.WarmTable(str(tmp_path / 'warm_channels.json'))
+    table.record('page/a', 'stream/a', 0.25, ttl=60, now=100)
+    assert table.stream_url('page/a', now=159) == 'stream/a'
+    assert table.stream_url('page/a', now=160) is None
+    # A failed check stops the trust at once but keeps when it was last ok
+    table.record_failure('page/a', now=120)
+    assert table.stream_url('page/a', now=121) is None
+    assert table.entry('page/a') == ('stream/a', 0.25, 100, 120)
+    table.save()
+    assert warm.WarmTable(table.path).entry('page/a') == ('stream/a', 0.25, 100, 120)
+    assert warm.WarmTable(table.path).stream_url('page/unknown') is None
+
+def test_warm_table_ignores_a_malformed_file(news, tmp_path):
+    warm = news[3]
+    path = tmp_path / 'warm_channels.json'
+    path.write_text('["not", "a", "table"]')
+    assert warm.WarmTable(str(path)).stream_url('page/a') is None
+    path.write_text('{"page/a": "stream/a"}')
+    assert warm.WarmTable(str(path)).stream_url('page/a') is None
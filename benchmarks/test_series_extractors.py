@@ -0,0 +1,149 @@
+"""Catalog parsing of plugin.video.nextgenrttvseries over the rtdoc page corpus."""
+import random
+import re
+
+import pytest
+
+from conftest import load_plugin, read_page
+
+@pytest.fixture(scope='module')
+def scraper():
+    scraper, = load_plugin('plugin.video.nextgenrttvseries', 'scraper')
+    return scraper
+
+def test_series_list(scraper, expected):
+    series = scraper.extract_series_list(read_page('rtdoc-serials'))
+    assert len(series) == expected['serials']['count']
+    assert list(series[0]) == expected['serials']['first']
+    assert list(series[-1]) == expected['serials']['last']
+    assert len(set(s.url for s in series)) == len(series)
+    assert all(s.url.startswith('https://en.rtdoc.tv/serials/') for s in series)
+
+def test_series_list_skips_navigation(scraper):
+    titles = set(s.title.lower() for s in scraper.extract_series_list(read_page('rtdoc-serials')))
+    assert not titles & scraper.NAVIGATION_TITLES
+
+def _legacy_series_list(html):
+    """The three-pass extraction the single scan replaced, as the reference."""
+    patterns = [
+        r'<a\s+href="(https://en\.rtdoc\.tv/serials/[^"]+)"\s*>([^<]+)</a>',
+        r'href=["\']([^"\']*serials[^"\']+)["\'][^>]*>([^<]+)<',
+        r'(https://en\.rtdoc\.tv/serials/[^\s"\'<>]+)[^>]*>([^<]+)</a>',
+    ]
+    series = []
+    seen = set()
+    for pattern in patterns:
+        for url, title in re.findall(pattern, html, re.IGNORECASE):
+            if not url.startswith('http'):
+                url = 'https://en.rtdoc.tv' + url if url.startswith('/') else 'https://en.rtdoc.tv/' + url
+            title = title.strip()
+            if len(title) <= 3 or title.lower() in ('films', 'tv series', 'on air', 'live', 'collections', 'profile'):
+                continue
+            if url not in seen:
+                seen.add(url)
+                series.append((title, url))
+    return series
+
+_LINK_PIECES = [
+    '<a href="', '<A HREF="', '<a  href=\'', 'href="', "href='", ' data-href="', '">', "'>", '>', '<', '</a>', '</A>',
+    'https://en.rtdoc.tv/serials/', 'HTTPS://EN.RTDOC.TV/SERIALS/', '/serials/', 'serials', '"', "'", ' ', '\n',
+    'İstanbul', 'ſerials', 'Ruins of the Empire', 'Live', 'abc', '12-x', '-',
+]
+
+def test_series_list_matches_legacy(scraper, monkeypatch):
+    import xbmc
+    # Thousands of log lines would stay in the stub log and skew later peak allocations
+    monkeypatch.setattr(xbmc, 'LOG', [])
+    cases = [
+        read_page('rtdoc-serials'),
+        # Non-ASCII letters that case-fold to ASCII, around every link form
+        '<a href="https://en.rtdoc.tv/serials/1-İ">İstanbul stories</a>'
+        '<a class="x" href="/serials/2-k">K\u212aelvin years</a>'
+        '<div data-url="https://en.rtdoc.tv/serials/3-s" title="ſ">The ſerials</a>',
+        # One form\'s match holding the start of another\'s
+        '<a href="/serials/1-a" data-href="/serials/2-b">First title</a>'
+        '<a data-u="https://en.rtdoc.tv/serials/3-c" href="https://en.rtdoc.tv/serials/4-d">Second title</a>'
+        '<a href="https://en.rtdoc.tv/serials/5-e">Third title</a><a href="https://en.rtdoc.tv/serials/5-e" >Again</a>',
+    ]
+    rng = random.Random(1)
+    cases.extend(''.join(rng.choice(_LINK_PIECES) for _ in range(60)) for _ in range(2000))
+    for html in cases:
+        assert [tuple(s) for s in scraper.extract_series_list(html)] == _legacy_series_list(html), html
+
+def test_episodes_list(scraper, expected):
+    episodes = scraper.extract_episodes_list(read_page('rtdoc-series'))
+    want = expected['series']
+    assert len(episodes) == want['count']
+    seasons = {}
+    for episode in episodes:
+        seasons[str(episode['season'])] = seasons.get(str(episode['season']), 0) + 1
+    assert seasons == want['seasons']
+    assert sum(1 for e in episodes if e['episode'] is None) == want['unnumbered']
+    first = episodes[0]
+    assert [first['season'], first['episode'], first['title'], first['url']] == want['first']
+
+def test_episodes_region_holds_every_episode(scraper):
+    html = read_page('rtdoc-series')
+    region = scraper.episodes_region(html)
+    assert len(region) < len(html)
+    assert scraper.parse_episodes(region) == scraper.parse_episodes(html)
+    # Scripts and the footer are outside the fingerprinted region
+    noisy = html.replace('<head>', '<head><script>var token = "x";</script>', 1) + '<footer>y</footer>'
+    assert scraper.episodes_region(noisy) == region
+    # Undecoded pages give the same region, so they keep their fingerprint
+    assert scraper.episodes_region(html.encode('utf-8')) == region.encode('utf-8')
+
+def test_episode_titles_belong_to_their_links(scraper):
+    for season, number, title, url in scraper.parse_episodes(read_page('rtdoc-series')):
+        if number is not None:
+            # Corpus URLs are .../episodes/<season>-<episode>-<slug>
+            assert url.rsplit('/', 1)[1].split('-')[:2] == [str(season), str(number)]
+
+@pytest.fixture
+def catalog_index(scraper, tmp_path):
+    """A search index of the catalog page and one series page, stored under tmp_path."""
+    search_index, = load_plugin('plugin.video.nextgenrttvseries', 'search_index')
+    index = search_index.SearchIndex(str(tmp_path / 'search_index.json'))
+    series = scraper.extract_series_list(read_page('rtdoc-serials'))
+    index.index_series_list(series)
+    index.index_episodes(series[0].url, scraper.extract_episodes_list(read_page('rtdoc-series')))
+    return search_index, index, series
+
+def test_search_index_prefix_queries(scraper, catalog_index):
+    search_index, index, series = catalog_index
+    episodes = scraper.extract_episodes_list(read_page('rtdoc-series'))
+    query = ' '.join(word[:3] for word in search_index.tokens(episodes[1]['title'])[-2:])
+    assert episodes[1]['url'] in [result[2] for result in index.search(query)]
+    assert series[1].url in [result[2] for result in index.search(series[1].title)]
+    # Re-indexing a page replaces what it contributed, also after a reload
+    index.index_episodes(series[0].url, episodes[2:])
+    index.save()
+    reloaded = search_index.SearchIndex(index.path)
+    assert episodes[1]['url'] not in [result[2] for result in reloaded.search(query)]
+    assert reloaded.search(series[1].title) == index.search(series[1].title)
+
+def test_search_index_save_keeps_other_writers_pages(scraper, catalog_index):
+    search_index, index, series = catalog_index
+    index.save()
+    episodes = scraper.extract_episodes_list(read_page('rtdoc-series'))
+    # The plugin and the sync service each index a page of their own
+    plugin = search_index.SearchIndex(index.path)
+    service = search_index.SearchIndex(index.path)
+    plugin.index_episodes(series[0].url, episodes[:1])
+    service.index_episodes(series[1].url, episodes[1:2])
+    plugin.save()
+    service.save()
+    reloaded = search_index.SearchIndex(index.path)
+    assert episodes[0]['url'] in [result[2] for result in reloaded.search(episodes[0]['title'])]
+    assert episodes[1]['url'] in [result[2] for result in reloaded.search(episodes[1]['title'])]
+    assert episodes[2]['url'] not in [result[2] for result in reloaded.search(episodes[2]['title'])]
+
+def test_bench_search_index(catalog_index, measure):
+    _, index, _ = catalog_index
+    assert measure('series/search_index/prefix', index.search, 'sov wa')
+
+def test_bench_series_list(scraper, measure):
+    assert measure('series/extract_series_list', scraper.extract_series_list, read_page('rtdoc-serials'))
+
+def test_bench_episodes_list(scraper, measure):
+    assert measure('series/extract_episodes_list', scraper.extract_episodes_list, read_page('rtdoc-series'))
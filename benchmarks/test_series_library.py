@@ -0,0 +1,205 @@
+"""Library, sync and listings of plugin.video.nextgenrttvseries against pages served from the corpus."""
+import pytest
+
+from conftest import load_plugin, read_page
+
+NEW_SERIES = 'https://en.rtdoc.tv/serials/9999-a-new-series'
+# An episode of the corpus series page
+ISLAND_PEOPLE = 'https://en.rtdoc.tv/serials/1007-frontier-ice/episodes/3-8-island-people'
+LATEST_EPISODE = 'https://en.rtdoc.tv/serials/1000-truth-history-war/episodes/1-1-secret-road'
+
+@pytest.fixture
+def series_plugin():
+    library, scraper, sync = load_plugin('plugin.video.nextgenrttvseries', 'library', 'scraper', 'sync')
+    return library, scraper, sync
+
+def _without_episode(html, slug):
+    """The series page with the list entry of one episode left out."""
+    return '\n'.join(line for line in html.splitlines() if '/episodes/%s"' % slug not in line)
+
+@pytest.fixture
+def db(series_plugin, tmp_path):
+    library = series_plugin[0].Library(str(tmp_path / 'library.db'))
+    yield library
+    library.close()
+
+class Catalog(object):
+    """Serves the serials page and one series page for every series URL, counting fetches."""
+
+    def __init__(self, scraper):
+        self.serials_url = scraper.SERIALS_URL
+        # A catalog that features its latest episode, as the live one may
+        self.serials = read_page('rtdoc-serials').replace(
+            '<body class="page">', '<body class="page"><a href="%s">Latest episode</a>' % LATEST_EPISODE, 1)
+        self.series = read_page('rtdoc-series')
+        # Series URL -> a page of its own instead of self.series
+        self.pages = {}
+        self.fetched = []
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        if url == self.serials_url:
+            return self.serials.encode('utf-8')
+        return self.pages.get(url, self.series).encode('utf-8')
+
+def test_diff_episodes():
+    episode_index, = load_plugin('plugin.video.nextgenrttvseries', 'episode_index')
+    old = [{'url': 'e/1', 'title': 'One'}, {'url': 'e/2', 'title': 'Two'}]
+    new = [{'url': 'e/2', 'title': 'Two, renamed'}, {'url': 'e/3', 'title': 'Three'}]
+    assert episode_index.diff_episodes(old, new) == ([new[1]], [old[0]])
+    assert episode_index.diff_episodes(old, old) == ([], [])
+
+def test_episode_index_keys_episodes_by_page_hash(tmp_path):
+    episode_index, scraper = load_plugin('plugin.video.nextgenrttvseries', 'episode_index', 'scraper')
+    index = episode_index.EpisodeIndex(str(tmp_path))
+    html = read_page('rtdoc-series')
+    page_hash = episode_index.content_hash(html)
+    # Scripts and tokens outside the episode list do not change the fingerprint
+    assert episode_index.content_hash(html.replace('</body>', '<script>token=1</script></body>')) == page_hash
+    assert episode_index.content_hash(html.encode('utf-8')) == page_hash
+    episodes = scraper.extract_episodes_list(html)
+    series_url = 'https://en.rtdoc.tv/serials/1000-truth-history-war'
+    assert index.episodes(series_url) is None
+    assert index.store(series_url, page_hash, episodes) == ([], [])
+    assert index.episodes(series_url, page_hash) == episodes
+    assert index.episodes(series_url, 'another page') is None
+    assert index.season(series_url, 3) == [e for e in episodes if e['season'] == 3]
+    assert index.season(series_url, 3, page_hash) == index.season(series_url, 3)
+    assert index.season(series_url, 3, 'another page') is None
+    assert index.season(series_url, 99) == []
+
+    changed = _without_episode(html, '3-8-island-people')
+    changed_episodes = scraper.extract_episodes_list(changed)
+    added, removed = index.store(series_url, episode_index.content_hash(changed), changed_episodes)
+    assert added == [] and [e['url'] for e in removed] == [ISLAND_PEOPLE]
+
+def test_episode_index_keeps_page_order(tmp_path, monkeypatch):
+    episode_index, = load_plugin('plugin.video.nextgenrttvseries', 'episode_index')
+    index = episode_index.EpisodeIndex(str(tmp_path))
+    # A page may list a special of another season between episodes
+    episodes = [{'title': 'Title %d' % n, 'url': 'e/%d' % n, 'season': season, 'episode': n}
+                for n, season in enumerate([2, 1, 2], 1)]
+    index.store('s', 'hash', episodes)
+    assert index.episodes('s') == episodes
+    assert [e['url'] for e in index.season('s', 2)] == ['e/1', 'e/3']
+
+    # An index written by another parser version counts as missing
+    monkeypatch.setattr(episode_index, 'PARSER_VERSION', episode_index.PARSER_VERSION + 1)
+    assert index.episodes('s') is None and index.season('s', 2) is None
+
+def test_sync_records_new_episodes(series_plugin, db):
+    _, scraper, sync = series_plugin
+    catalog = Catalog(scraper)
+    catalog.series = _without_episode(catalog.series, '3-8-island-people')
+    assert sync.sync(db, catalog.fetch, workers=2) == len(db.series())
+    # The first sync of a series finds nothing new
+    assert db.new_episode_count() == 0
+    assert db.get_meta(sync.LAST_SYNC_KEY) is not None
+
+    # Nothing changed: only the pages are fetched, none is parsed again
+    del catalog.fetched[:]
+    assert sync.sync(db, catalog.fetch, workers=2) == 0
+    assert len(catalog.fetched) == len(db.series()) + 1
+
+    series = db.series()[0]
+    catalog.pages[series.url] = read_page('rtdoc-series')
+    assert sync.sync(db, catalog.fetch, workers=2) == 1
+    new_episodes = db.new_episodes()
+    assert [(title, episode['url']) for title, episode in new_episodes] == [(series.title, ISLAND_PEOPLE)]
+    assert len(db.episodes(series.url)) == len(db.episodes(db.series()[1].url)) + 1
+    assert ISLAND_PEOPLE in [episode['url'] for episode in db.episodes(series.url, season=3)]
+
+def test_sync_keeps_the_library_when_the_catalog_is_empty(series_plugin, db):
+    _, scraper, sync = series_plugin
+    catalog = Catalog(scraper)
+    sync.sync(db, catalog.fetch, workers=2)
+    listed = db.series()
+    catalog.serials = '<html><body>Maintenance</body></html>'
+    assert sync.sync(db, catalog.fetch, workers=2) == 0
+    assert db.series() == listed
+
+def test_sync_is_not_stamped_when_series_pages_fail(series_plugin, db):
+    _, scraper, sync = series_plugin
+    catalog = Catalog(scraper)
+
+    def fetch(url):
+        if url != catalog.serials_url:
+            raise IOError('503 Service Unavailable')
+        return catalog.fetch(url)
+
+    assert sync.sync(db, fetch, workers=2) == 0
+    assert db.series() and db.get_meta(sync.LAST_SYNC_KEY) is None
+    # The next sync that reaches every page stamps it
+    assert sync.sync(db, catalog.fetch, workers=2) == len(db.series())
+    assert db.get_meta(sync.LAST_SYNC_KEY) is not None
+
+def test_sync_picks_up_a_change_to_the_series_list_only(series_plugin, db):
+    _, scraper, sync = series_plugin
+    catalog = Catalog(scraper)
+    sync.sync(db, catalog.fetch, workers=2)
+    listed = [series.url for series in db.series()]
+    assert listed and NEW_SERIES not in listed
+
+    # Nothing but the list of series links changes
+    catalog.serials = catalog.serials.replace(
+        '</body>', '<a href="%s">A New Series</a></body>' % NEW_SERIES, 1)
+    assert sync.sync(db, catalog.fetch, workers=2) == 1
+    assert set(series.url for series in db.series()) == set(listed + [NEW_SERIES])
+
+@pytest.fixture
+def listing_plugin(monkeypatch):
+    import xbmcaddon
+    import xbmcplugin
+    main, = load_plugin('plugin.video.nextgenrttvseries', 'main')
+    from nextgenrt_core import directory
+    monkeypatch.setattr(xbmcplugin, 'ITEMS', [])
+    monkeypatch.setattr(xbmcplugin, 'ENDED', [])
+    monkeypatch.setitem(xbmcaddon.SETTINGS, 'episodes_per_page', '2')
+    return main, directory, xbmcaddon, xbmcplugin
+
+def _listed(main, episodes, page):
+    listing = main._episode_listing()
+    main._add_episode_page(listing, episodes, page, 'plugin://series/?action=episodes&url=x')
+    return [(url, item.label, folder) for url, item, folder in listing.items]
+
+def test_episode_pages(listing_plugin):
+    main, _, xbmcaddon, _ = listing_plugin
+    episodes = [{'title': 'Title %d' % n, 'url': 'e/%d' % n, 'season': 1, 'episode': n if n != 3 else None}
+                for n in range(1, 6)]
+    first = _listed(main, episodes, 1)
+    assert [label for _, label, _ in first[:2]] == ['S1E1 - Title 1', 'S1E2 - Title 2']
+    assert first[2][0].endswith('&page=2') and first[2][1].endswith('(2/3)') and first[2][2]
+    # Episodes without a number are numbered by position
+    assert [label for _, label, _ in _listed(main, episodes, 2)][:2] == ['S1E3 - Title 3', 'S1E4 - Title 4']
+    assert [label for _, label, _ in _listed(main, episodes, 3)] == ['S1E5 - Title 5']
+
+    xbmcaddon.SETTINGS['episodes_per_page'] = '0'
+    assert len(_listed(main, episodes, 1)) == 5
+    xbmcaddon.SETTINGS['episodes_per_page'] = 'many'
+    assert len(_listed(main, episodes, 1)) == 5
+
+def test_page_parameter(listing_plugin):
+    main = listing_plugin[0]
+    assert [main._page(params) for params in ({}, {'page': ''}, {'page': '3'}, {'page': '0'},
+                                              {'page': '-2'}, {'page': 'x'})] == [1, 1, 3, 1, 1, 1]
+
+def test_directory_submits_every_item_once(listing_plugin):
+    _, directory, _, xbmcplugin = listing_plugin
+    folder = directory.Template(folder=True, mediatype='tvshow')
+    playable = directory.Template(playable=True, mediatype='episode', genres=['Documentary'])
+    listing = directory.Directory(7, 'episodes', [xbmcplugin.SORT_METHOD_UNSORTED])
+    listing.add(folder, 'plugin://series/a', 'A series')
+    listing.add(playable, 'plugin://series/b', 'S1E2 - B', title='B', season=1, episode=2)
+    assert len(listing) == 2 and xbmcplugin.ITEMS == []
+    listing.finish()
+    assert [(url, item.label, is_folder) for url, item, is_folder in xbmcplugin.ITEMS] == [
+        ('plugin://series/a', 'A series', True), ('plugin://series/b', 'S1E2 - B', False)]
+    assert xbmcplugin.ITEMS[1][1].properties == {'IsPlayable': 'true'}
+    assert 'IsPlayable' not in xbmcplugin.ITEMS[0][1].properties
+    assert xbmcplugin.ENDED == [7]
+
+    # A failed listing ends the directory without items
+    failed = directory.Directory(8)
+    failed.add(folder, 'plugin://series/c', 'C series')
+    failed.finish(False)
+    assert len(xbmcplugin.ITEMS) == 2 and xbmcplugin.ENDED == [7, 8]
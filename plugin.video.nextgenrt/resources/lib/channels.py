@@ -0,0 +1,29 @@
+"""The RT live channels and how their pages are resolved.
+
+Shared by the plugin routes and the health monitor service, so the service
+can resolve channels without importing main, which reads the plugin handle
+from sys.argv.
+"""
+from nextgenrt_core import resolver
+
+# RT News streams and localization string IDs
+# String IDs must exist in resources/language/*/strings.po
+RT_STREAMS = [
+    ("https://www.rt.com/on-air/", 32010, "Global"),
+    ("https://www.rt.com/on-air/rt-america-air", 32011, "US"),
+    ("https://rtd.rt.com/on-air/", 32012, "Documentaries"),
+    ("https://actualidad.rt.com/en_vivo2", 32013, "ESP"),
+    ("https://arabic.rt.com/live/", 32014, "ARAB"),
+    ("https://de.rt.com/livetv/", 32015, "DE"),
+    ("https://francais.rt.com/en-direct/rt", 32016, "FR"),
+    ("https://rt.rs/livetv/", 32017, "RS"),
+]
+
+def extractor_for(page_url):
+    """rtd.rt.com uses its own pattern, every other channel the standard ones."""
+    from nextgenrt_core import extract
+    return extract.RTD_PAGE if 'rtd.rt.com' in page_url else extract.STANDARD
+
+def new_resolver():
+    """Return a Resolver for the channel pages."""
+    return resolver.Resolver("NextGen RT News", extractor_for)
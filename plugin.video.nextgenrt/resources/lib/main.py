@@ -1,215 +1,153 @@
 import xbmcplugin
-import xbmcgui
 import xbmc
 import xbmcaddon
 import sys
-import re
-try:
-    from urllib.request import urlopen, Request
-    from urllib.parse import parse_qs
-except ImportError:
-    from urllib2 import urlopen, Request
-    from urlparse import parse_qs
+
+from nextgenrt_core import cache
+from nextgenrt_core import directory
+from nextgenrt_core import storage
+from nextgenrt_core import trace
+from resources.lib import channels
+
+# Every click starts a fresh interpreter, so the modules needed only to
+# fetch and scan pages are imported where they are used; see
+# nextgenrt_core.resolver. Playing a cached stream or opening the menu never
+# loads them.
 
 # Plugin constants
 PLUGIN_URL = sys.argv[0]
 HANDLE = int(sys.argv[1])
 
-# RT News streams and localization string IDs
-# String IDs must exist in resources/language/*/strings.po
-RT_STREAMS = [
-    ("https://www.rt.com/on-air/", 32010, "Global"),
-    ("https://www.rt.com/on-air/rt-america-air", 32011, "US"),
-    ("https://rtd.rt.com/on-air/", 32012, "Documentaries"),
-    ("https://actualidad.rt.com/en_vivo2", 32013, "ESP"),
-    ("https://arabic.rt.com/live/", 32014, "ARAB"),
-    ("https://de.rt.com/livetv/", 32015, "DE"),
-    ("https://francais.rt.com/en-direct/rt", 32016, "FR"),
-    ("https://rt.rs/livetv/", 32017, "RS"),
-]
-
-def _fetch_page_html(page_url):
-    """Fetch HTML content from a page with proper headers."""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    req = Request(page_url, headers=headers)
-    response = urlopen(req)
-    return response.read().decode('utf-8')
-
-def _extract_m3u8_url(html):
-    """Extract m3u8 URL from HTML."""
-    m = re.search(r'(https?://[^"\s]+\.m3u8[^"\s]*)', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT News - Found m3u8 URL: %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_file_pattern(html):
-    """Extract URL from file: pattern."""
-    m = re.search(r"file:\s*['\"]([^'\"]+)['\"]", html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT News - Found stream URL (file pattern): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_url_pattern(html):
-    """Extract URL from url: pattern with m3u8."""
-    m = re.search(r'url:\s*["\']([^"\']+\.m3u8[^"\']*)["\']', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT News - Found stream URL (url pattern): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_source_tag(html):
-    """Extract URL from <source> tag."""
-    m = re.search(r'<source[^>]+src=["\']([^"\']+)["\']', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT News - Found stream URL (source tag): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_from_iframe(html):
-    """Extract stream URL from iframe embed."""
-    m = re.search(r'<iframe[^>]+src=["\']([^"\']+)["\']', html, re.DOTALL)
-    if not m:
-        return None
-    
-    iframe_url = m.group(1)
-    
-    # Skip Rumble iframes
-    if 'rumble.com' in iframe_url:
-        xbmc.log("NextGen RT News - Found Rumble iframe but cannot extract stream directly", xbmc.LOGWARNING)
-        return None
-    
-    # Ensure full URL
-    if not iframe_url.startswith('http'):
-        iframe_url = 'https:' + iframe_url
-    
-    xbmc.log("NextGen RT News - Found iframe, fetching: %s" % iframe_url, xbmc.LOGINFO)
-    
-    try:
-        iframe_html = _fetch_page_html(iframe_url)
-        return _extract_m3u8_url(iframe_html)
-    except Exception as e:
-        xbmc.log("NextGen RT News - Error fetching iframe: %s" % str(e), xbmc.LOGWARNING)
-        return None
-
-def _extract_rtd_stream(html):
-    """Extract stream URL from rtd.rt.com specific pattern."""
-    m = re.search(r'streams_hls.+?url:\s*["\']([^"\']+)["\']', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT News - Found stream URL (rtd pattern): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _try_standard_patterns(html):
-    """Try standard extraction patterns in order."""
-    extractors = [
-        _extract_m3u8_url,
-        _extract_file_pattern,
-        _extract_url_pattern,
-        _extract_source_tag,
-        _extract_from_iframe
-    ]
-    
-    for extractor in extractors:
-        url = extractor(html)
-        if url:
-            return url
-    return None
+# Localized channel labels, cached per addon version and Kodi language
+LABELS_FILE = 'labels.json'
+
+# Label suffix for channels whose page is known to be unavailable
+UNAVAILABLE_STRING = 32103
+
+# Every channel is a playable live news stream
+CHANNEL = directory.Template(playable=True, genres=["News"])
+
+# Fetching, extraction and probing shared by all resolutions of this invocation
+RESOLVER = channels.new_resolver()
 
 def get_stream_url(page_url):
     """Extract the actual stream URL from the RT page."""
-    try:
-        xbmc.log("NextGen RT News - Fetching page: %s" % page_url, xbmc.LOGINFO)
-        html = _fetch_page_html(page_url)
-        
-        # Check if this is rtd.rt.com (uses different pattern)
-        if 'rtd.rt.com' in page_url:
-            stream_url = _extract_rtd_stream(html)
-        else:
-            stream_url = _try_standard_patterns(html)
-        
-        if not stream_url:
-            xbmc.log("NextGen RT News - No stream URL found in page", xbmc.LOGERROR)
-        
-        return stream_url
-    except Exception as e:
-        xbmc.log("NextGen RT News - Error getting stream URL: %s" % str(e), xbmc.LOGERROR)
-        return None
+    return RESOLVER.get_stream_url(page_url)
+
+def _channel_labels():
+    """Return the localized label of every channel in channels.RT_STREAMS.
+    
+    The labels only change with the addon version or the Kodi language, so
+    they are looked up once and then read back from the profile.
+    """
+    addon = xbmcaddon.Addon()
+    key = '%s/%s' % (addon.getAddonInfo('version'), xbmc.getLanguage(xbmc.ISO_639_1))
+    path = storage.profile_path(LABELS_FILE)
+    cached = storage.read_json(path)
+    if isinstance(cached, dict) and cached.get('key') == key and len(cached.get('labels', ())) == len(channels.RT_STREAMS):
+        return cached['labels']
+    labels = [addon.getLocalizedString(string_id) or "RT News - %s" % fallback
+              for _, string_id, fallback in channels.RT_STREAMS]
+    storage.write_json(path, {'key': key, 'labels': labels})
+    return labels
 
 def list_videos():
     """Create a list of RT News streams."""
-    addon = xbmcaddon.Addon()
-    for url, string_id, fallback in RT_STREAMS:
-        localized = addon.getLocalizedString(string_id) or "RT News - %s" % fallback
-        list_item = xbmcgui.ListItem(label=localized)
-        info_tag = list_item.getVideoInfoTag()
-        info_tag.setTitle(localized)
-        # Use InfoTagVideo instead of deprecated setInfo()
-        try:
-            info_tag.setGenres(["News"])
-        except AttributeError:
-            pass
-        list_item.setProperty("IsPlayable", "true")
-        
-        # Create a URL with the page URL as a parameter
-        plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, url)
-        
-        # Add the list item to the directory
-        xbmcplugin.addDirectoryItem(
-            handle=HANDLE, url=plugin_url, listitem=list_item, isFolder=False
-        )
+    from resources.lib import prefetch
+    
+    # Read before the prefetch starts, as it may claim half-open trials
+    availability = RESOLVER.availability()
+    unavailable = [availability.unavailable(url) for url, _, _ in channels.RT_STREAMS]
     
-    xbmcplugin.endOfDirectory(HANDLE)
+    # Resolve all channels in the background while the user picks one
+    prefetcher = prefetch.Prefetcher(
+        [url for url, _, _ in channels.RT_STREAMS], get_stream_url, cache.StreamCache.open()
+    ).start()
+    
+    with trace.span('directory', '%d channels' % len(channels.RT_STREAMS)):
+        listing = directory.Directory(HANDLE, 'videos', [xbmcplugin.SORT_METHOD_UNSORTED])
+        unavailable_label = None
+        for (url, _, _), localized, reason in zip(channels.RT_STREAMS, _channel_labels(), unavailable):
+            label = localized
+            if reason:
+                if unavailable_label is None:
+                    unavailable_label = xbmcaddon.Addon().getLocalizedString(UNAVAILABLE_STRING) or "Unavailable"
+                label = "[COLOR grey]%s - %s[/COLOR]" % (localized, unavailable_label)
+            
+            # Create a URL with the page URL as a parameter
+            plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, url)
+            listing.add(CHANNEL, plugin_url, label, title=localized)
+        
+        listing.finish()
+    prefetcher.join()
+
+def _resolve_stream(page_url):
+    """Resolve a page, reusing a background prefetch already in flight for it."""
+    from resources.lib import prefetch
+    return prefetch.wait_for(page_url) or get_stream_url(page_url)
 
 def play_video(url):
-    """Play a video from the given URL."""
-    xbmc.log("NextGen RT News - Playing video from: %s" % url, xbmc.LOGINFO)
-    stream_url = get_stream_url(url)
+    """Play a video from the given URL, preferring a stream the health monitor verified."""
+    from resources.lib import warm
+    RESOLVER.play(HANDLE, url, _resolve_stream, warm.WarmTable.open().stream_url)
+
+def _parse_params(query):
+    """Parse the plugin query string into a dict of single values.
     
-    if stream_url:
-        xbmc.log("NextGen RT News - Resolved to stream: %s" % stream_url, xbmc.LOGINFO)
-        
-        # Create list item with the stream URL
-        list_item = xbmcgui.ListItem(path=stream_url)
-        
-        # Set properties for HLS/m3u8 streams
-        if '.m3u8' in stream_url:
-            xbmc.log("NextGen RT News - Setting up HLS stream with inputstream.adaptive", xbmc.LOGINFO)
-            # For Kodi 19+ (Matrix and later)
-            list_item.setProperty('inputstream', 'inputstream.adaptive')
-            list_item.setContentLookup(False)
-            
-        xbmcplugin.setResolvedUrl(HANDLE, True, list_item)
-    else:
-        xbmc.log("NextGen RT News - Failed to resolve stream URL", xbmc.LOGERROR)
-        xbmcplugin.setResolvedUrl(HANDLE, False, xbmcgui.ListItem())
+    Same result as taking the first value of each key from parse_qs, but
+    urllib is only imported when a value is actually percent-encoded.
+    """
+    params = {}
+    if query.startswith('?'):
+        query = query[1:]
+    for pair in query.split('&'):
+        key, _, value = pair.partition('=')
+        if not value:
+            continue
+        if '%' in pair or '+' in pair:
+            try:
+                from urllib.parse import unquote_plus
+            except ImportError:
+                from urllib import unquote_plus
+            key, value = unquote_plus(key), unquote_plus(value)
+        if key not in params:
+            params[key] = value
+    return params
+
+def _route_play(params):
+    url = params.get('url')
+    if url:
+        play_video(url)
+
+def _route_list(params):
+    list_videos()
+
+# action parameter -> route; anything else shows the channel list
+ROUTES = {
+    'play': _route_play,
+}
+
+def _trace_rate():
+    """Return the share of invocations to trace, from the trace_sample_rate percentage."""
+    try:
+        percent = float(xbmcaddon.Addon().getSetting('trace_sample_rate') or 0)
+    except ValueError:
+        return 0.0
+    return min(max(percent, 0.0), 100.0) / 100.0
 
 def run():
     """Main entry point for the plugin."""
-    # Parse parameters
-    params = {}
-    if len(sys.argv) > 2:
-        params_str = sys.argv[2]
-        if params_str:
-            if params_str.startswith('?'):
-                params_str = params_str[1:]
-            params = parse_qs(params_str)
-            # Convert lists to single values
-            params = {k: v[0] if isinstance(v, list) and len(v) > 0 else v for k, v in params.items()}
+    params = _parse_params(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] else {}
     
-    xbmc.log("NextGen RT News - Params: %s" % str(params), xbmc.LOGINFO)
+    xbmc.log("NextGen RT News - Params: %s" % str(params), xbmc.LOGDEBUG)
     
     # Route to appropriate function
     action = params.get('action')
-    if action == 'play':
-        url = params.get('url')
-        if url:
-            play_video(url)
-    else:
-        list_videos()
+    trace.start('nextgenrt', action if action in ROUTES else 'root', params.get('url'), _trace_rate())
+    try:
+        ROUTES.get(action, _route_list)(params)
+    finally:
+        trace.finish()
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,93 @@
+"""Background pre-resolution of channel pages while the menu is shown.
+
+list_videos starts a bounded pool of worker threads that resolve every
+channel page into the stream cache. Pages being resolved are flagged with a
+home window property so that a play invocation started meanwhile waits for
+the prefetch result instead of fetching the same page again.
+"""
+import threading
+import time
+
+import xbmcgui
+
+from nextgenrt_core import cache
+
+# Upper bound on concurrent page fetches
+MAX_WORKERS = 8
+
+# Seconds the listing invocation keeps waiting for the workers after endOfDirectory
+PREFETCH_DEADLINE = 10
+
+# How often a waiting play invocation re-reads the stream cache
+POLL_INTERVAL = 0.1
+
+_HOME_WINDOW_ID = 10000
+_PROPERTY_PREFIX = 'nextgenrt.prefetch.'
+
+def _set_pending(window, page_url, deadline):
+    window.setProperty(_PROPERTY_PREFIX + page_url, '%.3f' % deadline)
+
+def _clear_pending(window, page_url):
+    window.clearProperty(_PROPERTY_PREFIX + page_url)
+
+class Prefetcher(object):
+    """Resolves a set of page URLs concurrently into a StreamCache."""
+
+    def __init__(self, page_urls, resolver, stream_cache, max_workers=MAX_WORKERS,
+                 deadline=PREFETCH_DEADLINE):
+        self.resolver = resolver
+        self.stream_cache = stream_cache
+        self.deadline = time.time() + deadline
+        self._window = xbmcgui.Window(_HOME_WINDOW_ID)
+        self._pending = [u for u in page_urls if stream_cache.get(u) is None]
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name='nextgenrt-prefetch-%d' % i)
+            for i in range(min(max_workers, len(self._pending)))
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+
+    def start(self):
+        """Flag all pages as pending and start the worker threads."""
+        for page_url in self._pending:
+            _set_pending(self._window, page_url, self.deadline)
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _next(self):
+        with self._lock:
+            return self._pending.pop(0) if self._pending else None
+
+    def _work(self):
+        page_url = self._next()
+        while page_url is not None:
+            try:
+                if time.time() < self.deadline:
+                    stream_url = self.resolver(page_url)
+                    if stream_url:
+                        self.stream_cache.put(page_url, stream_url)
+                        self.stream_cache.save()
+            finally:
+                _clear_pending(self._window, page_url)
+            page_url = self._next()
+
+    def join(self):
+        """Wait for the workers until the deadline passes."""
+        for thread in self._threads:
+            thread.join(max(0, self.deadline - time.time()))
+
+def wait_for(page_url):
+    """Wait for an in-flight prefetch of page_url and return its stream URL.
+
+    Returns None straight away if no prefetch is running for the page, or
+    once the prefetch finishes without a result or misses its deadline.
+    """
+    window = xbmcgui.Window(_HOME_WINDOW_ID)
+    while True:
+        pending = window.getProperty(_PROPERTY_PREFIX + page_url)
+        stream_url = cache.StreamCache.open().get(page_url)
+        if stream_url or not pending or float(pending) <= time.time():
+            return stream_url
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,125 @@
+"""Background service keeping every channel resolved and checked.
+
+Runs inside Kodi for the whole session when the health_monitor setting is
+on. Every health_interval minutes, give or take JITTER, it re-resolves
+each channel page, at most health_concurrency at a time and each after a
+random delay. A channel only counts as healthy once its master playlist
+answers. Healthy channels go into the warm table (resources.lib.warm) and
+the stream cache, together with the HLS variant for the stream_quality
+setting, so a channel switch starts playing without a fetch. Failures feed the
+circuit breakers in nextgenrt_core.availability, which the channel list
+shows as unavailable.
+"""
+import random
+import time
+
+import xbmc
+import xbmcaddon
+
+from nextgenrt_core import aio
+from nextgenrt_core import cache
+from nextgenrt_core import resolver as stream_resolver
+from resources.lib import channels
+from resources.lib import warm
+
+# Seconds to wait after Kodi starts before the first round
+STARTUP_DELAY = 15
+
+DEFAULT_INTERVAL_MINUTES = 5
+DEFAULT_CONCURRENCY = 2
+
+# Share of the interval added or taken at random before each round
+JITTER = 0.2
+
+# Largest random delay, in seconds, before each channel of a round is checked
+MAX_STAGGER = 10
+
+# Check intervals a warm table entry stays trusted without a new check
+TRUSTED_INTERVALS = 2
+
+def _settings():
+    """Return (enabled, interval in seconds, channels checked at once) from the addon settings."""
+    addon = xbmcaddon.Addon()
+    enabled = addon.getSetting('health_monitor') == 'true'
+    try:
+        minutes = int(addon.getSetting('health_interval'))
+    except ValueError:
+        minutes = DEFAULT_INTERVAL_MINUTES
+    try:
+        concurrency = int(addon.getSetting('health_concurrency'))
+    except ValueError:
+        concurrency = DEFAULT_CONCURRENCY
+    return enabled, max(1, minutes) * 60, max(1, concurrency)
+
+def _check(resolver, page_url, monitor):
+    """Resolve page_url and fetch its master playlist; returns (stream URL, seconds) or None."""
+    if monitor.waitForAbort(random.uniform(0, MAX_STAGGER)):
+        return None
+    start = time.time()
+    stream_url = resolver.get_stream_url(page_url)
+    if not stream_url:
+        return None
+    if '.m3u8' in stream_url:
+        from nextgenrt_core import hls
+        body = resolver.http().get(stream_url)
+        if not body.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U'):
+            return None
+        hls.PlaylistCache.open().variants(stream_url, lambda url: body)
+    return stream_url, time.time() - start
+
+def refresh(monitor, interval, concurrency):
+    """Check every channel once and publish the results; returns the number found healthy."""
+    resolver = channels.new_resolver()
+    table = warm.WarmTable.open()
+    stream_cache = cache.StreamCache.open()
+    quality = stream_resolver.stream_quality()
+    healthy = 0
+    page_urls = [url for url, _, _ in channels.RT_STREAMS]
+    checks = aio.crawl(page_urls, lambda url: _check(resolver, url, monitor),
+                       per_host=concurrency, max_workers=concurrency, monitor=monitor)
+    try:
+        for page_url, result, error in checks:
+            if result is None:
+                if error is not None:
+                    xbmc.log("NextGen RT News - Health check of %s failed: %s" % (page_url, str(error)), xbmc.LOGWARNING)
+                table.record_failure(page_url)
+                continue
+            stream_url, latency = result
+            table.record(page_url, stream_url, latency, interval * TRUSTED_INTERVALS)
+            stream_cache.put(page_url, stream_url)
+            if '.m3u8' in stream_url:
+                # The master playlist was just cached, so this sends no request
+                chosen = resolver.select_variant(stream_url, quality)
+                if chosen is not None:
+                    stream_cache.set_variant(page_url, stream_url, quality, *chosen)
+            healthy += 1
+            if monitor.abortRequested():
+                break
+    finally:
+        checks.close()
+        resolver.close()
+    table.save()
+    stream_cache.save()
+    return healthy
+
+def run():
+    """Service entry point, returns when Kodi asks the service to stop."""
+    monitor = xbmc.Monitor()
+    xbmc.log("NextGen RT News - Health monitor service started", xbmc.LOGINFO)
+    if monitor.waitForAbort(STARTUP_DELAY):
+        return
+    while not monitor.abortRequested():
+        enabled, interval, concurrency = _settings()
+        wait = interval
+        if enabled:
+            start = time.time()
+            healthy = refresh(monitor, interval, concurrency)
+            xbmc.log("NextGen RT News - Health check: %d of %d channels healthy in %.1fs" % (
+                healthy, len(channels.RT_STREAMS), time.time() - start), xbmc.LOGINFO)
+            wait = interval * random.uniform(1 - JITTER, 1 + JITTER)
+        else:
+            # Settings may change while disabled; look again every few minutes
+            wait = min(wait, DEFAULT_INTERVAL_MINUTES * 60)
+        if monitor.waitForAbort(wait):
+            break
+    xbmc.log("NextGen RT News - Health monitor service stopped", xbmc.LOGINFO)
@@ -0,0 +1,58 @@
+"""Table of channel streams verified by the health monitor service.
+
+The service re-resolves every channel in the background and checks that
+its master playlist answers. It publishes the result per page URL as
+{page_url: [stream URL, seconds the check took, last ok time, expiry time]}.
+play_video reads this table before anything else, so switching to a
+healthy channel costs no page fetch at all.
+
+An entry expires a couple of check intervals after it was written, so a
+stopped service or a channel that started failing stops being trusted.
+"""
+import time
+
+from nextgenrt_core import storage
+
+WARM_FILE = 'warm_channels.json'
+
+class WarmTable(object):
+    """Verified stream URLs per channel page, persisted in the profile."""
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = storage.read_json(path, default={})
+        if not isinstance(self._entries, dict):
+            self._entries = {}
+
+    @classmethod
+    def open(cls):
+        """Open the table stored in the addon profile directory."""
+        return cls(storage.profile_path(WARM_FILE))
+
+    def stream_url(self, page_url, now=None):
+        """Return the verified stream URL of page_url, or None if there is none or it expired."""
+        now = time.time() if now is None else now
+        entry = self._entries.get(page_url)
+        if not isinstance(entry, list) or len(entry) != 4 or entry[3] <= now:
+            return None
+        return entry[0]
+
+    def entry(self, page_url):
+        """Return (stream URL, latency, last ok time, expiry time) of page_url, or None."""
+        entry = self._entries.get(page_url)
+        return tuple(entry) if isinstance(entry, list) and len(entry) == 4 else None
+
+    def record(self, page_url, stream_url, latency, ttl, now=None):
+        """Store a stream URL that was just verified."""
+        now = time.time() if now is None else now
+        self._entries[page_url] = [stream_url, latency, now, now + ttl]
+
+    def record_failure(self, page_url, now=None):
+        """Stop trusting page_url after a failed check, keeping when it was last ok."""
+        now = time.time() if now is None else now
+        entry = self._entries.get(page_url)
+        if isinstance(entry, list) and len(entry) == 4:
+            entry[3] = min(entry[3], now)
+
+    def save(self):
+        storage.write_json(self.path, self._entries)
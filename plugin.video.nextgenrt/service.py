@@ -0,0 +1,4 @@
+from resources.lib import service
+
+if __name__ == '__main__':
+    service.run()
@@ -0,0 +1,105 @@
+"""Parsed episode lists of series pages, kept in the addon profile.
+
+list_episodes parses a series page once and stores the result here, keyed
+by series URL together with a fingerprint of the page it came from. Opening
+a season folder afterwards is a plain lookup with no download and no
+parsing, and a page whose fingerprint is unchanged is never parsed twice.
+The fingerprint only covers the episode list (scraper.episodes_region), so
+scripts and tokens that change on every request do not count. Episodes are
+kept in page order, and an index built by another PARSER_VERSION counts as
+missing.
+"""
+import hashlib
+import os
+
+from nextgenrt_core import storage
+from resources.lib import scraper
+
+INDEX_DIR = 'episodes'
+
+# Bumped whenever the page parser or the fingerprinted region changes, so pages are parsed again
+PARSER_VERSION = 3
+
+def content_hash(html):
+    """Return the fingerprint of the episode list on a series page, given as str or UTF-8 bytes."""
+    region = scraper.episodes_region(html)
+    if isinstance(region, str):
+        region = region.encode('utf-8')
+    return hashlib.sha1(b'%d:%s' % (PARSER_VERSION, region)).hexdigest()
+
+def diff_episodes(old, new):
+    """Return (added, removed) episode dicts between two parses of a series page, by URL."""
+    old_urls = set(episode['url'] for episode in old)
+    new_urls = set(episode['url'] for episode in new)
+    return ([episode for episode in new if episode['url'] not in old_urls],
+            [episode for episode in old if episode['url'] not in new_urls])
+
+def _encode(episodes):
+    """Turn episode dicts into [[season, episode, title, url], ...], in page order."""
+    return [[episode.get('season', 1), episode.get('episode'), episode['title'], episode['url']]
+            for episode in episodes]
+
+def _decode(rows):
+    return [{'title': title, 'url': url, 'episode': number, 'season': season}
+            for season, number, title, url in rows]
+
+class EpisodeIndex(object):
+    """One small JSON file per series under the profile's episodes directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def open(cls):
+        """Open the index stored in the addon profile directory."""
+        return cls(storage.profile_path(INDEX_DIR))
+
+    def _path(self, series_url):
+        return os.path.join(self.directory, hashlib.sha1(series_url.encode('utf-8')).hexdigest() + '.json')
+
+    def _load(self, series_url):
+        record = storage.read_json(self._path(series_url))
+        if (isinstance(record, dict) and record.get('url') == series_url
+                and record.get('version') == PARSER_VERSION):
+            return record
+        return None
+
+    def store(self, series_url, page_hash, episodes):
+        """Save the parsed episodes of a series page.
+
+        Returns (added, removed) compared with the episodes stored before,
+        both empty if the series was not indexed yet.
+        """
+        previous = self.episodes(series_url)
+        storage.write_json(self._path(series_url), {
+            'url': series_url,
+            'version': PARSER_VERSION,
+            'hash': page_hash,
+            'episodes': _encode(episodes),
+        })
+        if previous is None:
+            return [], []
+        return diff_episodes(previous, episodes)
+
+    def episodes(self, series_url, page_hash=None):
+        """Return all indexed episodes of a series in page order, or None if not indexed.
+
+        If page_hash is given, None is also returned when the index was built
+        from a different version of the page.
+        """
+        record = self._load(series_url)
+        if record is None or (page_hash is not None and record['hash'] != page_hash):
+            return None
+        return _decode(record['episodes'])
+
+    def season(self, series_url, season_num, page_hash=None):
+        """Return the indexed episodes of one season, or None if not indexed.
+
+        page_hash is checked as by episodes().
+        """
+        episodes = self.episodes(series_url, page_hash)
+        if episodes is None:
+            return None
+        return [episode for episode in episodes if episode['season'] == season_num]
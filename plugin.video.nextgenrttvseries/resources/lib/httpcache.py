@@ -0,0 +1,214 @@
+"""On-disk HTTP response cache with conditional revalidation.
+
+Bodies of GET responses are stored zlib-compressed in the addon profile,
+together with their ETag / Last-Modified validators and the freshness
+lifetime from Cache-Control max-age. A fresh entry is served without any
+network access; a stale one is revalidated with If-None-Match /
+If-Modified-Since and served from disk when the server answers 304.
+
+The plugin and the library sync service use the cache at the same time,
+so changes are merged into the index on disk when it is saved, as the
+stream cache does, and body files that no index entry refers to are
+deleted.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+
+from nextgenrt_core import storage
+
+CACHE_DIR = 'http_cache'
+INDEX_FILE = 'index.json'
+
+# Total size of compressed bodies kept before the least recently used are evicted
+MAX_BYTES = 8 * 1024 * 1024
+
+# Seconds a body file may exist without an index entry before it is deleted;
+# another process may have written it and not saved its index yet
+ORPHAN_GRACE = 60
+
+BODY_SUFFIX = '.z'
+
+_MAX_AGE = re.compile(r'max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+def _freshness(headers):
+    """Return (seconds the response is fresh for, whether it may be stored)."""
+    cache_control = (headers.get('Cache-Control') or '').lower()
+    if 'no-store' in cache_control:
+        return 0, False
+    if 'no-cache' in cache_control:
+        return 0, True
+    m = _MAX_AGE.search(cache_control)
+    return (int(m.group(1)) if m else 0), True
+
+class HttpCache(object):
+    """Caches response bodies fetched through an HttpClient.
+
+    The index maps each URL to [body file, ETag, Last-Modified, expiry time,
+    compressed size, last use time]. stats counts fresh hits, 304
+    revalidations and misses, cumulatively across invocations.
+    """
+
+    def __init__(self, directory, client, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.client = client
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._entries, self.stats = self._load()
+        # URLs changed or dropped here, and stats counted here, since the index was loaded
+        self._dirty = set()
+        self._removed = set()
+        self._counted = {}
+
+    def _load(self):
+        """Return (entries, stats) from the index on disk, skipping anything malformed."""
+        index = storage.read_json(os.path.join(self.directory, INDEX_FILE), default={})
+        if not isinstance(index, dict):
+            index = {}
+        entries = index.get('entries')
+        entries = dict((url, entry) for url, entry in entries.items()
+                       if isinstance(entry, list) and len(entry) == 6) if isinstance(entries, dict) else {}
+        stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+        if isinstance(index.get('stats'), dict):
+            stats.update((key, value) for key, value in index['stats'].items()
+                         if key in stats and isinstance(value, int))
+        return entries, stats
+
+    @classmethod
+    def open(cls, client):
+        """Open the cache stored in the addon profile directory."""
+        return cls(storage.profile_path(CACHE_DIR), client)
+
+    def _body_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_body(self, entry):
+        try:
+            with open(self._body_path(entry[0]), 'rb') as f:
+                return zlib.decompress(f.read())
+        except (IOError, OSError, zlib.error):
+            return None
+
+    def _write_body(self, url, body):
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest() + BODY_SUFFIX
+        data = zlib.compress(body, 6)
+        tmp_path = '%s.%d.%d.tmp' % (self._body_path(name), os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._body_path(name))
+        return name, len(data)
+
+    def _count(self, key):
+        self.stats[key] += 1
+        self._counted[key] = self._counted.get(key, 0) + 1
+
+    def _put(self, url, entry):
+        self._entries[url] = entry
+        self._dirty.add(url)
+        self._removed.discard(url)
+
+    def _drop(self, url):
+        self._entries.pop(url, None)
+        self._dirty.discard(url)
+        self._removed.add(url)
+
+    def _evict(self, entries):
+        """Drop the least recently used entries of entries until their bodies fit in max_bytes."""
+        total = sum(entry[4] for entry in entries.values())
+        for url, entry in sorted(entries.items(), key=lambda item: item[1][5]):
+            if total <= self.max_bytes:
+                break
+            del entries[url]
+            total -= entry[4]
+
+    def _delete_orphans(self, entries, now):
+        """Delete body files no entry refers to, unless they are too new to tell."""
+        referenced = set(entry[0] for entry in entries.values())
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(BODY_SUFFIX) or name in referenced:
+                continue
+            path = self._body_path(name)
+            try:
+                if now - os.path.getmtime(path) > ORPHAN_GRACE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _save(self, now=None):
+        """Merge the changes made here into the index on disk and write it."""
+        now = time.time() if now is None else now
+        entries, stats = self._load()
+        for url in self._removed:
+            entries.pop(url, None)
+        for url in self._dirty:
+            if url in self._entries:
+                entries[url] = self._entries[url]
+        for key, count in self._counted.items():
+            stats[key] += count
+        self._evict(entries)
+        storage.write_json(os.path.join(self.directory, INDEX_FILE), {'entries': entries, 'stats': stats})
+        self._delete_orphans(entries, now)
+        self._entries, self.stats = entries, stats
+        self._dirty.clear()
+        self._removed.clear()
+        self._counted.clear()
+
+    def get(self, url, headers=None, max_bytes=None):
+        """Return the body of url as bytes, from disk whenever possible.
+
+        With max_bytes, a body fetched from the network is cut off after that
+        many decompressed bytes and not stored.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+        body = self._read_body(entry) if entry else None
+        if body is not None and entry[3] > now:
+            with self._lock:
+                entry[5] = now
+                self._put(url, entry)
+                self._count('hits')
+                self._save(now)
+            return body
+
+        request_headers = dict(headers or {})
+        if body is not None:
+            if entry[1]:
+                request_headers['If-None-Match'] = entry[1]
+            if entry[2]:
+                request_headers['If-Modified-Since'] = entry[2]
+        with self.client.open(url, request_headers) as response:
+            data = response.read(max_bytes)
+            fresh_for, storable = _freshness(response.headers)
+            if max_bytes is not None and len(data) >= max_bytes:
+                storable = False
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            status = response.status
+
+        with self._lock:
+            if status == 304 and body is not None:
+                entry[3] = now + fresh_for
+                entry[5] = now
+                self._put(url, entry)
+                self._count('revalidated')
+                self._save(now)
+                return body
+            self._count('misses')
+            if storable and (etag or last_modified or fresh_for > 0):
+                name, size = self._write_body(url, data)
+                self._put(url, [name, etag, last_modified, now + fresh_for, size, now])
+            elif url in self._entries:
+                # Its body file is deleted by _save() once nothing refers to it
+                self._drop(url)
+            self._save(now)
+        return data
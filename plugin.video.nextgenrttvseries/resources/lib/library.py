@@ -0,0 +1,199 @@
+"""Local SQLite library of the rtdoc.tv catalog.
+
+The sync service fills it with every series, season and episode; the
+plugin routes render directories from it without touching the network.
+Each series row remembers the hash of the page it was parsed from, so a
+sync only re-parses pages that changed. Episodes that appear on a changed
+page are recorded in new_episodes, which backs the "New episodes" folder.
+"""
+import sqlite3
+import time
+
+from resources.lib import episode_index
+from resources.lib import scraper
+from nextgenrt_core import storage
+
+LIBRARY_FILE = 'library.db'
+
+# Days an episode stays in the "New episodes" folder
+NEW_EPISODE_DAYS = 14
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    page_hash TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS seasons (
+    series_id INTEGER NOT NULL REFERENCES series(id) ON DELETE CASCADE,
+    season INTEGER NOT NULL,
+    episode_count INTEGER NOT NULL,
+    PRIMARY KEY (series_id, season)
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    series_id INTEGER NOT NULL REFERENCES series(id) ON DELETE CASCADE,
+    season INTEGER NOT NULL,
+    episode INTEGER,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS new_episodes (
+    series_id INTEGER NOT NULL REFERENCES series(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    found REAL NOT NULL,
+    PRIMARY KEY (series_id, url)
+);
+CREATE INDEX IF NOT EXISTS episodes_by_season ON episodes (series_id, season, position);
+CREATE INDEX IF NOT EXISTS new_episodes_by_time ON new_episodes (found);
+CREATE INDEX IF NOT EXISTS series_by_position ON series (position);
+"""
+
+class Library(object):
+    """Connection to the catalog database in the addon profile."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls):
+        """Open the library stored in the addon profile directory."""
+        return cls(storage.profile_path(LIBRARY_FILE))
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM series LIMIT 1').fetchone() is None
+
+    def series(self):
+        """Return all series as scraper.Series tuples, in catalog order."""
+        rows = self.conn.execute('SELECT title, url FROM series ORDER BY position')
+        return [scraper.Series._make(row) for row in rows]
+
+    def page_hashes(self):
+        """Return {series url: hash of the page its episodes came from}."""
+        return dict(self.conn.execute('SELECT url, page_hash FROM series'))
+
+    def replace_series_list(self, series_list):
+        """Make the series table match a freshly parsed catalog page.
+
+        Known series keep their episodes; series no longer listed are removed.
+        """
+        with self.conn:
+            urls = [series.url for series in series_list]
+            for position, series in enumerate(series_list):
+                self.conn.execute(
+                    'INSERT INTO series (url, title, position) VALUES (?, ?, ?) '
+                    'ON CONFLICT(url) DO UPDATE SET title = excluded.title, position = excluded.position',
+                    (series.url, series.title, position))
+            known = [row[0] for row in self.conn.execute('SELECT url FROM series')]
+            listed = set(urls)
+            self.conn.executemany('DELETE FROM series WHERE url = ?',
+                                  [(url,) for url in known if url not in listed])
+
+    def replace_episodes(self, series_url, page_hash, episodes, now=None):
+        """Store the parsed episodes of a series page, replacing older ones.
+
+        Returns (added, removed) episode dicts compared with the stored
+        episodes; on the first sync of a series nothing counts as added.
+        Added episodes are recorded as new, removed ones stop being new.
+        """
+        now = time.time() if now is None else now
+        with self.conn:
+            row = self.conn.execute('SELECT id, page_hash FROM series WHERE url = ?', (series_url,)).fetchone()
+            if row is None:
+                return [], []
+            series_id, old_hash = row
+            added, removed = [], []
+            if old_hash is not None:
+                old = self._episode_dicts(self.conn.execute(
+                    'SELECT season, episode, title, url FROM episodes WHERE series_id = ?', (series_id,)))
+                added, removed = episode_index.diff_episodes(old, episodes)
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO new_episodes (series_id, url, found) VALUES (?, ?, ?)',
+                    [(series_id, episode['url'], now) for episode in added])
+                self.conn.executemany(
+                    'DELETE FROM new_episodes WHERE series_id = ? AND url = ?',
+                    [(series_id, episode['url']) for episode in removed])
+            self.conn.execute('DELETE FROM new_episodes WHERE found < ?', (now - NEW_EPISODE_DAYS * 86400,))
+            self.conn.execute('DELETE FROM episodes WHERE series_id = ?', (series_id,))
+            self.conn.execute('DELETE FROM seasons WHERE series_id = ?', (series_id,))
+            counts = {}
+            rows = []
+            for position, episode in enumerate(episodes):
+                season = episode.get('season', 1)
+                counts[season] = counts.get(season, 0) + 1
+                rows.append((series_id, season, episode.get('episode'), episode['title'], episode['url'], position))
+            self.conn.executemany(
+                'INSERT INTO episodes (series_id, season, episode, title, url, position) VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+            self.conn.executemany(
+                'INSERT INTO seasons (series_id, season, episode_count) VALUES (?, ?, ?)',
+                [(series_id, season, count) for season, count in counts.items()])
+            self.conn.execute('UPDATE series SET page_hash = ?, updated = ? WHERE id = ?',
+                              (page_hash, now, series_id))
+        return added, removed
+
+    def _series_id(self, series_url):
+        """Return the id of a series whose episodes were synced, else None."""
+        row = self.conn.execute(
+            'SELECT id FROM series WHERE url = ? AND page_hash IS NOT NULL', (series_url,)).fetchone()
+        return row[0] if row else None
+
+    def episodes(self, series_url, season=None):
+        """Return episode dicts of a series (optionally one season), or None if not synced."""
+        series_id = self._series_id(series_url)
+        if series_id is None:
+            return None
+        if season is None:
+            rows = self.conn.execute(
+                'SELECT season, episode, title, url FROM episodes WHERE series_id = ? ORDER BY position',
+                (series_id,))
+        else:
+            rows = self.conn.execute(
+                'SELECT season, episode, title, url FROM episodes WHERE series_id = ? AND season = ? '
+                'ORDER BY position', (series_id, season))
+        return self._episode_dicts(rows)
+
+    def _episode_dicts(self, rows):
+        return [{'title': title, 'url': url, 'episode': number, 'season': season_num}
+                for season_num, number, title, url in rows]
+
+    def new_episodes(self, now=None):
+        """Return (series title, episode dict) of episodes found in the last NEW_EPISODE_DAYS, newest first."""
+        now = time.time() if now is None else now
+        rows = self.conn.execute(
+            'SELECT s.title, e.season, e.episode, e.title, e.url FROM new_episodes n '
+            'JOIN series s ON s.id = n.series_id '
+            'JOIN episodes e ON e.series_id = n.series_id AND e.url = n.url '
+            'WHERE n.found >= ? ORDER BY n.found DESC, s.position, e.position',
+            (now - NEW_EPISODE_DAYS * 86400,))
+        return [(row[0], self._episode_dicts([row[1:]])[0]) for row in rows]
+
+    def new_episode_count(self, now=None):
+        """Return how many episodes new_episodes() would list."""
+        now = time.time() if now is None else now
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM new_episodes WHERE found >= ?',
+            (now - NEW_EPISODE_DAYS * 86400,)).fetchone()[0]
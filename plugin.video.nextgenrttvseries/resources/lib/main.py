@@ -3,320 +3,214 @@ import xbmcplugin
 import xbmcgui
 import xbmc
 import xbmcaddon
-import re
-import gzip
-import io
-try:
-    from urllib.request import urlopen, Request
-    from urllib.parse import parse_qs
-except ImportError:
-    from urllib2 import urlopen, Request
-    from urlparse import parse_qs
+
+from nextgenrt_core import directory
+from nextgenrt_core import resolver
+from nextgenrt_core import trace
+from resources.lib import episode_index
+from resources.lib import library
+from resources.lib import scraper
+
+# Every click starts a fresh interpreter, so the modules needed only to
+# fetch and scan pages (httpcache here, the rest in nextgenrt_core.resolver)
+# are imported by the functions that use them. Browsing the synced library
+# or playing a cached stream never loads them.
 
 # Plugin constants
 PLUGIN_URL = sys.argv[0]
 HANDLE = int(sys.argv[1])
 
-def _fetch_page_html(page_url):
-    """Fetch HTML content from a page with proper headers and gzip decompression."""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    req = Request(page_url, headers=headers)
-    response = urlopen(req)
-    
-    # Handle gzip-compressed responses
-    if response.headers.get('Content-Encoding') == 'gzip':
-        html = gzip.decompress(response.read()).decode('utf-8')
-    else:
-        html = response.read().decode('utf-8')
-    
+def _extractor_for(page_url):
+    """RTD uses a specific pattern, checked before the standard ones."""
+    from nextgenrt_core import extract
+    return extract.RTD_THEN_STANDARD
+
+# Fetching, extraction and probing shared by all resolutions of this invocation
+RESOLVER = resolver.Resolver("NextGen RT TV Series", _extractor_for)
+
+def get_stream_url(page_url):
+    """Extract the actual stream URL from the RT page."""
+    return RESOLVER.get_stream_url(page_url)
+
+# Episodes listed per page when the setting is missing or invalid
+DEFAULT_PAGE_SIZE = 50
+
+# Directory entries: series and season folders, playable episodes
+SERIES = directory.Template(folder=True, mediatype='tvshow', genres=["Documentary"])
+SEASON = directory.Template(folder=True, mediatype='season', genres=["Documentary"])
+EPISODE = directory.Template(playable=True, mediatype='episode', genres=["Documentary"])
+NEW_EPISODES = directory.Template(folder=True)
+SEARCH = directory.Template(folder=True)
+
+# Label of the folder listing the episodes the library sync found recently
+NEW_EPISODES_STRING = 32111
+
+# Label of the search folder and heading of the search keyboard
+SEARCH_STRING = 32112
+
+# Catalog pages change rarely, so they go through an on-disk response cache
+_http_cache = None
+
+def _fetch_page(page_url):
+    """Fetch the undecoded body of a page, reusing or revalidating a cached copy.
+
+    Like stream resolution, reading stops after resolver.MAX_PAGE_BYTES.
+    """
+    global _http_cache
+    if _http_cache is None:
+        from resources.lib import httpcache
+        _http_cache = httpcache.HttpCache.open(RESOLVER.http())
+    body = _http_cache.get(page_url, max_bytes=resolver.MAX_PAGE_BYTES)
+    RESOLVER.log("HTTP cache stats: %s", _http_cache.stats)
+    return body
+
+def _decode_page(page_url, body):
+    """Decode a page body, recording the memory the body and its text hold together."""
+    with trace.span('decode', page_url):
+        html = body.decode('utf-8')
+    trace.memory('page', len(body) + sys.getsizeof(html), page_url)
     return html
 
-def _extract_m3u8_url(html):
-    """Extract m3u8 URL from HTML."""
-    m = re.search(r'(https?://[^"\s]+\.m3u8[^"\s]*)', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT TV Series - Found m3u8 URL: %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_file_pattern(html):
-    """Extract URL from file: pattern."""
-    m = re.search(r"file:\s*['\"]([^'\"]+)['\"]", html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT TV Series - Found stream URL (file pattern): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_url_pattern(html):
-    """Extract URL from url: pattern with m3u8."""
-    m = re.search(r'url:\s*["\']([^"\']+\.m3u8[^"\']*)["\']', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT TV Series - Found stream URL (url pattern): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_source_tag(html):
-    """Extract URL from <source> tag."""
-    m = re.search(r'<source[^>]+src=["\']([^"\']+)["\']', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT TV Series - Found stream URL (source tag): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _extract_from_iframe(html):
-    """Extract stream URL from iframe embed."""
-    m = re.search(r'<iframe[^>]+src=["\']([^"\']+)["\']', html, re.DOTALL)
-    if not m:
-        return None
-    
-    iframe_url = m.group(1)
-    
-    # Skip Rumble iframes
-    if 'rumble.com' in iframe_url:
-        xbmc.log("NextGen RT TV Series - Found Rumble iframe but cannot extract stream directly", xbmc.LOGWARNING)
-        return None
-    
-    # Ensure full URL
-    if not iframe_url.startswith('http'):
-        iframe_url = 'https:' + iframe_url
-    
-    xbmc.log("NextGen RT TV Series - Found iframe, fetching: %s" % iframe_url, xbmc.LOGINFO)
-    
+def _fetch_page_html(page_url):
+    """Fetch HTML content from a page, reusing or revalidating a cached copy."""
+    return _decode_page(page_url, _fetch_page(page_url))
+
+def _update_search_index(update):
+    """Apply update(index) to the search index and save it; search is never worth failing a listing for."""
     try:
-        iframe_html = _fetch_page_html(iframe_url)
-        return _extract_m3u8_url(iframe_html)
+        from resources.lib import search_index
+        index = search_index.SearchIndex.open()
+        update(index)
+        index.save()
     except Exception as e:
-        xbmc.log("NextGen RT TV Series - Error fetching iframe: %s" % str(e), xbmc.LOGWARNING)
-        return None
-
-def _extract_rtd_stream(html):
-    """Extract stream URL from rtd.rt.com specific pattern."""
-    m = re.search(r'streams_hls.+?url:\s*["\']([^"\']+)["\']', html, re.DOTALL)
-    if m:
-        xbmc.log("NextGen RT TV Series - Found stream URL (rtd pattern): %s" % m.group(1), xbmc.LOGINFO)
-        return m.group(1)
-    return None
-
-def _try_standard_patterns(html):
-    """Try standard extraction patterns in order."""
-    extractors = [
-        _extract_m3u8_url,
-        _extract_file_pattern,
-        _extract_url_pattern,
-        _extract_source_tag,
-        _extract_from_iframe
-    ]
-    
-    for extractor in extractors:
-        url = extractor(html)
-        if url:
-            return url
-    return None
+        xbmc.log("NextGen RT TV Series - Search index not updated: %s" % str(e), xbmc.LOGWARNING)
 
-def get_stream_url(page_url):
-    """Extract the actual stream URL from the RT page."""
+def _from_library(query, *args):
+    """Run a query against the synced catalog library, None if it cannot answer."""
     try:
-        xbmc.log("NextGen RT TV Series - Fetching page: %s" % page_url, xbmc.LOGINFO)
-        html = _fetch_page_html(page_url)
-        
-        # RTD uses a specific pattern
-        stream_url = _extract_rtd_stream(html)
-        if not stream_url:
-            stream_url = _try_standard_patterns(html)
-        
-        if not stream_url:
-            xbmc.log("NextGen RT TV Series - No stream URL found in page", xbmc.LOGERROR)
-        
-        return stream_url
+        db = library.Library.open()
     except Exception as e:
-        xbmc.log("NextGen RT TV Series - Error getting stream URL: %s" % str(e), xbmc.LOGERROR)
+        xbmc.log("NextGen RT TV Series - Library unavailable: %s" % str(e), xbmc.LOGWARNING)
         return None
-
-def _extract_series_list(html):
-    """Extract series list from RTDoc serials page.
-    
-    Look for various HTML patterns for series links.
-    """
-    series = []
-    
-    # Try multiple patterns to find series links
-    patterns = [
-        # Pattern 1: Standard <a> tags with /serials/ in href
-        r'<a\s+href="(https://en\.rtdoc\.tv/serials/[^"]+)"\s*>([^<]+)</a>',
-        # Pattern 2: This pattern was working (36 matches found) - captures partial or full URLs
-        r'href=["\']([^"\']*serials[^"\']+)["\'][^>]*>([^<]+)<',
-        # Pattern 3: Broader search for any link with serials
-        r'(https://en\.rtdoc\.tv/serials/[^\s"\'<>]+)[^>]*>([^<]+)</a>',
-    ]
-    
-    seen = set()
-    match_count = 0
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, html, re.IGNORECASE)
-        match_count += len(matches)
-        xbmc.log("NextGen RT TV Series - Pattern '%s' found %d matches" % (pattern[:50], len(matches)), xbmc.LOGINFO)
-        
-        for item in matches:
-            if len(item) >= 2:
-                url, title = item[0], item[1]
-            else:
-                continue
-            
-            # Ensure URL is complete - Pattern 2 may return partial URLs like /serials/123-title
-            if not url.startswith('http'):
-                url = 'https://en.rtdoc.tv' + url if url.startswith('/') else 'https://en.rtdoc.tv/' + url
-                
-            title_clean = title.strip()
-            
-            # Filter out navigation and very short titles
-            if title_clean and url not in seen and len(title_clean) > 3:
-                if title_clean.lower() not in ['films', 'tv series', 'on air', 'live', 'collections', 'profile']:
-                    seen.add(url)
-                    series.append({
-                        'title': title_clean,
-                        'url': url
-                    })
-                    xbmc.log("NextGen RT TV Series - Found series: %s -> %s" % (title_clean, url), xbmc.LOGDEBUG)
-    
-    xbmc.log("NextGen RT TV Series - Total patterns matched: %d, unique series: %d" % (match_count, len(series)), xbmc.LOGINFO)
-    
-    return series
+    try:
+        return getattr(db, query)(*args) or None
+    except Exception as e:
+        xbmc.log("NextGen RT TV Series - Library query failed: %s" % str(e), xbmc.LOGWARNING)
+        return None
+    finally:
+        db.close()
 
 def list_series():
     """Create a list of RT Documentary series from en.rtdoc.tv/serials."""
     try:
-        xbmc.log("NextGen RT TV Series - Fetching series list from https://en.rtdoc.tv/serials", xbmc.LOGINFO)
-        html = _fetch_page_html("https://en.rtdoc.tv/serials")
-        series_list = _extract_series_list(html)
+        # The sync service keeps a local copy of the catalog; scrape live only without one
+        series_list = _from_library('series')
+        if series_list is None:
+            xbmc.log("NextGen RT TV Series - Fetching series list from %s" % scraper.SERIALS_URL, xbmc.LOGINFO)
+            html = _fetch_page_html(scraper.SERIALS_URL)
+            with trace.span('parse.series', scraper.SERIALS_URL):
+                series_list = scraper.extract_series_list(html)
+            if series_list:
+                _update_search_index(lambda index: index.index_series_list(series_list))
         
         if not series_list:
             xbmc.log("NextGen RT TV Series - No series found", xbmc.LOGWARNING)
             xbmcplugin.endOfDirectory(HANDLE)
             return
         
-        for series in series_list:
-            list_item = xbmcgui.ListItem(label=series['title'])
-            list_item.setInfo("video", {"title": series['title']})
-            
-            # Create a URL to list episodes for this series
-            plugin_url = "%s?action=episodes&url=%s" % (PLUGIN_URL, series['url'])
-            
-            xbmcplugin.addDirectoryItem(
-                handle=HANDLE, url=plugin_url, listitem=list_item, isFolder=True
-            )
+        with trace.span('directory', '%d series' % len(series_list)):
+            listing = directory.Directory(
+                HANDLE, 'tvshows', [xbmcplugin.SORT_METHOD_UNSORTED, xbmcplugin.SORT_METHOD_LABEL])
+            search_label = xbmcaddon.Addon().getLocalizedString(SEARCH_STRING) or "Search"
+            list_item = SEARCH.build(search_label)
+            list_item.setProperty("SpecialSort", "top")
+            listing.add_item("%s?action=search" % PLUGIN_URL, list_item, True)
+            new_count = _from_library('new_episode_count')
+            if new_count:
+                label = xbmcaddon.Addon().getLocalizedString(NEW_EPISODES_STRING) or "New episodes"
+                list_item = NEW_EPISODES.build("%s (%d)" % (label, new_count))
+                list_item.setProperty("SpecialSort", "top")
+                listing.add_item("%s?action=new_episodes" % PLUGIN_URL, list_item, True)
+            for series in series_list:
+                # Create a URL to list episodes for this series
+                plugin_url = "%s?action=episodes&url=%s" % (PLUGIN_URL, series.url)
+                listing.add(SERIES, plugin_url, series.title)
         
-        xbmcplugin.endOfDirectory(HANDLE)
+            listing.finish()
         
     except Exception as e:
         xbmc.log("NextGen RT TV Series - Error listing series: %s" % str(e), xbmc.LOGERROR)
         xbmcplugin.endOfDirectory(HANDLE)
 
-def _extract_episodes_list(html):
-    """Extract episodes list from a series page with season info.
+def _series_episodes(series_url):
+    """Fetch a series page and return its episodes, parsing it only if it changed."""
+    # An unchanged page is recognised from its bytes and never decoded
+    body = _fetch_page(series_url)
+    page_hash = episode_index.content_hash(body)
+    index = episode_index.EpisodeIndex.open()
+    episodes_list = index.episodes(series_url, page_hash)
+    if episodes_list is None:
+        html = _decode_page(series_url, body)
+        with trace.span('parse.episodes', series_url):
+            episodes_list = scraper.extract_episodes_list(html)
+        added, removed = index.store(series_url, page_hash, episodes_list)
+        _update_search_index(lambda search: search.index_episodes(series_url, episodes_list))
+        RESOLVER.log("Series page changed: %d episodes added, %d removed", len(added), len(removed))
+    else:
+        trace.memory('page', len(body), series_url)
+        RESOLVER.log("Series page unchanged, using indexed episodes")
+    return episodes_list
+
+def _page_size():
+    """Return the number of episodes listed per page, 0 for no paging."""
+    try:
+        return max(0, int(xbmcaddon.Addon().getSetting('episodes_per_page')))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+
+def _episode_listing():
+    """Return an empty directory for a page of episodes."""
+    return directory.Directory(
+        HANDLE, 'episodes', [xbmcplugin.SORT_METHOD_UNSORTED, xbmcplugin.SORT_METHOD_EPISODE])
+
+def _add_episode_page(listing, episodes_list, page, folder_url):
+    """Add one page of playable episodes to listing, plus a "Next page" folder if more remain.
     
-    Episodes are found with /episodes/ in the URL.
-    Returns episodes with extracted season and episode numbers.
+    Episodes without a number are numbered by their position in episodes_list.
     """
-    episodes = []
-    
-    # First, try to extract season headers (e.g., "2 Season", "1 Season")
-    # Looking for patterns like "### [Episode X Title](url)" or similar markdown
-    season_pattern = r'(\d+)\s+Season'
-    season_matches = re.findall(season_pattern, html, re.IGNORECASE)
+    page_size = _page_size()
+    start = (page - 1) * page_size if page_size else 0
+    end = start + page_size if page_size else len(episodes_list)
     
-    xbmc.log("NextGen RT TV Series - Found season text: %s" % str(season_matches), xbmc.LOGINFO)
-    
-    # If we find seasons, use them; otherwise assume single season
-    seasons = sorted({int(s) for s in season_matches}, reverse=True) if season_matches else [1]
-    current_season = seasons[0] if seasons else 1
-    
-    xbmc.log("NextGen RT TV Series - Detected seasons: %s, starting with season %d" % (str(seasons), current_season), xbmc.LOGINFO)
-    
-    # Pattern that works: finds text followed by /episodes/ links
-    # This pattern captures the episode title and the episode URL
-    pattern = r'>([^<]*?)<\/a>\s*(?:</li>)?.*?href=["\']([^"\']*\/episodes\/[^"\']*)'
-    
-    seen = set()
-    matches = re.findall(pattern, html, re.IGNORECASE | re.DOTALL)
-    
-    xbmc.log("NextGen RT TV Series - Found %d episode matches" % len(matches), xbmc.LOGINFO)
-    
-    # For multi-season series, split episodes into seasons based on position
-    # Episodes appear in groups on the page separated by season info
-    # Since we detected len(seasons) seasons, divide episodes evenly
-    if len(seasons) > 1 and len(matches) > 0:
-        episodes_per_season = len(matches) // len(seasons)
-        xbmc.log("NextGen RT TV Series - Dividing %d episodes into %d seasons (~%d per season)" % (len(matches), len(seasons), episodes_per_season), xbmc.LOGINFO)
+    for idx, episode in enumerate(episodes_list[start:end], start + 1):
+        ep_num = episode.get('episode')
+        ep_title = episode['title']
+        season_num = episode.get('season', 1)
         
-        # Assign episodes to seasons based on their position
-        season_idx = 0
-        for ep_idx, match in enumerate(matches):
-            if len(match) == 2:
-                title, url = match[0].strip(), match[1]
-                
-                # Complete relative URLs
-                if url.startswith('/'):
-                    url = 'https://en.rtdoc.tv' + url
-                
-                if title and url not in seen and 'episodes' in url:
-                    seen.add(url)
-                    
-                    # Determine which season based on position
-                    # Episodes appear in order on page, grouped by season
-                    # Start with highest season number, work down
-                    current_season = seasons[season_idx // episodes_per_season] if season_idx < len(seasons) else seasons[-1]
-                    
-                    # Try to extract episode number
-                    ep_match = re.search(r'Episode\s+(\d+)', title, re.IGNORECASE)
-                    ep_num = int(ep_match.group(1)) if ep_match else None
-                    
-                    episodes.append({
-                        'title': title,
-                        'url': url,
-                        'episode': ep_num,
-                        'season': current_season
-                    })
-                    
-                    season_idx += 1
-    else:
-        # Single season - simple processing
-        for match in matches:
-            if len(match) == 2:
-                title, url = match[0].strip(), match[1]
-                
-                # Complete relative URLs
-                if url.startswith('/'):
-                    url = 'https://en.rtdoc.tv' + url
-                
-                if title and url not in seen and 'episodes' in url:
-                    seen.add(url)
-                    
-                    # Try to extract episode number
-                    ep_match = re.search(r'Episode\s+(\d+)', title, re.IGNORECASE)
-                    ep_num = int(ep_match.group(1)) if ep_match else None
-                    
-                    episodes.append({
-                        'title': title,
-                        'url': url,
-                        'episode': ep_num,
-                        'season': 1
-                    })
-    
-    # Log what we extracted
-    unique_seasons = sorted(set(ep.get('season', 1) for ep in episodes))
-    xbmc.log("NextGen RT TV Series - _extract_episodes_list: extracted %d episodes with seasons %s" % (len(episodes), str(unique_seasons)), xbmc.LOGINFO)
+        # If ep_num is None, use sequential numbering
+        if ep_num is None:
+            ep_num = idx
+        
+        display_title = "S%dE%d - %s" % (season_num, ep_num, ep_title)
+        
+        # Create a URL to play this episode
+        plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, episode['url'])
+        listing.add(EPISODE, plugin_url, display_title, title=ep_title, season=season_num, episode=ep_num)
     
-    return episodes
+    if end < len(episodes_list):
+        label = xbmcaddon.Addon().getLocalizedString(32110) or "Next page"
+        list_item = xbmcgui.ListItem(label="%s (%d/%d)" % (label, page + 1, -(-len(episodes_list) // page_size)), offscreen=True)
+        # Stays last when the listing is sorted by episode
+        list_item.setProperty("SpecialSort", "bottom")
+        listing.add_item("%s&page=%d" % (folder_url, page + 1), list_item, True)
 
-def list_episodes(series_url):
+def list_episodes(series_url, page=1):
     """List episodes for a specific series, organized by season."""
     try:
-        xbmc.log("NextGen RT TV Series - Fetching episodes from %s" % series_url, xbmc.LOGINFO)
-        html = _fetch_page_html(series_url)
-        episodes_list = _extract_episodes_list(html)
+        episodes_list = _from_library('episodes', series_url)
+        if episodes_list is None:
+            xbmc.log("NextGen RT TV Series - Fetching episodes from %s" % series_url, xbmc.LOGINFO)
+            episodes_list = _series_episodes(series_url)
         
         if not episodes_list:
             xbmc.log("NextGen RT TV Series - No episodes found for series", xbmc.LOGWARNING)
@@ -334,162 +228,212 @@ def list_episodes(series_url):
         # Display seasons as folders if multiple seasons, otherwise show episodes directly
         seasons = sorted(episodes_by_season.keys(), reverse=True)
         
-        if len(seasons) > 1:
-            # Multiple seasons - create season folders
-            for season in seasons:
-                season_episodes = episodes_by_season[season]
-                season_title = "Season %d (%d episodes)" % (season, len(season_episodes))
-                list_item = xbmcgui.ListItem(label=season_title)
-                list_item.setInfo("video", {"title": season_title})
-                
-                # Create a URL to list episodes for this season
-                # We'll pass the season number as a parameter
-                plugin_url = "%s?action=season_episodes&url=%s&season=%d" % (PLUGIN_URL, series_url, season)
-                
-                xbmcplugin.addDirectoryItem(
-                    handle=HANDLE, url=plugin_url, listitem=list_item, isFolder=True
-                )
-        else:
-            # Single season - show episodes directly
-            for idx, episode in enumerate(episodes_list):
-                ep_num = episode.get('episode')
-                ep_title = episode['title']
-                season_num = episode.get('season', 1)
+        with trace.span('directory', series_url):
+            if len(seasons) > 1:
+                # Multiple seasons - create season folders
+                listing = directory.Directory(HANDLE, 'seasons', [xbmcplugin.SORT_METHOD_UNSORTED])
+                for season in seasons:
+                    season_episodes = episodes_by_season[season]
+                    season_title = "Season %d (%d episodes)" % (season, len(season_episodes))
                 
-                # If ep_num is None, use sequential numbering
-                if ep_num is None:
-                    ep_num = idx + 1
-                
-                display_title = "S%dE%d - %s" % (season_num, ep_num, ep_title)
-                
-                list_item = xbmcgui.ListItem(label=display_title)
-                list_item.setProperty("IsPlayable", "true")
-                
-                info_tag = list_item.getVideoInfoTag()
-                info_tag.setTitle(ep_title)
-                info_tag.setEpisode(ep_num)
-                info_tag.setSeason(season_num)
-                try:
-                    info_tag.setGenres(["Documentary"])
-                except AttributeError:
-                    pass
-                
-                # Create a URL to play this episode
-                plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, episode['url'])
-                
-                xbmcplugin.addDirectoryItem(
-                    handle=HANDLE, url=plugin_url, listitem=list_item, isFolder=False
-                )
+                    # Create a URL to list episodes for this season
+                    # We'll pass the season number as a parameter
+                    plugin_url = "%s?action=season_episodes&url=%s&season=%d" % (PLUGIN_URL, series_url, season)
+                    listing.add(SEASON, plugin_url, season_title, season=season)
+            else:
+                # Single season - show episodes directly, a page at a time
+                listing = _episode_listing()
+                _add_episode_page(listing, episodes_list, page, "%s?action=episodes&url=%s" % (PLUGIN_URL, series_url))
         
-        xbmcplugin.endOfDirectory(HANDLE)
+            listing.finish()
         
     except Exception as e:
         xbmc.log("NextGen RT TV Series - Error listing episodes: %s" % str(e), xbmc.LOGERROR)
         xbmcplugin.endOfDirectory(HANDLE)
 
+def list_new_episodes():
+    """List the episodes the library sync found on changed series pages, newest first."""
+    new_episodes = _from_library('new_episodes') or []
+    with trace.span('directory', '%d new episodes' % len(new_episodes)):
+        listing = directory.Directory(HANDLE, 'episodes', [xbmcplugin.SORT_METHOD_UNSORTED])
+        for series_title, episode in new_episodes:
+            season_num = episode.get('season', 1)
+            ep_num = episode.get('episode')
+            plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, episode['url'])
+            listing.add(EPISODE, plugin_url, _episode_label(series_title, season_num, ep_num, episode['title']),
+                        title=episode['title'], season=season_num, episode=ep_num)
+        listing.finish()
+
+def _episode_label(series_title, season_num, ep_num, title):
+    """Label of an episode listed outside its series, like "Series - S1E2 - Title"."""
+    if ep_num is None:
+        return "%s - S%d - %s" % (series_title, season_num, title)
+    return "%s - S%dE%d - %s" % (series_title, season_num, ep_num, title)
+
+def _search_index():
+    """Open the search index, filling it from the synced library if it was never built."""
+    from resources.lib import search_index
+    index = search_index.SearchIndex.open()
+    if index.is_empty():
+        try:
+            db = library.Library.open()
+        except Exception as e:
+            xbmc.log("NextGen RT TV Series - Library unavailable: %s" % str(e), xbmc.LOGWARNING)
+            return index
+        try:
+            series_list = db.series()
+            index.index_series_list(series_list)
+            for series in series_list:
+                episodes = db.episodes(series.url)
+                if episodes:
+                    index.index_episodes(series.url, episodes)
+        finally:
+            db.close()
+        index.save()
+    return index
+
+def list_search_results(query):
+    """List the series and episodes whose titles or URLs contain words starting with those of query."""
+    from resources.lib import search_index
+    with trace.span('search', query):
+        results = _search_index().search(query)
+    RESOLVER.log("Search for %r: %d results", query, len(results))
+    with trace.span('directory', '%d search results' % len(results)):
+        listing = directory.Directory(HANDLE, 'videos', [xbmcplugin.SORT_METHOD_UNSORTED])
+        for kind, title, url, series_title, season_num, ep_num in results:
+            if kind == search_index.SERIES:
+                listing.add(SERIES, "%s?action=episodes&url=%s" % (PLUGIN_URL, url), title)
+                continue
+            label = _episode_label(series_title, season_num, ep_num, title) if series_title else title
+            plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, url)
+            listing.add(EPISODE, plugin_url, label, title=title, season=season_num, episode=ep_num)
+        listing.finish()
+
 def play_series(url):
     """Play a series/episode from the given URL."""
-    xbmc.log("NextGen RT TV Series - Playing from: %s" % url, xbmc.LOGINFO)
-    stream_url = get_stream_url(url)
+    RESOLVER.play(HANDLE, url)
+
+def _parse_params(query):
+    """Parse the plugin query string into a dict of single values.
     
-    if stream_url:
-        xbmc.log("NextGen RT TV Series - Resolved to stream: %s" % stream_url, xbmc.LOGINFO)
-        
-        # Create list item with the stream URL
-        list_item = xbmcgui.ListItem(path=stream_url)
-        
-        # Set properties for HLS/m3u8 streams
-        if '.m3u8' in stream_url:
-            xbmc.log("NextGen RT TV Series - Setting up HLS stream with inputstream.adaptive", xbmc.LOGINFO)
-            # For Kodi 19+ (Matrix and later)
-            list_item.setProperty('inputstream', 'inputstream.adaptive')
-            list_item.setContentLookup(False)
-            
-        xbmcplugin.setResolvedUrl(HANDLE, True, list_item)
+    Same result as taking the first value of each key from parse_qs, but
+    urllib is only imported when a value is actually percent-encoded.
+    """
+    params = {}
+    if query.startswith('?'):
+        query = query[1:]
+    for pair in query.split('&'):
+        key, _, value = pair.partition('=')
+        if not value:
+            continue
+        if '%' in pair or '+' in pair:
+            try:
+                from urllib.parse import unquote_plus
+            except ImportError:
+                from urllib import unquote_plus
+            key, value = unquote_plus(key), unquote_plus(value)
+        if key not in params:
+            params[key] = value
+    return params
+
+def _page(params):
+    """Return the 1-based page number of a paged listing, 1 when missing or invalid."""
+    try:
+        return max(1, int(params.get('page') or 1))
+    except ValueError:
+        return 1
+
+def _route_play(params):
+    url = params.get('url')
+    if url:
+        play_series(url)
+
+def _route_season_episodes(params):
+    url = params.get('url')
+    season = params.get('season')
+    if url:
+        list_episodes_for_season(url, int(season) if season else 1, _page(params))
+
+def _route_episodes(params):
+    url = params.get('url')
+    if url:
+        list_episodes(url, _page(params))
+
+def _route_series(params):
+    list_series()
+
+def _route_new_episodes(params):
+    list_new_episodes()
+
+def _route_search(params):
+    query = params.get('query')
+    if not query:
+        heading = xbmcaddon.Addon().getLocalizedString(SEARCH_STRING) or "Search"
+        query = xbmcgui.Dialog().input(heading)
+    if query:
+        list_search_results(query)
     else:
-        xbmc.log("NextGen RT TV Series - Failed to resolve stream URL", xbmc.LOGERROR)
-        xbmcplugin.setResolvedUrl(HANDLE, False, xbmcgui.ListItem())
+        xbmcplugin.endOfDirectory(HANDLE, False)
+
+# action parameter -> route; anything else shows the series list
+ROUTES = {
+    'play': _route_play,
+    'season_episodes': _route_season_episodes,
+    'episodes': _route_episodes,
+    'new_episodes': _route_new_episodes,
+    'search': _route_search,
+}
+
+def _trace_rate():
+    """Return the share of invocations to trace, from the trace_sample_rate percentage."""
+    try:
+        percent = float(xbmcaddon.Addon().getSetting('trace_sample_rate') or 0)
+    except ValueError:
+        return 0.0
+    return min(max(percent, 0.0), 100.0) / 100.0
 
 def run():
     """Main entry point for the plugin."""
-    # Parse parameters
-    params = {}
-    if len(sys.argv) > 2:
-        params_str = sys.argv[2]
-        if params_str:
-            if params_str.startswith('?'):
-                params_str = params_str[1:]
-            params = parse_qs(params_str)
-            # Convert lists to single values
-            params = {k: v[0] if isinstance(v, list) and len(v) > 0 else v for k, v in params.items()}
+    params = _parse_params(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] else {}
     
-    xbmc.log("NextGen RT TV Series - Params: %s" % str(params), xbmc.LOGINFO)
+    RESOLVER.log("Params: %s", params)
     
     # Route to appropriate function
     action = params.get('action')
-    if action == 'play':
-        url = params.get('url')
-        if url:
-            play_series(url)
-    elif action == 'season_episodes':
-        url = params.get('url')
-        season = params.get('season')
-        if url:
-            list_episodes_for_season(url, int(season) if season else 1)
-    elif action == 'episodes':
-        url = params.get('url')
-        if url:
-            list_episodes(url)
-    else:
-        list_series()
+    trace.start('nextgenrttvseries', action if action in ROUTES else 'root', params.get('url'), _trace_rate())
+    try:
+        ROUTES.get(action, _route_series)(params)
+    finally:
+        trace.finish()
 
-def list_episodes_for_season(series_url, season_num):
+def list_episodes_for_season(series_url, season_num, page=1):
     """List episodes for a specific season of a series."""
     try:
-        xbmc.log("NextGen RT TV Series - Fetching episodes for season %d from %s" % (season_num, series_url), xbmc.LOGINFO)
-        html = _fetch_page_html(series_url)
-        episodes_list = _extract_episodes_list(html)
+        # The library or the series folder indexed the page already, so this is normally a plain lookup
+        season_episodes = _from_library('episodes', series_url, season_num)
+        if season_episodes is None:
+            season_episodes = episode_index.EpisodeIndex.open().season(series_url, season_num)
         
-        # Filter episodes for this season
-        season_episodes = [ep for ep in episodes_list if ep.get('season') == season_num]
+        if season_episodes is None:
+            xbmc.log("NextGen RT TV Series - Fetching episodes for season %d from %s" % (season_num, series_url), xbmc.LOGINFO)
+            episodes_list = _series_episodes(series_url)
+            
+            # Filter episodes for this season
+            season_episodes = [ep for ep in episodes_list if ep.get('season') == season_num]
         
         if not season_episodes:
             xbmc.log("NextGen RT TV Series - No episodes found for season %d" % season_num, xbmc.LOGWARNING)
             xbmcplugin.endOfDirectory(HANDLE)
             return
         
-        for episode in season_episodes:
-            ep_num = episode.get('episode')
-            ep_title = episode['title']
-            
-            # Format title with episode number if available
-            # If ep_num is None, use sequential numbering within the season
-            if ep_num is None:
-                # Number episodes sequentially within the season
-                ep_num = season_episodes.index(episode) + 1
-            
-            display_title = "S%dE%d - %s" % (season_num, ep_num, ep_title)
-            
-            list_item = xbmcgui.ListItem(label=display_title)
-            list_item.setProperty("IsPlayable", "true")
-            
-            info_tag = list_item.getVideoInfoTag()
-            info_tag.setTitle(ep_title)
-            info_tag.setEpisode(ep_num)
-            info_tag.setSeason(season_num)
-            try:
-                info_tag.setGenres(["Documentary"])
-            except AttributeError:
-                pass
-            
-            # Create a URL to play this episode
-            plugin_url = "%s?action=play&url=%s" % (PLUGIN_URL, episode['url'])
-            
-            xbmcplugin.addDirectoryItem(
-                handle=HANDLE, url=plugin_url, listitem=list_item, isFolder=False
+        with trace.span('directory', '%s season %d' % (series_url, season_num)):
+            listing = _episode_listing()
+            _add_episode_page(
+                listing, season_episodes, page,
+                "%s?action=season_episodes&url=%s&season=%d" % (PLUGIN_URL, series_url, season_num)
             )
         
-        xbmcplugin.endOfDirectory(HANDLE)
+            listing.finish()
         
     except Exception as e:
         xbmc.log("NextGen RT TV Series - Error listing season episodes: %s" % str(e), xbmc.LOGERROR)
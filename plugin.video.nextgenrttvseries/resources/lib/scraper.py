@@ -0,0 +1,210 @@
+"""Parsers for the en.rtdoc.tv catalog pages.
+
+Kept apart from main.py so that both the plugin routes and the library
+sync service can use them.
+"""
+import re
+from collections import namedtuple
+try:
+    from html.parser import HTMLParser
+except ImportError:
+    from HTMLParser import HTMLParser
+
+import xbmc
+
+# Catalog page listing every series
+SERIALS_URL = "https://en.rtdoc.tv/serials"
+
+# A series on the catalog page
+Series = namedtuple('Series', 'title url')
+
+# Link texts on the catalog page that are site navigation, not series
+NAVIGATION_TITLES = frozenset(['films', 'tv series', 'on air', 'live', 'collections', 'profile'])
+
+# The catalog link forms, most specific first:
+#   0: <a href="https://en.rtdoc.tv/serials/...">Title</a>
+#   1: href="...serials..." ...>Title<, often relative
+#   2: https://en.rtdoc.tv/serials/... in another attribute of the tag, ...>Title</a>
+# Each form is a lookahead of its own, so one finditer visits the matches of
+# all three even where they overlap, and every form keeps the non-overlapping
+# matches a findall of its own pattern would give. The form decides which
+# title wins for a URL linked more than once and where it sorts. The
+# leading [<h][ahrt] lets the scan skip the positions none of them can start at.
+_SERIES_LINK = re.compile(
+    r'(?=[<h][ahrt])'
+    r'(?=(<a\s+href="(https://en\.rtdoc\.tv/serials/[^"]+)"\s*>([^<]+)</a>)'
+    r'|(href=["\']([^"\']*serials[^"\']+)["\'][^>]*>([^<]+)<)'
+    r'|((https://en\.rtdoc\.tv/serials/[^\s"\'<>]+)[^>]*>([^<]+)</a>))',
+    re.IGNORECASE)
+_FORMS = 3
+
+def _debug_logging():
+    """Whether Kodi's debug logging is on, so per-item log lines are worth building."""
+    return xbmc.getCondVisibility('System.GetBool(debug.showloginfo)')
+
+def _log(message, *args):
+    """Log message % args at LOGDEBUG; the line is not even formatted while debug logging is off."""
+    if _debug_logging():
+        xbmc.log("NextGen RT TV Series - %s" % (message % args), xbmc.LOGDEBUG)
+
+def _series_links(html):
+    """Yield (url, title) for every link to a series, form by form and in page order within a form."""
+    links = [[] for _ in range(_FORMS)]
+    ends = [0] * _FORMS
+    for m in _SERIES_LINK.finditer(html):
+        for form in range(_FORMS):
+            whole = m.group(form * 3 + 1)
+            if whole is not None:
+                break
+        if m.start() < ends[form]:
+            continue
+        ends[form] = m.start() + len(whole)
+        links[form].append((m.group(form * 3 + 2), m.group(form * 3 + 3)))
+    for form_links in links:
+        for link in form_links:
+            yield link
+
+def extract_series_list(html):
+    """Extract the series list from the RTDoc serials page in a single regex scan.
+    
+    Returns Series(title, url) tuples, with absolute URLs.
+    """
+    seen = set()
+    series = []
+    for url, title in _series_links(html):
+        title = title.strip()
+        # Filter out navigation and very short titles
+        if len(title) <= 3 or title.lower() in NAVIGATION_TITLES:
+            continue
+        # Relative links such as /serials/123-title
+        if not url.startswith('http'):
+            url = 'https://en.rtdoc.tv' + url if url.startswith('/') else 'https://en.rtdoc.tv/' + url
+        if url not in seen:
+            seen.add(url)
+            series.append(Series(title, url))
+    
+    if _debug_logging():
+        for item in series:
+            xbmc.log("NextGen RT TV Series - Found series: %s -> %s" % (item.title, item.url), xbmc.LOGDEBUG)
+        xbmc.log("NextGen RT TV Series - Found %d unique series" % len(series), xbmc.LOGDEBUG)
+    
+    return series
+
+_SEASON_HEADER = re.compile(r'(\d+)\s+Season', re.IGNORECASE)
+_SEASON_HEADER_BYTES = re.compile(br'(\d+)\s+Season', re.IGNORECASE)
+_EPISODE_NUMBER = re.compile(r'Episode\s+(\d+)', re.IGNORECASE)
+
+class _EpisodeParser(HTMLParser):
+    """Walks a series page once, collecting episode links under their season.
+
+    Text outside links that reads like "2 Season" switches the current
+    season. Each link to an /episodes/ page becomes an episode titled by its
+    own link text; a URL linked several times (e.g. a thumbnail and a title)
+    is kept once, at its first position, with the first non-empty title.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.season = None
+        self.seasons_seen = []
+        self.episodes = {}
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        self._finish_link()
+        for name, value in attrs:
+            if name == 'href' and value and '/episodes/' in value:
+                self._href = value
+                self._text = []
+                break
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._finish_link()
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+            return
+        m = _SEASON_HEADER.search(data)
+        if m:
+            self.season = int(m.group(1))
+            self.seasons_seen.append(self.season)
+
+    def _finish_link(self):
+        url, self._href = self._href, None
+        if url is None:
+            return
+        if url.startswith('/'):
+            url = 'https://en.rtdoc.tv' + url
+        title = ' '.join(''.join(self._text).split())
+        record = self.episodes.get(url)
+        if record is None:
+            self.episodes[url] = [self.season or 1, title]
+        elif not record[1]:
+            record[1] = title
+
+    def close(self):
+        HTMLParser.close(self)
+        self._finish_link()
+
+def episodes_region(html):
+    """Return the part of a series page that holds its season headers and episode links.
+
+    Everything before the first season header or episode link and after the
+    last episode link (scripts, tokens, the footer) is left out, so a page
+    whose episode list did not change keeps its fingerprint. The region
+    covers every link parse_episodes() looks at.
+    A page without episode links is returned whole.
+
+    html may also be the undecoded bytes of the page, so that an unchanged
+    page can be recognised without decoding it.
+    """
+    if isinstance(html, str):
+        marker, season_header, tag_open, tag_close = '/episodes/', _SEASON_HEADER, '<', '</a>'
+    else:
+        marker, season_header, tag_open, tag_close = b'/episodes/', _SEASON_HEADER_BYTES, b'<', b'</a>'
+    first = html.find(marker)
+    if first < 0:
+        return html
+    header = season_header.search(html, 0, first)
+    start = html.rfind(tag_open, 0, header.start() if header else first)
+    last = html.rfind(marker)
+    end = html.find(tag_close, last)
+    return html[max(start, 0):end + 4 if end >= 0 else len(html)]
+
+def parse_episodes(html):
+    """Return (season, episode, title, url) tuples for every episode on a series page.
+
+    The page is tokenized once, so the time taken grows linearly with its
+    size. episode is None when the title carries no "Episode N".
+    """
+    parser = _EpisodeParser()
+    parser.feed(html)
+    parser.close()
+    _log("Found season headers: %s", parser.seasons_seen)
+    episodes = []
+    for url, (season, title) in parser.episodes.items():
+        if not title:
+            continue
+        m = _EPISODE_NUMBER.search(title)
+        episodes.append((season, int(m.group(1)) if m else None, title, url))
+    return episodes
+
+def extract_episodes_list(html):
+    """Extract episodes list from a series page with season info.
+    
+    Returns episode dicts with title, url, episode and season, in page order.
+    """
+    episodes = [{'title': title, 'url': url, 'episode': episode, 'season': season}
+                for season, episode, title, url in parse_episodes(html)]
+    
+    # Log what we extracted
+    if _debug_logging():
+        unique_seasons = sorted(set(ep['season'] for ep in episodes))
+        xbmc.log("NextGen RT TV Series - extract_episodes_list: extracted %d episodes with seasons %s" % (len(episodes), str(unique_seasons)), xbmc.LOGDEBUG)
+    
+    return episodes
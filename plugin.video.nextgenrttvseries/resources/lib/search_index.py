@@ -0,0 +1,225 @@
+"""Inverted index of the catalog for the search route, kept in the addon profile.
+
+Every series and episode is a document with a number. Its title and the
+last segment of its URL are split into lower-case word tokens, and each
+token maps to the numbers of the documents holding it. The tokens are
+stored sorted, so every word of a query is looked up as a prefix with
+bisect: "sov wa" finds "Soviet war river". A query answers from this one
+file with no network access and no page parsing.
+
+The index is updated per page as pages are parsed: index_series_list()
+with the catalog page, index_episodes() with each series page, replacing
+what the same page contributed before. Numbers of removed documents are
+left unused until the next save() finds enough of them to renumber.
+
+The plugin and the library sync service both update the index, so save()
+reloads the file and replays the pages indexed since it was loaded onto
+it, as the stream cache merges its entries; pages the other wrote in the
+meantime are kept.
+"""
+import bisect
+import re
+
+from nextgenrt_core import storage
+
+SEARCH_FILE = 'search_index.json'
+
+# Bumped whenever tokenizing changes, so an older index is rebuilt
+INDEX_VERSION = 1
+
+# Results returned for one query
+MAX_RESULTS = 200
+
+# Shortest query word looked up; one letter would match most of the catalog
+MIN_PREFIX = 2
+
+SERIES = 's'
+EPISODE = 'e'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+def tokens(text):
+    """Return the lower-case words of text."""
+    return _WORD.findall(text.lower())
+
+def _url_tokens(url):
+    """Words of the last URL segment; numbers there are ids and episode positions, not words."""
+    return [token for token in tokens(url.rstrip('/').rsplit('/', 1)[-1].replace('_', '-'))
+            if not token.isdigit()]
+
+def _doc_tokens(doc):
+    return set(tokens(doc[1])).union(_url_tokens(doc[2]))
+
+class SearchIndex(object):
+    """Token -> document number postings over series and episodes.
+
+    A document is [kind, title, URL, series URL, season, episode], kind
+    being SERIES or EPISODE; series documents have no series URL, season or
+    episode.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._load()
+        # (SERIES, None, series list) and (EPISODE, series URL, episodes) indexed since the load
+        self._changes = []
+
+    def _load(self):
+        record = storage.read_json(self.path, default={})
+        if not isinstance(record, dict) or record.get('version') != INDEX_VERSION:
+            record = {}
+        self._docs = record.get('docs', [])
+        self._terms = [term for term, _ in record.get('terms', [])]
+        self._postings = dict((term, ids) for term, ids in record.get('terms', []))
+        # series URL -> document number of the series, and of its episodes
+        self._series = {}
+        self._episodes = {}
+        for number, doc in enumerate(self._docs):
+            if doc is None:
+                continue
+            if doc[0] == SERIES:
+                self._series[doc[2]] = number
+            else:
+                self._episodes.setdefault(doc[3], []).append(number)
+
+    @classmethod
+    def open(cls):
+        """Open the index stored in the addon profile directory."""
+        return cls(storage.profile_path(SEARCH_FILE))
+
+    def is_empty(self):
+        return not self._series and not self._episodes
+
+    def _add(self, doc):
+        number = len(self._docs)
+        self._docs.append(doc)
+        for token in _doc_tokens(doc):
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = [number]
+                bisect.insort(self._terms, token)
+            else:
+                postings.append(number)
+        return number
+
+    def _remove(self, number):
+        doc = self._docs[number]
+        self._docs[number] = None
+        for token in _doc_tokens(doc):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.remove(number)
+            if not postings:
+                del self._postings[token]
+                del self._terms[bisect.bisect_left(self._terms, token)]
+
+    def index_series_list(self, series_list):
+        """Index the series of a parsed catalog page; series no longer listed are dropped with their episodes."""
+        series_list = list(series_list)
+        if self._index_series_list(series_list):
+            self._changes.append((SERIES, None, series_list))
+
+    def index_episodes(self, series_url, episodes):
+        """Index the episode dicts of a parsed series page, replacing the ones indexed before."""
+        episodes = list(episodes)
+        self._index_episodes(series_url, episodes)
+        self._changes.append((EPISODE, series_url, episodes))
+
+    def _index_series_list(self, series_list):
+        """Return whether the series list differs from the one indexed."""
+        changed = False
+        listed = set()
+        for series in series_list:
+            listed.add(series.url)
+            number = self._series.get(series.url)
+            if number is not None:
+                if self._docs[number][1] == series.title:
+                    continue
+                self._remove(number)
+            self._series[series.url] = self._add([SERIES, series.title, series.url, None, None, None])
+            changed = True
+        for url in [url for url in self._series if url not in listed]:
+            self._remove(self._series.pop(url))
+            for number in self._episodes.pop(url, []):
+                self._remove(number)
+            changed = True
+        return changed
+
+    def _index_episodes(self, series_url, episodes):
+        for number in self._episodes.pop(series_url, []):
+            self._remove(number)
+        self._episodes[series_url] = [
+            self._add([EPISODE, episode['title'], episode['url'], series_url,
+                       episode.get('season', 1), episode.get('episode')])
+            for episode in episodes]
+
+    def _matches(self, prefix):
+        """Return the set of document numbers holding a token that starts with prefix."""
+        terms = self._terms
+        found = set()
+        at = bisect.bisect_left(terms, prefix)
+        while at < len(terms) and terms[at].startswith(prefix):
+            found.update(self._postings[terms[at]])
+            at += 1
+        return found
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return the documents matching every word of query as a prefix, series first.
+
+        Each result is (kind, title, URL, series title, season, episode);
+        series title is None for series.
+        """
+        words = [word for word in tokens(query) if len(word) >= MIN_PREFIX]
+        if not words:
+            return []
+        # Rarest word first, so the intersection shrinks quickly
+        found = None
+        for matches in sorted((self._matches(word) for word in words), key=len):
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        results = []
+        for number in sorted(found, key=lambda n: (self._docs[n][0] != SERIES, n))[:limit]:
+            kind, title, url, series_url, season, episode = self._docs[number]
+            series_title = None
+            if kind == EPISODE:
+                series_number = self._series.get(series_url)
+                series_title = self._docs[series_number][1] if series_number is not None else None
+            results.append((kind, title, url, series_title, season, episode))
+        return results
+
+    def _compact(self):
+        """Renumber the documents without the holes left by removed ones."""
+        renumber = {}
+        docs = []
+        for number, doc in enumerate(self._docs):
+            if doc is not None:
+                renumber[number] = len(docs)
+                docs.append(doc)
+        self._docs = docs
+        for token, postings in self._postings.items():
+            self._postings[token] = [renumber[number] for number in postings]
+        self._series = dict((url, renumber[number]) for url, number in self._series.items())
+        self._episodes = dict((url, [renumber[number] for number in numbers])
+                              for url, numbers in self._episodes.items())
+
+    def save(self):
+        """Replay the pages indexed here onto the index on disk and write it, if any were."""
+        if not self._changes:
+            return
+        changes, self._changes = self._changes, []
+        self._load()
+        for kind, series_url, items in changes:
+            if kind == SERIES:
+                self._index_series_list(items)
+            else:
+                self._index_episodes(series_url, items)
+        holes = sum(1 for doc in self._docs if doc is None)
+        if holes * 2 > len(self._docs):
+            self._compact()
+        storage.write_json(self.path, {
+            'version': INDEX_VERSION,
+            'docs': self._docs,
+            'terms': [[term, self._postings[term]] for term in self._terms],
+        })
@@ -0,0 +1,72 @@
+"""Background service keeping the local catalog library in sync.
+
+Runs inside Kodi for the whole session: syncs shortly after start-up if
+the library is older than the configured interval, then again every
+interval until Kodi shuts down.
+"""
+import time
+
+import xbmc
+import xbmcaddon
+
+from nextgenrt_core import httpclient
+from nextgenrt_core import resolver
+from resources.lib import httpcache
+from resources.lib import library
+from resources.lib import search_index
+from resources.lib import sync
+
+# Seconds to wait after Kodi starts before the first sync
+STARTUP_DELAY = 30
+
+DEFAULT_INTERVAL_HOURS = 12
+
+def _settings():
+    """Return (sync enabled, sync interval in seconds) from the addon settings."""
+    addon = xbmcaddon.Addon()
+    enabled = addon.getSetting('library_sync') != 'false'
+    try:
+        hours = int(addon.getSetting('library_sync_interval'))
+    except ValueError:
+        hours = DEFAULT_INTERVAL_HOURS
+    return enabled, max(1, hours) * 3600
+
+def _sync_once(monitor):
+    client = httpclient.HttpClient()
+    http_cache = httpcache.HttpCache.open(client)
+    db = library.Library.open()
+    try:
+        sync.sync(db, lambda url: http_cache.get(url, max_bytes=resolver.MAX_PAGE_BYTES), monitor=monitor,
+                  search=search_index.SearchIndex.open())
+    except Exception as e:
+        xbmc.log("NextGen RT TV Series - Library sync failed: %s" % str(e), xbmc.LOGERROR)
+    finally:
+        db.close()
+        client.close()
+
+def _last_sync():
+    db = library.Library.open()
+    try:
+        return float(db.get_meta(sync.LAST_SYNC_KEY, 0))
+    finally:
+        db.close()
+
+def run():
+    """Service entry point, returns when Kodi asks the service to stop."""
+    monitor = xbmc.Monitor()
+    xbmc.log("NextGen RT TV Series - Library service started", xbmc.LOGINFO)
+    if monitor.waitForAbort(STARTUP_DELAY):
+        return
+    while not monitor.abortRequested():
+        enabled, interval = _settings()
+        wait = interval
+        if enabled:
+            due = _last_sync() + interval
+            if time.time() >= due:
+                _sync_once(monitor)
+            else:
+                wait = due - time.time()
+        # Settings may change while waiting; re-read them at least hourly
+        if monitor.waitForAbort(min(wait, 3600)):
+            break
+    xbmc.log("NextGen RT TV Series - Library service stopped", xbmc.LOGINFO)
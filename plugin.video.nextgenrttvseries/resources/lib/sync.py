@@ -0,0 +1,104 @@
+"""Crawl the rtdoc.tv catalog into the local library.
+
+The serials page is fetched first; its series list is only re-parsed when
+the page changed at all, since any link on it may add or drop a series.
+Series pages are then crawled concurrently on the asyncio loop thread
+(nextgenrt_core.aio), a few per host at a time, and each one is only
+re-parsed when its hash differs from the one stored with its episodes; the
+library records the episodes a changed page added as new. All database
+writes happen on the calling thread, so the SQLite connection is never
+shared between threads. Parsed pages also update the search index, when
+one is given.
+"""
+import hashlib
+import time
+
+import xbmc
+
+from nextgenrt_core import aio
+from resources.lib import episode_index
+from resources.lib import scraper
+
+# Series pages fetched at the same time; they all live on one host
+MAX_WORKERS = 4
+
+SERIALS_HASH_KEY = 'serials_hash'
+LAST_SYNC_KEY = 'last_sync'
+
+def _serials_hash(body):
+    """Fingerprint of the whole serials page, given as UTF-8 bytes.
+
+    episode_index.content_hash() only covers the episode list of a series
+    page, which the serials page does not have.
+    """
+    return hashlib.sha1(body).hexdigest()
+
+def _fetch_page(fetch, url):
+    """Return (body bytes, page hash) of a series page; the body is only decoded if the page changed."""
+    body = fetch(url)
+    return body, episode_index.content_hash(body)
+
+def sync(library, fetch, workers=MAX_WORKERS, monitor=None, search=None):
+    """Bring the library up to date with the live catalog.
+
+    fetch(url) returns a page body as bytes. monitor, if given, is an
+    xbmc.Monitor; the crawl stops early once Kodi asks to quit. search, if
+    given, is a search_index.SearchIndex that is updated with every parsed
+    page and saved at the end. Returns the number of series whose episodes
+    were re-parsed. LAST_SYNC_KEY is only stamped when every series page was
+    crawled and none failed to fetch, so a sync cut short or failing runs
+    again at the next start-up.
+    """
+    start = time.time()
+    body = fetch(scraper.SERIALS_URL)
+    serials_hash = _serials_hash(body)
+    if serials_hash != library.get_meta(SERIALS_HASH_KEY) or library.is_empty():
+        series_list = scraper.extract_series_list(body.decode('utf-8'))
+        if not series_list:
+            xbmc.log("NextGen RT TV Series - Sync found no series, keeping the library as it is", xbmc.LOGWARNING)
+            return 0
+        library.replace_series_list(series_list)
+        if search is not None:
+            search.index_series_list(series_list)
+        library.set_meta(SERIALS_HASH_KEY, serials_hash)
+
+    known_hashes = library.page_hashes()
+    updated = new_episodes = crawled = failed = 0
+    pages = aio.crawl(known_hashes, lambda url: _fetch_page(fetch, url),
+                      per_host=workers, max_workers=workers, monitor=monitor)
+    try:
+        for url, result, error in pages:
+            if monitor is not None and monitor.abortRequested():
+                break
+            crawled += 1
+            if error is not None:
+                failed += 1
+                xbmc.log("NextGen RT TV Series - Sync failed to fetch %s: %s" % (url, str(error)), xbmc.LOGWARNING)
+                continue
+            body, page_hash = result
+            if page_hash == known_hashes[url]:
+                continue
+            episodes = scraper.extract_episodes_list(body.decode('utf-8'))
+            added, removed = library.replace_episodes(url, page_hash, episodes)
+            if search is not None:
+                search.index_episodes(url, episodes)
+            new_episodes += len(added)
+            updated += 1
+    finally:
+        # Cancels the fetches still waiting when the crawl stops early
+        pages.close()
+
+    if search is not None:
+        search.save()
+    if crawled < len(known_hashes):
+        xbmc.log("NextGen RT TV Series - Library sync stopped after %d of %d series, %d updated" % (
+            crawled, len(known_hashes), updated), xbmc.LOGINFO)
+        return updated
+    if failed:
+        xbmc.log("NextGen RT TV Series - Library sync failed to fetch %d of %d series, %d updated" % (
+            failed, len(known_hashes), updated), xbmc.LOGWARNING)
+        return updated
+    library.set_meta(LAST_SYNC_KEY, str(time.time()))
+    xbmc.log("NextGen RT TV Series - Library sync: %d series, %d updated, %d new episodes in %.1fs" % (
+        len(known_hashes), updated, new_episodes, time.time() - start), xbmc.LOGINFO)
+    return updated
@@ -0,0 +1,311 @@
+"""asyncio resolution and crawling on a loop confined to one thread.
+
+The event loop runs on a daemon thread of its own (LoopThread) and every
+coroutine runs there; plugin code stays synchronous and hands work over
+with LoopThread.run(), or the crawl() and resolve() facades.
+
+The standard library has no asyncio HTTP client, and HttpClient already
+does keep-alive, decompression, retries and timing, so requests still go
+through it on a bounded thread pool. The loop decides what runs when:
+Fetcher allows a few requests per host at a time, and a cancelled fetch
+stops reading at the next chunk and drops its connection.
+
+AsyncResolver fetches a page once, then races its stream candidates: the
+master playlist of every direct candidate and the chain of every embedded
+player are fetched at the same time. The first candidate that proves
+playable wins and the rest are cancelled.
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import xbmc
+
+# Blocking requests running at the same time, all hosts together
+MAX_WORKERS = 8
+
+# Requests to one host running at the same time
+PER_HOST_LIMIT = 3
+
+# Seconds a synchronous caller waits for a coroutine on the loop
+RUN_TIMEOUT = 30
+
+# Seconds crawl() waits for the next fetch to finish before checking for abort again
+CRAWL_POLL = 0.5
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+class LoopThread(object):
+    """An event loop running forever on its own daemon thread."""
+
+    def __init__(self, name='nextgenrt-aio'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=RUN_TIMEOUT):
+        """Run coro on the loop, wait for it and return its result.
+
+        The coroutine is cancelled if it does not finish within timeout.
+        Must not be called from the loop thread itself.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('LoopThread.run() called from the loop thread')
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def call(self, func, *args):
+        """Call func(*args) on the loop thread without waiting for it."""
+        self.loop.call_soon_threadsafe(func, *args)
+
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+def loop_thread():
+    """Return the process-wide LoopThread, starting it on first use."""
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = LoopThread()
+    return _loop_thread
+
+class Fetcher(object):
+    """Runs blocking requests from coroutines, at most per_host per host at a time.
+
+    Only coroutines on one loop may use a Fetcher; the per-host semaphores
+    belong to that loop.
+    """
+
+    def __init__(self, client, max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT):
+        self.client = client
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='nextgenrt-aio-fetch')
+        self._limits = {}
+
+    def _limit(self, url):
+        host = _host(url)
+        limit = self._limits.get(host)
+        if limit is None:
+            limit = self._limits[host] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def call(self, url, func, *args):
+        """Run func(*args) on the pool within the per-host limit of url."""
+        async with self._limit(url):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _read(self, url, max_bytes, cancelled):
+        chunks = []
+        with self.client.open(url) as response:
+            for data in response.iter_content(max_bytes=max_bytes):
+                if cancelled.is_set():
+                    # Closing a partly read response drops its connection
+                    return None
+                chunks.append(data)
+        return b''.join(chunks)
+
+    async def get(self, url, max_bytes=None):
+        """Return the body of url as bytes, at most max_bytes of it."""
+        cancelled = threading.Event()
+        try:
+            return await self.call(url, self._read, url, max_bytes, cancelled)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def text(self, url, max_bytes=None):
+        """Return the body of url decoded as UTF-8."""
+        return (await self.get(url, max_bytes)).decode('utf-8', 'replace')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+async def first_success(coros):
+    """Return the first truthy result of coros and cancel the others.
+
+    Exceptions count as failures. Returns None if none succeeds.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                continue
+            if result:
+                return result
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def crawl(urls, fetch, per_host=PER_HOST_LIMIT, max_workers=MAX_WORKERS, monitor=None):
+    """Fetch every url with the blocking fetch(url) and yield (url, body, error) as each finishes.
+
+    error is the exception fetch raised, or None. monitor, if given, is an
+    xbmc.Monitor; waiting for the next fetch stops once Kodi asks to quit,
+    even while a fetch hangs. Closing the generator early cancels the
+    fetches that have not started yet.
+    """
+    urls = list(urls)
+    if not urls:
+        return
+    runner = loop_thread()
+    done = queue.Queue()
+    fetcher = Fetcher(None, max_workers=max_workers, per_host=per_host)
+    tasks = []
+
+    async def fetch_one(url):
+        try:
+            done.put((url, await fetcher.call(url, fetch, url), None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            done.put((url, None, e))
+
+    def start():
+        tasks.extend(runner.loop.create_task(fetch_one(url)) for url in urls)
+
+    def cancel():
+        for task in tasks:
+            task.cancel()
+
+    runner.call(start)
+    try:
+        remaining = len(urls)
+        while remaining:
+            try:
+                item = done.get(timeout=CRAWL_POLL)
+            except queue.Empty:
+                if monitor is not None and monitor.abortRequested():
+                    return
+                continue
+            remaining -= 1
+            yield item
+    finally:
+        runner.call(cancel)
+        fetcher.close()
+
+class AsyncResolver(object):
+    """Resolves pages for a resolver.Resolver with concurrent follow-up fetches.
+
+    Uses the Resolver's HTTP client, stream prober memory and logging. The
+    master playlist of the winning stream is handed to the HLS playlist
+    cache, so playing it does not fetch it a second time.
+    """
+
+    def __init__(self, resolver, max_page_bytes=None, per_host=PER_HOST_LIMIT):
+        self.resolver = resolver
+        self.max_page_bytes = max_page_bytes
+        self.fetcher = Fetcher(resolver.http(), per_host=per_host)
+
+    async def _playlist(self, url):
+        """Return (url, playlist body) if url answers with an HLS playlist."""
+        memory = self.resolver.prober().memory
+        start = time.time()
+        try:
+            body = await self.fetcher.get(url)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            memory.record(_host(url), None)
+            raise
+        ok = body is not None and body.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U')
+        memory.record(_host(url), time.time() - start if ok else None)
+        return (url, body) if ok else None
+
+    async def _direct(self, url):
+        """Return (url, playlist or None) if a direct candidate is playable."""
+        if '.m3u8' in url:
+            return await self._playlist(url)
+        latency = await self.fetcher.call(url, self.resolver.prober().probe, url)
+        return (url, None) if latency is not None else None
+
+    async def _iframe(self, iframe_url):
+        """Follow an embedded player and return its first playable stream."""
+        from nextgenrt_core import extract
+        from nextgenrt_core import probe
+        if 'rumble.com' in iframe_url:
+            self.resolver.log("Found Rumble iframe but cannot extract stream directly", level=xbmc.LOGWARNING)
+            return None
+        if not iframe_url.startswith('http'):
+            iframe_url = 'https:' + iframe_url
+        self.resolver.log("Found iframe, fetching: %s", iframe_url)
+        page = await self.fetcher.get(iframe_url, self.max_page_bytes)
+        urls = [probe.normalize(c.url) for c in extract.M3U8_ONLY.candidates(page)]
+        return await first_success(self._playlist(url) for url in urls if url)
+
+    async def resolve(self, page_url, extractor):
+        """Return (stream URL, master playlist body or None), or None."""
+        from nextgenrt_core import probe
+        # Scanned undecoded; only the matched URLs are decoded
+        page = await self.fetcher.get(page_url, self.max_page_bytes)
+        self.resolver.log_page_memory(page_url, len(page))
+        candidates = extractor.candidates(page)
+        direct = []
+        for candidate in candidates:
+            url = probe.normalize(candidate.url) if candidate.rule != 'iframe' else None
+            if url and url not in direct:
+                direct.append(url)
+
+        # A host that answered healthily a moment ago needs no new check
+        for url in direct:
+            if self.resolver.prober().known_healthy(url):
+                return url, None
+
+        iframe_errors = []
+
+        async def iframe(url):
+            try:
+                return await self._iframe(url)
+            except EnvironmentError as e:
+                iframe_errors.append(e)
+                raise
+
+        self.resolver.log("Racing %d stream candidates", len(candidates))
+        racers = [self._direct(url) for url in direct]
+        racers.extend(iframe(c.url) for c in candidates if c.rule == 'iframe')
+        winner = await first_success(racers)
+        if winner is None and direct:
+            self.resolver.log("No stream candidate answered the probe, using the first", level=xbmc.LOGWARNING)
+            return direct[0], None
+        # An embed that could not be fetched says nothing about the page
+        if winner is None and iframe_errors:
+            raise iframe_errors[0]
+        if winner is not None:
+            self.resolver.log("First playable stream: %s", winner[0])
+        return winner
+
+    def close(self):
+        self.fetcher.close()
+
+def resolve(resolver, page_url, extractor, max_page_bytes=None, timeout=RUN_TIMEOUT):
+    """Synchronous facade: resolve page_url on the loop thread and return the stream URL or None."""
+    async_resolver = AsyncResolver(resolver, max_page_bytes)
+    try:
+        result = loop_thread().run(async_resolver.resolve(page_url, extractor), timeout)
+    finally:
+        async_resolver.close()
+    if not result:
+        return None
+    stream_url, playlist = result
+    resolver.prober().memory.save()
+    if playlist is not None:
+        from nextgenrt_core import hls
+        hls.PlaylistCache.open().variants(stream_url, lambda url: playlist)
+    return stream_url
@@ -0,0 +1,174 @@
+"""Negative caching and per-host circuit breaking for page resolution.
+
+A page that was fetched but holds no playable stream (only a Rumble
+iframe, a 404) is remembered for a short while, so the next click does not
+download and scan it again just to fail the same way.
+
+Hosts that fail to answer (timeouts, refused connections, 5xx) get a
+circuit breaker. After FAILURE_THRESHOLD consecutive failures the circuit
+opens and resolutions on that host fail at once. When the open period has
+passed the circuit is half-open: the next resolution is let through as a
+trial, which closes the circuit on success or reopens it for twice as
+long on failure. The channel list prefetches every page in the
+background, so that is usually where the trial happens.
+
+State is kept in the addon profile and merged on save(), so concurrent
+invocations share it.
+"""
+import threading
+import time
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from nextgenrt_core import storage
+
+AVAILABILITY_FILE = 'availability.json'
+
+# Seconds a page without a playable stream is not fetched again
+NEGATIVE_TTL = 10 * 60
+
+# Consecutive failures of a host before its circuit opens
+FAILURE_THRESHOLD = 3
+
+# Seconds a circuit stays open after it first opens, doubled on every failed trial
+OPEN_SECONDS = 60
+MAX_OPEN_SECONDS = 30 * 60
+
+# Seconds a half-open trial holds the circuit before another one is let through
+TRIAL_SECONDS = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+def _host(page_url):
+    return urlparse(page_url).netloc.lower()
+
+class Availability(object):
+    """Negative results per page URL and circuit breakers per host.
+
+    pages maps a page URL to [reason, expiry time]; hosts maps a host to
+    [consecutive failures, time the circuit may next be tried, open period].
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pages, self._hosts = self._load()
+        self._dirty_pages = set()
+        self._dirty_hosts = set()
+
+    @classmethod
+    def open(cls):
+        """Open the state stored in the addon profile directory."""
+        return cls(storage.profile_path(AVAILABILITY_FILE))
+
+    def _load(self):
+        data = storage.read_json(self.path, default={})
+        if not isinstance(data, dict):
+            data = {}
+        pages = data.get('pages')
+        hosts = data.get('hosts')
+        return (pages if isinstance(pages, dict) else {},
+                hosts if isinstance(hosts, dict) else {})
+
+    def state(self, host, now=None):
+        """Return CLOSED, OPEN or HALF_OPEN for a host."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._state(self._hosts.get(host), now)
+
+    def _state(self, entry, now):
+        if entry is None or entry[0] < FAILURE_THRESHOLD:
+            return CLOSED
+        return OPEN if now < entry[1] else HALF_OPEN
+
+    def unavailable(self, page_url, now=None):
+        """Return why page_url is currently unavailable, or None.
+
+        Only reads the state, so the channel list can mark channels without
+        fetching them or claiming a half-open trial.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._pages.get(page_url)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            if self._state(self._hosts.get(_host(page_url)), now) == OPEN:
+                return 'host down'
+        return None
+
+    def check(self, page_url, now=None):
+        """Return why page_url must not be fetched now, or None to go ahead.
+
+        A half-open host lets this call through as its trial and holds the
+        circuit for TRIAL_SECONDS, so concurrent resolutions keep failing
+        fast until the trial reports back.
+        """
+        now = time.time() if now is None else now
+        host = _host(page_url)
+        with self._lock:
+            entry = self._pages.get(page_url)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            state = self._state(self._hosts.get(host), now)
+            if state == OPEN:
+                return 'host down'
+            if state == HALF_OPEN:
+                self._hosts[host][1] = now + TRIAL_SECONDS
+                self._dirty_hosts.add(host)
+        return None
+
+    def remember_missing(self, page_url, reason, ttl=NEGATIVE_TTL, now=None):
+        """Record that page_url answered without a playable stream."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._pages[page_url] = [reason, now + ttl]
+            self._dirty_pages.add(page_url)
+            self._close(_host(page_url))
+
+    def record_success(self, page_url):
+        """Record that page_url resolved to a stream, closing its host's circuit."""
+        with self._lock:
+            if self._pages.pop(page_url, None) is not None:
+                self._dirty_pages.add(page_url)
+            self._close(_host(page_url))
+
+    def record_failure(self, page_url, now=None):
+        """Record that the host of page_url did not answer."""
+        now = time.time() if now is None else now
+        host = _host(page_url)
+        with self._lock:
+            failures, _, open_for = self._hosts.get(host) or [0, 0, 0]
+            failures += 1
+            if failures >= FAILURE_THRESHOLD:
+                # A failed trial reopens the circuit for longer than the last time
+                open_for = min(open_for * 2, MAX_OPEN_SECONDS) if open_for else OPEN_SECONDS
+            self._hosts[host] = [failures, now + open_for, open_for]
+            self._dirty_hosts.add(host)
+
+    def _close(self, host):
+        if self._hosts.pop(host, None) is not None:
+            self._dirty_hosts.add(host)
+
+    def save(self):
+        """Merge local changes into the state file, dropping expired pages."""
+        now = time.time()
+        with self._lock:
+            if not self._dirty_pages and not self._dirty_hosts:
+                return
+            pages, hosts = self._load()
+            for merged, local, dirty in ((pages, self._pages, self._dirty_pages),
+                                         (hosts, self._hosts, self._dirty_hosts)):
+                for key in dirty:
+                    if key in local:
+                        merged[key] = local[key]
+                    else:
+                        merged.pop(key, None)
+            pages = dict((url, entry) for url, entry in pages.items() if entry[1] > now)
+            storage.write_json(self.path, {'pages': pages, 'hosts': hosts})
+            self._pages, self._hosts = pages, hosts
+            self._dirty_pages.clear()
+            self._dirty_hosts.clear()
@@ -0,0 +1,200 @@
+"""Disk-backed cache of resolved stream URLs.
+
+Maps a page URL to the stream URL it resolved to, so a warm play skips the
+page download and extraction entirely. An entry also remembers the HLS
+variant picked for the stream_quality setting, so a warm play needs no
+master playlist either. Entries expire after a per-host TTL and the least
+recently used entries are evicted once the cache is full.
+
+A cached URL that Kodi fails to play is dropped lazily: when the same page
+is played again within RETRY_WINDOW of being handed over from the cache
+and nothing is playing, the user is retrying a stream that did not start,
+so the page is resolved afresh. No invocation waits for playback to start.
+"""
+import threading
+import time
+from collections import OrderedDict
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from nextgenrt_core import storage
+
+CACHE_FILE = 'stream_cache.json'
+
+# Maximum number of page URLs kept before the least recently used are evicted
+MAX_ENTRIES = 200
+
+# Seconds a resolved stream URL stays valid, per page host
+DEFAULT_TTL = 30 * 60
+HOST_TTLS = {
+    'www.rt.com': 6 * 60 * 60,
+    'rtd.rt.com': 6 * 60 * 60,
+    'actualidad.rt.com': 6 * 60 * 60,
+    'arabic.rt.com': 6 * 60 * 60,
+    'de.rt.com': 6 * 60 * 60,
+    'francais.rt.com': 6 * 60 * 60,
+    'rt.rs': 6 * 60 * 60,
+    'en.rtdoc.tv': 2 * 60 * 60,
+}
+
+HANDOFF_FILE = 'last_handoff.json'
+
+# Seconds after a cached URL was handed to Kodi during which playing the same
+# page again, with nothing playing, counts as that URL having failed
+RETRY_WINDOW = 120
+
+def ttl_for(page_url):
+    """Return the TTL in seconds for a page URL based on its host."""
+    return HOST_TTLS.get(urlparse(page_url).netloc.lower(), DEFAULT_TTL)
+
+class StreamCache(object):
+    """LRU map of page URL -> resolved stream URL persisted in the profile.
+
+    Entries are kept in least- to most-recently-used order, both in memory
+    and on disk, as [page URL, stream URL, expiry time] or, once a variant
+    was picked, [..., [quality, URL to play, ListItem properties]]. Changes
+    are merged into the file on save() so concurrent invocations do not drop
+    each other's entries.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = set()
+        self._removed = set()
+
+    @classmethod
+    def open(cls):
+        """Open the cache stored in the addon profile directory."""
+        return cls(storage.profile_path(CACHE_FILE))
+
+    def _load(self):
+        data = storage.read_json(self.path, default=[])
+        entries = OrderedDict()
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, list) and len(item) == 3:
+                    entries[item[0]] = (item[1], item[2], None)
+                elif isinstance(item, list) and len(item) == 4 and isinstance(item[3], list) and len(item[3]) == 3:
+                    entries[item[0]] = (item[1], item[2], item[3])
+        return entries
+
+    def get(self, page_url, now=None):
+        """Return the cached stream URL for page_url, or None if absent or expired."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(page_url)
+            if entry is None:
+                return None
+            stream_url, expires, _ = entry
+            if expires <= now:
+                self._remove(page_url)
+                return None
+            self._entries.move_to_end(page_url)
+            self._dirty.add(page_url)
+            return stream_url
+
+    def put(self, page_url, stream_url, ttl=None, now=None):
+        """Store a resolved stream URL for page_url."""
+        now = time.time() if now is None else now
+        ttl = ttl_for(page_url) if ttl is None else ttl
+        with self._lock:
+            self._entries[page_url] = (stream_url, now + ttl, None)
+            self._entries.move_to_end(page_url)
+            self._dirty.add(page_url)
+            self._removed.discard(page_url)
+            self._evict(self._entries)
+
+    def variant(self, page_url, stream_url, quality):
+        """Return (URL to play, ListItem properties) picked for stream_url at quality, or None."""
+        with self._lock:
+            entry = self._entries.get(page_url)
+        if entry is None or entry[0] != stream_url or entry[2] is None or entry[2][0] != quality:
+            return None
+        return entry[2][1], dict(entry[2][2])
+
+    def set_variant(self, page_url, stream_url, quality, play_url, properties):
+        """Remember the variant picked for the cached stream_url of page_url."""
+        with self._lock:
+            entry = self._entries.get(page_url)
+            if entry is None or entry[0] != stream_url:
+                return
+            self._entries[page_url] = (entry[0], entry[1], [quality, play_url, properties])
+            self._dirty.add(page_url)
+
+    def invalidate(self, page_url):
+        """Drop the entry for page_url, e.g. because its stream failed to play."""
+        with self._lock:
+            self._remove(page_url)
+
+    def _remove(self, page_url):
+        self._entries.pop(page_url, None)
+        self._dirty.discard(page_url)
+        self._removed.add(page_url)
+
+    def _evict(self, entries):
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def save(self):
+        """Merge local changes into the cache file."""
+        with self._lock:
+            if not self._dirty and not self._removed:
+                return
+            merged = self._load()
+            for page_url in self._removed:
+                merged.pop(page_url, None)
+            for page_url, entry in self._entries.items():
+                if page_url in self._dirty:
+                    merged.pop(page_url, None)
+                    merged[page_url] = entry
+            self._evict(merged)
+            storage.write_json(self.path, [[k, v[0], v[1]] + ([v[2]] if v[2] else [])
+                                           for k, v in merged.items()])
+            self._entries = merged
+            self._dirty.clear()
+            self._removed.clear()
+
+    def resolve(self, page_url, resolver):
+        """Return (stream_url, from_cache), calling resolver(page_url) on a miss."""
+        stream_url = self.get(page_url)
+        if stream_url:
+            self.save()
+            return stream_url, True
+        stream_url = resolver(page_url)
+        if stream_url:
+            self.put(page_url, stream_url)
+            self.save()
+        return stream_url, False
+
+def playing_file():
+    """Return the file Kodi is currently playing, or None."""
+    import xbmc
+    player = xbmc.Player()
+    try:
+        return player.getPlayingFile() if player.isPlaying() else None
+    except RuntimeError:
+        return None
+
+def remember_handoff(page_url, now=None):
+    """Note that a cached stream URL of page_url was just handed to Kodi."""
+    now = time.time() if now is None else now
+    storage.write_json(storage.profile_path(HANDOFF_FILE), [page_url, now])
+
+def forget_handoff():
+    """Forget the last handoff, once it was found to have failed."""
+    storage.write_json(storage.profile_path(HANDOFF_FILE), None)
+
+def handoff_failed(page_url, now=None):
+    """True if page_url is played again soon after a cached URL of it was handed to Kodi, and nothing plays."""
+    now = time.time() if now is None else now
+    record = storage.read_json(storage.profile_path(HANDOFF_FILE))
+    if not isinstance(record, list) or len(record) != 2 or record[0] != page_url:
+        return False
+    if not 0 <= now - record[1] < RETRY_WINDOW:
+        return False
+    return playing_file() is None
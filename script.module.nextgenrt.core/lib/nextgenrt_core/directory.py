@@ -0,0 +1,102 @@
+"""Directory listings built in one pass and handed to Kodi in one call.
+
+A Template holds what the items of one kind have in common (playable or
+folder, genres, media type); Directory.add() turns a record into a
+ListItem from it, and Directory.finish() sets the content type and sort
+methods and submits every item with a single addDirectoryItems call.
+
+Kodi 20 added setters to InfoTagVideo and deprecated ListItem.setInfo;
+Kodi 19 has getVideoInfoTag but no setters. Which one this Kodi has is
+detected once per process instead of being tried on every item.
+"""
+import xbmcgui
+import xbmcplugin
+
+_use_info_tag = None
+
+def _info_tag_setters():
+    """True if InfoTagVideo has setters (Kodi 20+), detected on first use."""
+    global _use_info_tag
+    if _use_info_tag is None:
+        try:
+            tag = xbmcgui.ListItem(offscreen=True).getVideoInfoTag()
+            _use_info_tag = all(hasattr(tag, name) for name in ('setTitle', 'setGenres', 'setEpisode'))
+        except AttributeError:
+            _use_info_tag = False
+    return _use_info_tag
+
+class Template(object):
+    """What the ListItems of one kind of directory entry have in common.
+
+    mediatype is the Kodi media type ('video', 'episode', 'tvshow',
+    'season'); genres are set on every item.
+    """
+
+    def __init__(self, playable=False, folder=False, mediatype='video', genres=()):
+        self.playable = playable
+        self.folder = folder
+        self.mediatype = mediatype
+        self.genres = list(genres)
+
+    def build(self, label, title=None, season=None, episode=None):
+        """Return a new ListItem for one entry."""
+        list_item = xbmcgui.ListItem(label=label, offscreen=True)
+        if self.playable:
+            list_item.setProperty("IsPlayable", "true")
+        title = label if title is None else title
+        if _info_tag_setters():
+            info_tag = list_item.getVideoInfoTag()
+            info_tag.setMediaType(self.mediatype)
+            info_tag.setTitle(title)
+            if self.genres:
+                info_tag.setGenres(self.genres)
+            if season is not None:
+                info_tag.setSeason(season)
+            if episode is not None:
+                info_tag.setEpisode(episode)
+        else:
+            info = {'title': title, 'mediatype': self.mediatype}
+            if self.genres:
+                info['genre'] = self.genres
+            if season is not None:
+                info['season'] = season
+            if episode is not None:
+                info['episode'] = episode
+            list_item.setInfo("video", info)
+        return list_item
+
+class Directory(object):
+    """Collects the entries of one plugin directory.
+
+    content is the Kodi content type ('videos', 'tvshows', 'seasons',
+    'episodes'); sort_methods are xbmcplugin.SORT_METHOD_* values, the
+    first one being the initial order.
+    """
+
+    def __init__(self, handle, content=None, sort_methods=()):
+        self.handle = handle
+        self.content = content
+        self.sort_methods = sort_methods
+        self.items = []
+
+    def add(self, template, url, label, **info):
+        """Add an entry built from template; info is passed on to Template.build()."""
+        self.items.append((url, template.build(label, **info), template.folder))
+
+    def add_item(self, url, list_item, folder=False):
+        """Add a ListItem that was built elsewhere."""
+        self.items.append((url, list_item, folder))
+
+    def __len__(self):
+        return len(self.items)
+
+    def finish(self, succeeded=True):
+        """Hand all entries to Kodi and end the directory."""
+        if succeeded:
+            if self.content:
+                xbmcplugin.setContent(self.handle, self.content)
+            for sort_method in self.sort_methods:
+                xbmcplugin.addSortMethod(self.handle, sort_method)
+            if self.items:
+                xbmcplugin.addDirectoryItems(self.handle, self.items, len(self.items))
+        xbmcplugin.endOfDirectory(self.handle, succeeded)
@@ -0,0 +1,300 @@
+"""Stream URL extraction engine shared by the resolvers.
+
+Each rule is a precompiled pattern anchored on a literal that every match
+must contain ('.m3u8', 'file:', '<iframe', ...). Occurrences of the literals
+are located with plain substring search, which is much cheaper than running
+a regex over the whole document, and the pattern is only tried at those
+spots. The rules are walked together in document order, so a page is
+scanned once, and every candidate reports the rule that fired and its
+offset in the document.
+
+Documents may be str or, to skip decoding whole pages, bytes, bytearray or
+memoryview. Rules then run their bytes twin and only the URL of each
+candidate is decoded; offsets count bytes instead of characters.
+"""
+import re
+from collections import namedtuple
+
+Candidate = namedtuple('Candidate', ['rule', 'priority', 'offset', 'url'])
+
+# Characters that end an unquoted URL token, i.e. the complement of [^"\s]
+_TOKEN_STOP = frozenset(' \t\n\r\f\v"')
+_TOKEN_END = re.compile(r'[^"\s]*')
+
+# The same for bytes documents, where indexing yields ints
+_BYTES_TOKEN_STOP = frozenset(b' \t\n\r\f\v"')
+_BYTES_TOKEN_END = re.compile(br'[^"\s]*')
+
+def _is_text(document):
+    return isinstance(document, str)
+
+def _url(m):
+    """The URL group of a match, decoded if the document is bytes."""
+    url = m.group(1)
+    return url if _is_text(url) else url.decode('utf-8', 'replace')
+
+def _searchable(document):
+    """Return document in a form that has find(); a memoryview is unwrapped or else copied."""
+    if isinstance(document, memoryview):
+        obj = document.obj
+        if isinstance(obj, (bytes, bytearray)) and document.contiguous and document.nbytes == len(obj):
+            return obj
+        return document.tobytes()
+    return document
+
+class Rule(object):
+    """A compiled extraction pattern and the literal that anchors it.
+
+    By default the pattern starts with the literal and is matched right at
+    each occurrence. With within_token=True the literal lies somewhere inside
+    an unquoted URL (like '.m3u8'), and the pattern is searched within the
+    token surrounding the occurrence instead.
+
+    Patterns are ASCII, so for_bytes() can compile the same rule for bytes
+    documents.
+    """
+    __slots__ = ('name', 'literal', 'regex', 'within_token', '_stop', '_token_end', '_bytes_rule')
+
+    def __init__(self, name, literal, pattern, flags=0, within_token=False):
+        self.name = name
+        self.literal = literal
+        self.regex = re.compile(pattern, flags)
+        self.within_token = within_token
+        self._stop = _TOKEN_STOP
+        self._token_end = _TOKEN_END
+        self._bytes_rule = None
+
+    def for_bytes(self):
+        """Return this rule compiled for bytes documents, creating it on first use."""
+        if self._bytes_rule is None:
+            rule = Rule(self.name, self.literal.encode('ascii'), self.regex.pattern.encode('ascii'),
+                        self.regex.flags & ~re.UNICODE, self.within_token)
+            rule._stop = _BYTES_TOKEN_STOP
+            rule._token_end = _BYTES_TOKEN_END
+            self._bytes_rule = rule
+        return self._bytes_rule
+
+    def match_at(self, text, pos):
+        """Try the pattern at an occurrence of the literal found at pos."""
+        if not self.within_token:
+            return self.regex.match(text, pos)
+        start = pos
+        stop = self._stop
+        while start > 0 and text[start - 1] not in stop:
+            start -= 1
+        return self.regex.search(text, start, self._token_end.match(text, pos).end())
+
+    def first(self, text, pos=0):
+        """Return the leftmost match of the rule in text, or None.
+
+        text must be of the rule's own kind, str or bytes-like.
+        """
+        find = text.find
+        literal = self.literal
+        at = find(literal, pos)
+        while at >= 0:
+            m = self.match_at(text, at)
+            if m:
+                return m
+            at = find(literal, at + 1)
+        return None
+
+M3U8 = Rule('m3u8', '.m3u8', r'(https?://[^"\s]+\.m3u8[^"\s]*)', within_token=True)
+FILE = Rule('file', 'file:', r"file:\s*['\"]([^'\"]+)['\"]")
+URL = Rule('url', 'url:', r'url:\s*["\']([^"\']+\.m3u8[^"\']*)["\']')
+SOURCE = Rule('source', '<source', r'<source[^>]+src=["\']([^"\']+)["\']')
+IFRAME = Rule('iframe', '<iframe', r'<iframe[^>]+src=["\']([^"\']+)["\']')
+RTD = Rule('rtd', 'streams_hls', r'streams_hls.+?url:\s*["\']([^"\']+)["\']', re.DOTALL)
+
+class Extractor(object):
+    """Finds stream URL candidates for an ordered list of rules.
+
+    The order of the rules is their priority: a match of an earlier rule
+    anywhere in the page beats a match of a later rule, and among matches of
+    the same rule the leftmost one wins. name labels the extractor in traces.
+    """
+
+    def __init__(self, rules, name=None):
+        self.rules = tuple(rules)
+        self.name = name or '+'.join(rule.name for rule in self.rules)
+        self._bytes_rules = None
+
+    def rules_for(self, text):
+        """Return the rules to run on text: these, or their bytes twins."""
+        if _is_text(text):
+            return self.rules
+        if self._bytes_rules is None:
+            self._bytes_rules = tuple(rule.for_bytes() for rule in self.rules)
+        return self._bytes_rules
+
+    def _scan(self, text, pos, endpos, priorities, prune):
+        """Yield candidates of the given rule priorities in document order.
+
+        With prune=True, rules that can no longer beat the best candidate
+        found so far are dropped, and the scan stops after a match of the
+        highest priority rule.
+        """
+        text = _searchable(text)
+        rules = self.rules_for(text)
+        if endpos is None:
+            endpos = len(text)
+        find = text.find
+        active = list(priorities)
+        ends = {}
+        next_at = {}
+        for p in active:
+            # Bound the search so that a literal starting before endpos is found whole
+            ends[p] = endpos + len(rules[p].literal) - 1
+            next_at[p] = find(rules[p].literal, pos, ends[p])
+        while active:
+            at = -1
+            priority = -1
+            for p in active:
+                p_at = next_at[p]
+                if p_at >= 0 and (at < 0 or p_at < at):
+                    at = p_at
+                    priority = p
+            if priority < 0:
+                return
+            rule = rules[priority]
+            m = rule.match_at(text, at)
+            next_at[priority] = find(rule.literal, m.end() if m else at + 1, ends[priority])
+            if m:
+                yield Candidate(rule.name, priority, m.start(), _url(m))
+                if prune:
+                    active = [p for p in active if p < priority]
+
+    def scan(self, text, pos=0, endpos=None):
+        """Yield every candidate in document order.
+
+        Only anchor literals starting within [pos, endpos) are considered;
+        a match may extend past endpos.
+        """
+        return self._scan(text, pos, endpos, range(len(self.rules)), False)
+
+    def best(self, text):
+        """Return the winning Candidate for the page, or None.
+
+        The top priority rule is searched on its own first, since on most
+        pages it hits and the scan can stop there. Otherwise the remaining
+        rules are scanned together in a single pass.
+        """
+        text = _searchable(text)
+        rule = self.rules_for(text)[0]
+        m = rule.first(text)
+        if m:
+            return Candidate(rule.name, 0, m.start(), _url(m))
+        best = None
+        for candidate in self._scan(text, 0, None, range(1, len(self.rules)), True):
+            best = candidate
+        return best
+
+    def candidates(self, text):
+        """Return all candidates ordered by priority then offset, one per URL."""
+        seen = set()
+        result = []
+        for candidate in sorted(self.scan(text), key=lambda c: (c.priority, c.offset)):
+            if candidate.url not in seen:
+                seen.add(candidate.url)
+                result.append(candidate)
+        return result
+
+    def first(self, text, rule_name):
+        """Return the leftmost Candidate of the named rule, or None."""
+        text = _searchable(text)
+        for priority, rule in enumerate(self.rules_for(text)):
+            if rule.name == rule_name:
+                m = rule.first(text)
+                if m:
+                    return Candidate(rule.name, priority, m.start(), _url(m))
+                return None
+        raise KeyError(rule_name)
+
+# Characters of lookahead and lookbehind a StreamScanner keeps around the
+# scan position, so that a match split across chunks is only tried once whole
+STREAM_OVERLAP = 8192
+
+class StreamScanner(object):
+    """Finds the best candidate of a document that arrives in chunks.
+
+    Text is kept in a sliding window. Anchor literals are only tried once
+    STREAM_OVERLAP characters of text follow them, and the same amount is
+    kept before the scan position for matches that start before their
+    anchor, so the window never holds much more than one chunk plus twice
+    the overlap. Candidate offsets are relative to the whole document.
+
+    Chunks may be str or bytes, but all chunks of one document must be of
+    the same kind. Feeding bytes needs no incremental decoder, since a
+    multi-byte character split across chunks is only ever decoded whole,
+    inside a matched URL.
+    """
+
+    def __init__(self, extractor, overlap=STREAM_OVERLAP):
+        self.extractor = extractor
+        self.overlap = overlap
+        self.best = None
+        self._window = ''
+        self._base = 0
+        self._scan_from = 0
+
+    @property
+    def held(self):
+        """Size of the sliding window, in characters or bytes."""
+        return len(self._window)
+
+    @property
+    def done(self):
+        """True once the top priority rule matched and nothing can beat it."""
+        return self.best is not None and self.best.priority == 0
+
+    def feed(self, text, final=False):
+        """Add the next chunk of the document; returns self.done."""
+        if self.done:
+            return True
+        window = self._window + text if self._window else text
+        limit = len(window) if final else len(window) - self.overlap
+        if limit > self._scan_from:
+            priorities = range(self.best.priority if self.best else len(self.extractor.rules))
+            for candidate in self.extractor._scan(window, self._scan_from, limit, priorities, True):
+                self.best = candidate._replace(offset=candidate.offset + self._base)
+            self._scan_from = limit
+        drop = max(0, self._scan_from - self.overlap)
+        self._window = window[drop:]
+        self._base += drop
+        self._scan_from -= drop
+        return self.done
+
+    def close(self):
+        """Scan whatever is left in the window and return the best candidate."""
+        self.feed(self._window[:0], final=True)
+        return self.best
+
+def scan_chunks(extractor, chunks):
+    """Return the best candidate of a document given as an iterable of str or bytes chunks.
+
+    Stops consuming chunks as soon as the top priority rule matches. If
+    chunks is a generator it is closed at that point, which lets it release
+    its connection early.
+    """
+    scanner = StreamScanner(extractor)
+    try:
+        for chunk in chunks:
+            if scanner.feed(chunk):
+                return scanner.best
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    return scanner.close()
+
+# Generic player pages: an m3u8 anywhere, then player config, tags and iframes
+STANDARD = Extractor([M3U8, FILE, URL, SOURCE, IFRAME], 'standard')
+
+# rtd.rt.com embeds its stream list in a streams_hls config object
+RTD_PAGE = Extractor([RTD])
+
+# RTD pattern first, then the standard chain
+RTD_THEN_STANDARD = Extractor([RTD, M3U8, FILE, URL, SOURCE, IFRAME], 'rtd+standard')
+
+# Embedded player pages only carry the playlist URL itself
+M3U8_ONLY = Extractor([M3U8])
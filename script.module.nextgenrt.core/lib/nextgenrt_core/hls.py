@@ -0,0 +1,103 @@
+"""HLS master playlist parsing and variant selection.
+
+play_video hands Kodi the variant matching the stream_quality setting
+instead of the master playlist, so inputstream.adaptive does not have to
+estimate bandwidth before the first frame. Parsed master playlists are kept
+in the addon profile for a couple of minutes, long enough to cover a quick
+re-play or channel switch back.
+"""
+import re
+import time
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from nextgenrt_core import storage
+
+CACHE_FILE = 'hls_cache.json'
+
+# Seconds a parsed master playlist is reused
+CACHE_TTL = 120
+
+MAX_ENTRIES = 32
+
+QUALITIES = ('low', 'medium', 'high')
+
+# One rendition of a master playlist; audio is the AUDIO group id when the
+# audio comes from a separate EXT-X-MEDIA rendition, None otherwise
+Variant = namedtuple('Variant', 'bandwidth width height url audio')
+
+_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+def _attributes(line):
+    return dict((name, value.strip('"')) for name, value in _ATTRIBUTE.findall(line))
+
+def parse_master(text, base_url):
+    """Return the variants of a master playlist sorted by bandwidth, [] for a media playlist."""
+    variants = []
+    stream_inf = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            stream_inf = _attributes(line[len('#EXT-X-STREAM-INF:'):])
+        elif line and not line.startswith('#') and stream_inf is not None:
+            try:
+                bandwidth = int(stream_inf.get('BANDWIDTH', 0))
+            except ValueError:
+                bandwidth = 0
+            width = height = 0
+            resolution = stream_inf.get('RESOLUTION', '').lower().split('x')
+            if len(resolution) == 2 and resolution[0].isdigit() and resolution[1].isdigit():
+                width, height = int(resolution[0]), int(resolution[1])
+            variants.append(Variant(bandwidth, width, height, urljoin(base_url, line), stream_inf.get('AUDIO')))
+            stream_inf = None
+    variants.sort(key=lambda v: (v.bandwidth, v.height))
+    return variants
+
+def select(variants, quality):
+    """Return the variant for a quality of QUALITIES, or None if there are no variants.
+
+    Low is the lowest bandwidth, High the highest and Medium the one in the
+    middle, rounding down.
+    """
+    if not variants:
+        return None
+    if quality == 'low':
+        return variants[0]
+    if quality == 'medium':
+        return variants[(len(variants) - 1) // 2]
+    return variants[-1]
+
+def _fresh(entry, now):
+    """True if a stored cache entry is well formed and not expired yet."""
+    return (isinstance(entry, list) and len(entry) == 2
+            and isinstance(entry[0], (int, float)) and entry[0] > now
+            and isinstance(entry[1], list)
+            and all(isinstance(fields, list) and len(fields) == len(Variant._fields) for fields in entry[1]))
+
+class PlaylistCache(object):
+    """Parsed master playlists by URL, persisted as {url: [expiry time, [variant, ...]]}."""
+
+    def __init__(self, path):
+        self.path = path
+        entries = storage.read_json(path, default={})
+        now = time.time()
+        self._entries = dict((url, entry) for url, entry in entries.items()
+                             if _fresh(entry, now)) if isinstance(entries, dict) else {}
+
+    @classmethod
+    def open(cls):
+        """Open the cache stored in the addon profile directory."""
+        return cls(storage.profile_path(CACHE_FILE))
+
+    def variants(self, url, fetch):
+        """Return the variants of the master playlist at url; fetch(url) returns its body as bytes."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            return [Variant(*fields) for fields in entry[1]]
+        variants = parse_master(fetch(url).decode('utf-8', 'replace'), url)
+        self._entries[url] = [time.time() + CACHE_TTL, [list(v) for v in variants]]
+        if len(self._entries) > MAX_ENTRIES:
+            for old_url, _ in sorted(self._entries.items(), key=lambda item: item[1][0])[:-MAX_ENTRIES]:
+                del self._entries[old_url]
+        storage.write_json(self.path, self._entries)
+        return variants
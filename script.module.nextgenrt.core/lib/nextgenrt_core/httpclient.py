@@ -0,0 +1,383 @@
+"""Small HTTP client with per-host keep-alive connections.
+
+One HttpClient is shared by every fetch in a plugin invocation, so the
+page, iframe and playlist requests to the same host reuse one TCP/TLS
+connection instead of paying a new handshake each time. Responses are
+decompressed transparently (gzip, deflate and, if the brotli module is
+available, br), requests time out, failed requests are retried with
+backoff, and every request reports how long each phase took.
+
+Decompression is streamed: gzip and deflate output comes out in pieces of
+at most one chunk, so a small compressed read cannot turn into a large
+allocation, and iter_content() and read() stop at max_bytes of
+decompressed body when asked to.
+"""
+import socket
+import ssl
+import threading
+import time
+import zlib
+import http.client as httplib
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Seconds to wait for a connection or for data on it
+DEFAULT_TIMEOUT = 10
+
+# Extra attempts after a failed request, waiting backoff * 2**n seconds before each
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.25
+
+# Idle connections kept open per host
+MAX_IDLE_PER_HOST = 4
+
+MAX_REDIRECTS = 5
+
+# Bytes read from the socket per chunk
+CHUNK_SIZE = 16 * 1024
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate, br' if brotli else 'gzip, deflate',
+}
+
+_RETRY_STATUSES = frozenset([502, 503, 504])
+_REDIRECT_STATUSES = frozenset([301, 302, 303, 307, 308])
+
+class HttpError(IOError):
+    """Raised for responses with an error status."""
+
+    def __init__(self, url, status, reason):
+        IOError.__init__(self, 'HTTP %d %s: %s' % (status, reason, url))
+        self.url = url
+        self.status = status
+
+class Timing(object):
+    """Seconds spent in each phase of one request.
+
+    dns, connect and tls are zero when a kept-alive connection was reused.
+    """
+    __slots__ = ('url', 'status', 'reused', 'dns', 'connect', 'tls', 'ttfb', 'body', 'bytes', 'decoded')
+
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.reused = False
+        self.dns = self.connect = self.tls = self.ttfb = self.body = 0.0
+        # Bytes read from the socket, and bytes of body they decompressed to
+        self.bytes = 0
+        self.decoded = 0
+
+    @property
+    def total(self):
+        return self.dns + self.connect + self.tls + self.ttfb + self.body
+
+    def __repr__(self):
+        return ('%s %s%s dns=%.0fms connect=%.0fms tls=%.0fms ttfb=%.0fms body=%.0fms bytes=%d decoded=%d' % (
+            self.status, self.url, ' (reused)' if self.reused else '', self.dns * 1000,
+            self.connect * 1000, self.tls * 1000, self.ttfb * 1000, self.body * 1000, self.bytes,
+            self.decoded))
+
+class _Connection(httplib.HTTPConnection):
+    """HTTPConnection that times name resolution and the TCP connect."""
+
+    def __init__(self, host, port=None, timeout=DEFAULT_TIMEOUT):
+        httplib.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self.dns_time = self.connect_time = self.tls_time = 0.0
+
+    def _open_socket(self):
+        start = time.time()
+        addresses = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)
+        resolved = time.time()
+        self.dns_time = resolved - start
+        error = None
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                sock.settimeout(self.timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.connect(address)
+            except (socket.error, OSError) as e:
+                sock.close()
+                error = e
+                continue
+            self.connect_time = time.time() - resolved
+            return sock
+        raise error or socket.error('getaddrinfo returned no addresses for %s' % self.host)
+
+    def connect(self):
+        self.sock = self._open_socket()
+
+class _TLSConnection(_Connection):
+    """_Connection wrapped in TLS, timing the handshake separately."""
+    default_port = 443
+
+    def __init__(self, host, port=None, timeout=DEFAULT_TIMEOUT, context=None):
+        _Connection.__init__(self, host, port, timeout=timeout)
+        self.context = context or ssl.create_default_context()
+
+    def connect(self):
+        sock = self._open_socket()
+        start = time.time()
+        self.sock = self.context.wrap_socket(sock, server_hostname=self.host)
+        self.tls_time = time.time() - start
+
+class Response(object):
+    """A response whose body is read and decompressed on demand.
+
+    Read the body with iter_content() or read(), then close() the response:
+    a fully read response hands its connection back to the pool, a partly
+    read one closes it.
+    """
+
+    def __init__(self, client, key, conn, raw, url, timing):
+        self.url = url
+        self.status = raw.status
+        self.reason = raw.reason
+        self.headers = raw.msg
+        self.timing = timing
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self._raw = raw
+        self._started = time.time()
+        encoding = (raw.getheader('Content-Encoding') or '').strip().lower()
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = _DeflateDecoder()
+        elif encoding == 'br' and brotli is not None:
+            self._decompressor = _BrotliDecoder()
+        else:
+            self._decompressor = None
+
+    def _decode(self, data, max_length):
+        """Yield the decompressed output of data in pieces of at most max_length bytes."""
+        decompressor = self._decompressor
+        if decompressor is None:
+            if data:
+                yield data
+            return
+        while True:
+            out = decompressor.decompress(data, max_length)
+            data = decompressor.unconsumed_tail
+            if out:
+                yield out
+            # A full piece may leave output pending inside the decompressor
+            if not data and len(out) < max_length:
+                return
+
+    def iter_content(self, chunk_size=CHUNK_SIZE, max_bytes=None):
+        """Yield decompressed chunks of the body, each at most chunk_size bytes.
+
+        With max_bytes, reading stops once that much body was produced; the
+        response is then only partly read and close() drops its connection.
+        """
+        remaining = max_bytes
+        while self._raw is not None:
+            data = self._raw.read(chunk_size)
+            if not data:
+                self.close()
+                return
+            self.timing.bytes += len(data)
+            for out in self._decode(data, chunk_size):
+                if remaining is not None:
+                    out = out[:remaining]
+                    remaining -= len(out)
+                self.timing.decoded += len(out)
+                yield out
+                if remaining is not None and remaining <= 0:
+                    return
+
+    def read(self, max_bytes=None):
+        """Read and return the whole decompressed body, or its first max_bytes."""
+        return b''.join(self.iter_content(max_bytes=max_bytes))
+
+    def close(self):
+        """Finish the response, reusing the connection if the body was fully read."""
+        raw, self._raw = self._raw, None
+        if raw is None:
+            return
+        self.timing.body = time.time() - self._started
+        reusable = raw.isclosed() and not raw.will_close
+        if not reusable:
+            raw.close()
+        self._client._release(self._key, self._conn, reusable)
+        self._client._report(self.timing)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class _DeflateDecoder(object):
+    """Decodes 'deflate' bodies, which servers send either zlib-wrapped or raw."""
+
+    def __init__(self):
+        self._obj = None
+        self._first = b''
+
+    @property
+    def unconsumed_tail(self):
+        return self._obj.unconsumed_tail if self._obj is not None else b''
+
+    def decompress(self, data, max_length=0):
+        if self._obj is None:
+            self._first += data
+            try:
+                obj = zlib.decompressobj()
+                out = obj.decompress(self._first, max_length)
+            except zlib.error:
+                obj = zlib.decompressobj(-zlib.MAX_WBITS)
+                out = obj.decompress(self._first, max_length)
+            self._obj = obj
+            self._first = b''
+            return out
+        return self._obj.decompress(data, max_length)
+
+class _BrotliDecoder(object):
+    """Adapts brotli.Decompressor to the zlib decompressobj interface.
+
+    The brotli module cannot bound its output, so max_length is ignored.
+    """
+    unconsumed_tail = b''
+
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+
+    def decompress(self, data, max_length=0):
+        return self._obj.process(data)
+
+class HttpClient(object):
+    """Thread-safe HTTP client keeping idle connections per host.
+
+    on_timing, if given, is called with the Timing of every finished request.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 headers=None, on_timing=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self.on_timing = on_timing
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._context = None
+
+    def _connection(self, key):
+        """Return (connection, reused) for a (scheme, host, port) key."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+            if key[0] == 'https' and self._context is None:
+                self._context = ssl.create_default_context()
+        scheme, host, port = key
+        if scheme == 'https':
+            return _TLSConnection(host, port, timeout=self.timeout, context=self._context), False
+        return _Connection(host, port, timeout=self.timeout), False
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < MAX_IDLE_PER_HOST:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def _report(self, timing):
+        if self.on_timing is not None:
+            self.on_timing(timing)
+
+    def _send(self, method, url, headers):
+        """Send one request without retries or redirects and return a Response."""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL scheme: %s' % url)
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+        conn, reused = self._connection(key)
+        timing = Timing(url)
+        timing.reused = reused
+        try:
+            start = time.time()
+            conn.request(method, path, headers=request_headers)
+            if not reused:
+                timing.dns, timing.connect, timing.tls = conn.dns_time, conn.connect_time, conn.tls_time
+                start += timing.dns + timing.connect + timing.tls
+            raw = conn.getresponse()
+            timing.ttfb = time.time() - start
+        except Exception:
+            conn.close()
+            raise
+        timing.status = raw.status
+        return Response(self, key, conn, raw, url, timing)
+
+    def open(self, url, headers=None, method='GET'):
+        """Send a request and return the Response with its body still unread.
+
+        Redirects are followed, and connection errors and 502/503/504
+        responses are retried. Other error statuses raise HttpError.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send_with_retries(method, url, headers)
+            location = response.headers.get('Location')
+            if response.status not in _REDIRECT_STATUSES or not location:
+                break
+            response.read()
+            url = urljoin(url, location)
+            if response.status == 303:
+                method = 'GET'
+        if response.status >= 400:
+            response.close()
+            raise HttpError(url, response.status, response.reason)
+        return response
+
+    def _send_with_retries(self, method, url, headers):
+        attempt = 0
+        while True:
+            try:
+                response = self._send(method, url, headers)
+            except (httplib.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # A kept-alive connection the server already closed; retry at once
+                attempt += 1
+                if attempt > self.retries + 1:
+                    raise
+                continue
+            except (socket.error, OSError, httplib.HTTPException):
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status not in _RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                response.read()
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def get(self, url, headers=None):
+        """Fetch url and return its decompressed body as bytes."""
+        with self.open(url, headers) as response:
+            return response.read()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
@@ -0,0 +1,164 @@
+"""Health probing of candidate stream URLs.
+
+A page often yields several stream URLs (m3u8 links, player config,
+<source> tags). StreamProber checks them concurrently: playlists with a GET
+that must return an #EXTM3U header, anything else with a HEAD request. The
+first candidate to answer healthily wins, so a dead or slow CDN no longer
+makes Kodi wait for inputstream.adaptive to time out. Results are
+remembered per host in the addon profile, and a candidate on a host known
+to be healthy is used without probing.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+from nextgenrt_core import httpclient
+from nextgenrt_core import storage
+
+MEMORY_FILE = 'probe_hosts.json'
+
+# Seconds all probes of one resolution may take together
+PROBE_DEADLINE = 3.0
+
+# Candidates probed at the same time
+MAX_PROBES = 6
+
+# Seconds a host's probe result is trusted, healthy and failed
+HEALTHY_TTL = 1800
+FAILED_TTL = 300
+
+# Bytes of a playlist read to check its header
+PLAYLIST_HEAD_BYTES = 1024
+
+def normalize(url):
+    """Complete protocol-relative URLs; returns None for URLs that cannot be probed."""
+    if url.startswith('//'):
+        url = 'https:' + url
+    if not url.startswith(('http://', 'https://')):
+        return None
+    return url
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+class HostMemory(object):
+    """Probe outcomes per host: {host: [latency in seconds or None if failed, expiry time]}."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hosts = storage.read_json(path, default={})
+        if not isinstance(self._hosts, dict):
+            self._hosts = {}
+
+    @classmethod
+    def open(cls):
+        """Open the memory stored in the addon profile directory."""
+        return cls(storage.profile_path(MEMORY_FILE))
+
+    def lookup(self, host):
+        """Return (known, latency) for a host; latency is None for a failed host."""
+        with self._lock:
+            entry = self._hosts.get(host)
+        if entry is None or entry[1] <= time.time():
+            return False, None
+        return True, entry[0]
+
+    def record(self, host, latency):
+        ttl = HEALTHY_TTL if latency is not None else FAILED_TTL
+        with self._lock:
+            self._hosts[host] = [latency, time.time() + ttl]
+
+    def save(self):
+        now = time.time()
+        with self._lock:
+            hosts = dict((host, entry) for host, entry in self._hosts.items() if entry[1] > now)
+        storage.write_json(self.path, hosts)
+
+class StreamProber(object):
+    """Picks the fastest healthy stream URL among candidates."""
+
+    def __init__(self, memory, client=None, deadline=PROBE_DEADLINE):
+        self.memory = memory
+        self.deadline = deadline
+        self.client = client or httpclient.HttpClient(timeout=deadline, retries=0)
+
+    def known_healthy(self, url):
+        """True if url's host answered a recent probe healthily."""
+        url = normalize(url)
+        if url is None:
+            return False
+        known, latency = self.memory.lookup(_host(url))
+        return known and latency is not None
+
+    def probe(self, url):
+        """Return the seconds url took to answer healthily, or None."""
+        start = time.time()
+        try:
+            if '.m3u8' in url:
+                with self.client.open(url) as response:
+                    head = b''
+                    for data in response.iter_content(PLAYLIST_HEAD_BYTES):
+                        head += data
+                        if len(head) >= PLAYLIST_HEAD_BYTES:
+                            break
+                if not head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U'):
+                    return None
+            else:
+                self.client.open(url, method='HEAD').close()
+        except Exception:
+            return None
+        return time.time() - start
+
+    def choose(self, urls):
+        """Return the first candidate to prove healthy, or None if none did in time.
+
+        A candidate on a host remembered as healthy is returned at once (the
+        lowest remembered latency wins); hosts remembered as failed are not
+        probed again until their entry expires.
+        """
+        candidates = []
+        for url in urls:
+            url = normalize(url)
+            if url is not None and url not in candidates:
+                candidates.append(url)
+        to_probe = []
+        remembered = []
+        for index, url in enumerate(candidates):
+            known, latency = self.memory.lookup(_host(url))
+            if not known:
+                to_probe.append(url)
+            elif latency is not None:
+                remembered.append((latency, index, url))
+        if remembered:
+            return min(remembered)[2]
+        if not to_probe:
+            return None
+
+        results = []
+        finished = threading.Condition()
+
+        def worker(url):
+            latency = self.probe(url)
+            self.memory.record(_host(url), latency)
+            with finished:
+                results.append((url, latency))
+                finished.notify()
+
+        to_probe = to_probe[:MAX_PROBES]
+        for url in to_probe:
+            thread = threading.Thread(target=worker, args=(url,), name='nextgenrt-probe')
+            thread.daemon = True
+            thread.start()
+
+        # Results arrive in the order the probes finished, so the first healthy one is the fastest
+        end = time.time() + self.deadline
+        with finished:
+            while True:
+                winner = next((url for url, latency in results if latency is not None), None)
+                remaining = end - time.time()
+                if winner is not None or len(results) == len(to_probe) or remaining <= 0:
+                    break
+                finished.wait(remaining)
+        self.memory.save()
+        return winner
@@ -0,0 +1,372 @@
+"""Stream resolution and playback shared by the NextGen RT plugins.
+
+A Resolver turns a page URL into a playable stream: it downloads the page
+through one keep-alive HttpClient, scans it while it arrives, probes the
+stream candidates it finds, follows embedded players and picks the HLS
+variant for the stream_quality setting. play() hands the result to Kodi,
+going through the StreamCache and dropping cached URLs that fail to play.
+Pages known to hold no stream and hosts whose circuit is open are skipped
+without a fetch; see nextgenrt_core.availability.
+
+Pages are scanned as undecoded bytes: the body is decompressed chunk by
+chunk into one buffer capped at MAX_PAGE_BYTES, and only the URLs the
+extraction rules match are decoded. The most body a fetch held at once is
+logged and added to the trace.
+
+Every click starts a fresh interpreter, so the modules needed only to fetch
+and scan pages (extract, httpclient and with it ssl, http.client, email,
+probe, hls) are imported by the methods that use them. Playing a cached
+stream never loads them.
+"""
+import threading
+
+import xbmc
+import xbmcaddon
+import xbmcgui
+import xbmcplugin
+
+from nextgenrt_core import cache
+from nextgenrt_core import trace
+
+# Stream resolution stops reading a page after MAX_PAGE_BYTES
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+
+def stream_quality():
+    """Return the stream_quality setting as one of hls.QUALITIES."""
+    value = xbmcaddon.Addon().getSetting('stream_quality').strip().lower()
+    # Enum settings are stored as the index of the chosen value
+    return {'0': 'low', '1': 'medium', '2': 'high'}.get(value, value) or 'high'
+
+def async_mode():
+    """True if the async_resolver setting asks for concurrent follow-up fetches; see nextgenrt_core.aio."""
+    return xbmcaddon.Addon().getSetting('async_resolver') == 'true'
+
+class Resolver(object):
+    """Resolves and plays the pages of one plugin invocation.
+
+    name prefixes every log line ("NextGen RT News"). extractor_for(page_url)
+    returns the extract.Extractor to scan a page with; by default every page
+    is scanned with extract.STANDARD. The HTTP client and the stream prober
+    are created on first use and shared by all threads of the invocation.
+    """
+
+    def __init__(self, name, extractor_for=None):
+        self.name = name
+        self.extractor_for = extractor_for
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._stream_prober = None
+        self._availability = None
+        self._debug = None
+
+    def debug_logging(self):
+        """Whether Kodi's debug logging is on, asked once per invocation."""
+        if self._debug is None:
+            self._debug = xbmc.getCondVisibility('System.GetBool(debug.showloginfo)')
+        return self._debug
+
+    def log(self, message, *args, level=xbmc.LOGDEBUG):
+        """Log message % args; a debug line is not even formatted while debug logging is off."""
+        if level == xbmc.LOGDEBUG and not self.debug_logging():
+            return
+        xbmc.log("%s - %s" % (self.name, message % args if args else message), level)
+
+    def _log_timing(self, timing):
+        """Log where the time of an HTTP request went and add it to the trace."""
+        self.log("HTTP %r", timing)
+        if trace.active():
+            trace.add('fetch', timing.total, timing.url)
+            trace.add('fetch.connect', timing.dns + timing.connect + timing.tls, timing.url)
+            trace.add('fetch.ttfb', timing.ttfb, timing.url)
+            trace.add('fetch.body', timing.body, timing.url)
+
+    def http(self):
+        """Return the invocation's HttpClient, creating it on first use."""
+        with self._lock:
+            if self._http_client is None:
+                from nextgenrt_core import httpclient
+                self._http_client = httpclient.HttpClient(on_timing=self._log_timing)
+        return self._http_client
+
+    def prober(self):
+        """Return the invocation's StreamProber, creating it on first use."""
+        with self._lock:
+            if self._stream_prober is None:
+                from nextgenrt_core import probe
+                self._stream_prober = probe.StreamProber(probe.HostMemory.open())
+        return self._stream_prober
+
+    def availability(self):
+        """Return the invocation's Availability, loading it on first use."""
+        with self._lock:
+            if self._availability is None:
+                from nextgenrt_core import availability
+                self._availability = availability.Availability.open()
+        return self._availability
+
+    def close(self):
+        """Close the idle connections of the HTTP client, if one was created."""
+        with self._lock:
+            client, self._http_client = self._http_client, None
+        if client is not None:
+            client.close()
+
+    def iter_page(self, page_url, max_bytes=MAX_PAGE_BYTES):
+        """Yield the decompressed body of a page chunk by chunk, as bytes.
+
+        At most max_bytes of decompressed content are produced. The connection
+        is released when the generator finishes or is closed early by the
+        caller.
+        """
+        response = self.http().open(page_url)
+        try:
+            for data in response.iter_content(max_bytes=max_bytes):
+                yield data
+        finally:
+            response.close()
+
+    def log_page_memory(self, page_url, held):
+        """Log the most bytes of a page body held at once and add it to the trace."""
+        self.log("Page %s: at most %d bytes held", page_url, held)
+        trace.memory('page', held, page_url)
+
+    def log_candidate(self, candidate):
+        """Log which extraction rule produced a stream URL."""
+        self.log("Found stream URL (%s pattern at offset %d): %s", candidate.rule, candidate.offset, candidate.url)
+
+    def follow_iframe(self, iframe_url):
+        """Extract stream URL from an iframe embed.
+
+        Returns None if the embed has no stream. A failure to fetch it (a
+        timeout, an HTTP error) is raised, so that it counts against the host
+        instead of marking the page as holding no stream.
+        """
+        # Skip Rumble iframes
+        if 'rumble.com' in iframe_url:
+            self.log("Found Rumble iframe but cannot extract stream directly", level=xbmc.LOGWARNING)
+            return None
+
+        # Ensure full URL
+        if not iframe_url.startswith('http'):
+            iframe_url = 'https:' + iframe_url
+
+        self.log("Found iframe, fetching: %s", iframe_url)
+
+        from nextgenrt_core import extract
+        try:
+            with trace.span('iframe', iframe_url):
+                candidate = extract.scan_chunks(extract.M3U8_ONLY, self.iter_page(iframe_url))
+        except EnvironmentError as e:
+            self.log("Error fetching iframe: %s", e, level=xbmc.LOGWARNING)
+            raise
+        if candidate:
+            self.log_candidate(candidate)
+            return candidate.url
+        return None
+
+    def page_candidates(self, page_url, extractor):
+        """Scan a page while it downloads and return its stream candidates, best first.
+
+        Reading stops as soon as the top rule matches on a host that recently
+        probed healthy; otherwise the whole page is read so that every
+        candidate can be probed. The body is kept undecoded in one buffer,
+        which grows in place instead of being joined from chunks at the end.
+        """
+        from nextgenrt_core import extract
+        chunks = self.iter_page(page_url)
+        scanner = extract.StreamScanner(extractor)
+        span_name = 'extract.' + extractor.name
+        page = bytearray()
+        window = 0
+        try:
+            for chunk in chunks:
+                page += chunk
+                if scanner.done:
+                    continue
+                with trace.span(span_name, page_url):
+                    found = scanner.feed(chunk)
+                window = max(window, scanner.held)
+                if found and self.prober().known_healthy(scanner.best.url):
+                    return [scanner.best]
+        finally:
+            chunks.close()
+            self.log_page_memory(page_url, len(page) + window)
+        with trace.span(span_name, page_url):
+            return extractor.candidates(page)
+
+    def choose_stream(self, candidates):
+        """Probe the page's candidates and return the stream URL to hand to Kodi."""
+        from nextgenrt_core import probe
+        direct = [c for c in candidates if c.rule != 'iframe']
+        if direct:
+            self.log("Probing %d stream candidates", len(direct))
+            with trace.span('probe', '%d candidates' % len(direct)):
+                stream_url = self.prober().choose([c.url for c in direct])
+            for candidate in direct:
+                if stream_url and probe.normalize(candidate.url) == stream_url:
+                    self.log_candidate(candidate)
+                    return stream_url
+
+        # Nothing on the page answered; an embedded player may carry the stream
+        error = None
+        for candidate in candidates:
+            if candidate.rule == 'iframe':
+                try:
+                    stream_url = self.follow_iframe(candidate.url)
+                except EnvironmentError as e:
+                    error = e
+                    continue
+                if stream_url:
+                    return stream_url
+
+        # No probe succeeded in time, so fall back to the best candidate as before
+        if direct:
+            self.log("No stream candidate answered the probe, using the first", level=xbmc.LOGWARNING)
+            self.log_candidate(direct[0])
+            return direct[0].url
+        # An embed that could not be fetched says nothing about the page
+        if error is not None:
+            raise error
+        return None
+
+    def get_stream_url(self, page_url):
+        """Extract the actual stream URL from a page."""
+        from nextgenrt_core import extract
+        from nextgenrt_core import httpclient
+        availability = self.availability()
+        reason = availability.check(page_url)
+        if reason:
+            self.log("Skipping page (%s): %s", reason, page_url, level=xbmc.LOGWARNING)
+            return None
+        try:
+            self.log("Fetching page: %s", page_url)
+            extractor = self.extractor_for(page_url) if self.extractor_for else extract.STANDARD
+
+            # Collect every stream URL on the page and play the fastest one that works
+            with trace.span('resolve', page_url):
+                if async_mode():
+                    from nextgenrt_core import aio
+                    stream_url = aio.resolve(self, page_url, extractor, MAX_PAGE_BYTES)
+                else:
+                    stream_url = self.choose_stream(self.page_candidates(page_url, extractor))
+
+            if stream_url:
+                availability.record_success(page_url)
+            else:
+                self.log("No stream URL found in page", level=xbmc.LOGERROR)
+                availability.remember_missing(page_url, 'no stream')
+
+            return stream_url
+        except httpclient.HttpError as e:
+            # A 4xx is about this page only; the host itself answered
+            if e.status < 500:
+                availability.remember_missing(page_url, 'HTTP %d' % e.status)
+            else:
+                availability.record_failure(page_url)
+            self.log("Error getting stream URL: %s", e, level=xbmc.LOGERROR)
+            return None
+        except EnvironmentError as e:
+            availability.record_failure(page_url)
+            self.log("Error getting stream URL: %s", e, level=xbmc.LOGERROR)
+            return None
+        except Exception as e:
+            self.log("Error getting stream URL: %s", e, level=xbmc.LOGERROR)
+            return None
+        finally:
+            availability.save()
+
+    def select_variant(self, master_url, quality=None):
+        """Return (URL to play, extra ListItem properties) for an HLS stream, or None.
+
+        The variant matching quality (the stream_quality setting by default) is
+        played directly. If its audio comes from a separate rendition, the
+        master playlist is kept and inputstream.adaptive is told which variant
+        to choose instead. None means the master playlist could not be read.
+        """
+        from nextgenrt_core import hls
+        try:
+            with trace.span('hls', master_url):
+                # Only a cache miss needs the HTTP client, so it is not created up front
+                variants = hls.PlaylistCache.open().variants(master_url, lambda url: self.http().get(url))
+        except Exception as e:
+            self.log("Could not read master playlist: %s", e, level=xbmc.LOGWARNING)
+            return None
+        variant = hls.select(variants, quality or stream_quality())
+        if variant is None:
+            return master_url, {}
+        self.log("Selected %d bit/s %dx%d variant of %d",
+                 variant.bandwidth, variant.width, variant.height, len(variants))
+        if variant.audio is None:
+            return variant.url, {}
+        properties = {'inputstream.adaptive.chooser_bandwidth_max': str(variant.bandwidth)}
+        if variant.height:
+            properties['inputstream.adaptive.chooser_resolution_max'] = '%dp' % variant.height
+        return master_url, properties
+
+    def play(self, handle, url, resolve=None, verified=None):
+        """Resolve a page through the stream cache and hand the stream to Kodi.
+
+        resolve(page_url) returns a stream URL on a cache miss, get_stream_url
+        by default. verified(page_url), if given, is asked first for a stream
+        URL that was checked recently and is played without resolving. The
+        HLS variant picked for a stream URL is kept with its cache entry, so
+        a warm play sends no request at all.
+        """
+        self.log("Playing from: %s", url)
+        stream_cache = cache.StreamCache.open()
+        if cache.handoff_failed(url):
+            # The stream handed over from a cache moments ago did not start
+            self.log("Cached stream URL failed to play, resolving again", level=xbmc.LOGWARNING)
+            stream_cache.invalidate(url)
+            cache.forget_handoff()
+            verified = None
+        stream_url = verified(url) if verified else None
+        from_cache = bool(stream_url)
+        if stream_url:
+            self.log("Using verified stream URL")
+            if stream_cache.get(url) != stream_url:
+                stream_cache.put(url, stream_url)
+        else:
+            stream_url, from_cache = stream_cache.resolve(url, resolve or self.get_stream_url)
+            if from_cache:
+                self.log("Using cached stream URL")
+
+        if stream_url:
+            self.log("Resolved to stream: %s", stream_url)
+
+            # Pick the HLS variant for the quality setting, once per cached stream URL
+            play_url, properties = stream_url, {}
+            if '.m3u8' in stream_url:
+                quality = stream_quality()
+                chosen = stream_cache.variant(url, stream_url, quality)
+                if chosen is None:
+                    chosen = self.select_variant(stream_url, quality)
+                    if chosen is not None:
+                        stream_cache.set_variant(url, stream_url, quality, *chosen)
+                else:
+                    self.log("Using cached variant")
+                if chosen is not None:
+                    play_url, properties = chosen
+            stream_cache.save()
+
+            # Create list item with the stream URL
+            list_item = xbmcgui.ListItem(path=play_url)
+
+            # Set properties for HLS/m3u8 streams
+            if '.m3u8' in stream_url:
+                self.log("Setting up HLS stream with inputstream.adaptive")
+                # For Kodi 19+ (Matrix and later)
+                list_item.setProperty('inputstream', 'inputstream.adaptive')
+                list_item.setContentLookup(False)
+                for key, value in properties.items():
+                    list_item.setProperty(key, value)
+
+            with trace.span('setResolvedUrl', 'cached' if from_cache else 'resolved'):
+                xbmcplugin.setResolvedUrl(handle, True, list_item)
+
+            # A cached URL may have expired upstream; a quick retry of this page drops it
+            if from_cache:
+                cache.remember_handoff(url)
+        else:
+            self.log("Failed to resolve stream URL", level=xbmc.LOGERROR)
+            xbmcplugin.setResolvedUrl(handle, False, xbmcgui.ListItem())
@@ -0,0 +1,37 @@
+"""Helpers for files kept in the addon profile directory."""
+import json
+import os
+import threading
+
+_profile_dir = None
+
+def profile_dir():
+    """Return the addon profile directory, creating it on first use."""
+    global _profile_dir
+    if _profile_dir is None:
+        import xbmcaddon
+        import xbmcvfs
+        path = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+        _profile_dir = path
+    return _profile_dir
+
+def profile_path(name):
+    """Return the full path of a file in the addon profile directory."""
+    return os.path.join(profile_dir(), name)
+
+def read_json(path, default=None):
+    """Load a JSON file, returning default if it is missing or unreadable."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def write_json(path, data):
+    """Write a JSON file atomically so readers never see a partial file."""
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
@@ -0,0 +1,172 @@
+"""Timing spans for the hot paths of one plugin invocation.
+
+run() starts a trace for a sample of invocations, chosen by the
+trace_sample_rate setting. Spans (fetch, decode, extraction, iframe
+follow, directory build, setResolvedUrl, ...) are aggregated in memory by
+name and the trace is appended to trace.jsonl in the addon profile as one
+compact JSON line when the invocation ends:
+
+    {"ts": 1760000000, "addon": "nextgenrt", "route": "play", "arg": "https://...",
+     "ms": 412.5, "spans": {"fetch": [count, total ms, max ms, errors, slowest detail], ...},
+     "memory": {"page": [count, peak bytes, detail of the peak], ...}}
+
+Memory samples (memory()) record how many bytes something held at its
+peak, such as the body of a fetched page; "memory" is left out when there
+are none.
+
+When the invocation is not sampled, span() returns a shared no-op context
+manager, so instrumented code pays one function call per span.
+"""
+import json
+import os
+import threading
+import time
+
+from nextgenrt_core import storage
+
+TRACE_FILE = 'trace.jsonl'
+
+# Once the file grows past this, the older half of its lines is dropped
+MAX_FILE_BYTES = 256 * 1024
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span(object):
+    __slots__ = ('tracer', 'name', 'detail', 'start')
+
+    def __init__(self, tracer, name, detail):
+        self.tracer = tracer
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.add(self.name, time.perf_counter() - self.start, self.detail, exc_type is not None)
+        return False
+
+class Tracer(object):
+    """Spans of one invocation, aggregated per name; safe to use from any thread."""
+
+    def __init__(self, addon, route, arg=None):
+        self.addon = addon
+        self.route = route
+        self.arg = arg
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # name -> [count, total seconds, max seconds, errors, detail of the slowest]
+        self._spans = {}
+        # name -> [count, max bytes, detail of the largest]
+        self._memory = {}
+
+    def span(self, name, detail=None):
+        return _Span(self, name, detail)
+
+    def add(self, name, seconds, detail=None, failed=False):
+        """Record a span measured by the caller."""
+        with self._lock:
+            entry = self._spans.get(name)
+            if entry is None:
+                entry = self._spans[name] = [0, 0.0, 0.0, 0, None]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds >= entry[2]:
+                entry[2] = seconds
+                entry[4] = detail
+            if failed:
+                entry[3] += 1
+
+    def memory(self, name, nbytes, detail=None):
+        """Record a memory sample: nbytes held at the peak of something."""
+        with self._lock:
+            entry = self._memory.get(name)
+            if entry is None:
+                entry = self._memory[name] = [0, 0, None]
+            entry[0] += 1
+            if nbytes >= entry[1]:
+                entry[1] = nbytes
+                entry[2] = detail
+
+    def record(self):
+        """Return the trace as a dict ready to be written."""
+        with self._lock:
+            spans = dict((name, [count, round(total * 1000, 2), round(longest * 1000, 2), errors, detail])
+                         for name, (count, total, longest, errors, detail) in self._spans.items())
+            memory = dict((name, list(entry)) for name, entry in self._memory.items())
+        record = {
+            'ts': int(self.started), 'addon': self.addon, 'route': self.route, 'arg': self.arg,
+            'ms': round((time.perf_counter() - self._start) * 1000, 2), 'spans': spans,
+        }
+        if memory:
+            record['memory'] = memory
+        return record
+
+# Tracer of this invocation, None when it is not sampled
+_tracer = None
+
+def start(addon, route, arg=None, rate=0.0):
+    """Trace this invocation with probability rate (0 to 1); returns whether it is traced."""
+    global _tracer
+    _tracer = None
+    if rate > 0:
+        import random
+        if random.random() < rate:
+            _tracer = Tracer(addon, route, arg)
+    return _tracer is not None
+
+def active():
+    """True if this invocation is being traced."""
+    return _tracer is not None
+
+def span(name, detail=None):
+    """Context manager timing a block as a span of the current trace."""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, detail)
+
+def add(name, seconds, detail=None):
+    """Record a span measured by the caller, if this invocation is traced."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add(name, seconds, detail)
+
+def memory(name, nbytes, detail=None):
+    """Record a memory sample, if this invocation is traced."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.memory(name, nbytes, detail)
+
+def _append_line(path, line):
+    with open(path, 'a') as f:
+        f.write(line + '\n')
+    if os.path.getsize(path) > MAX_FILE_BYTES:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines[len(lines) // 2:])
+        os.replace(tmp_path, path)
+
+def finish():
+    """Write the current trace to the profile and stop tracing."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    try:
+        _append_line(storage.profile_path(TRACE_FILE), json.dumps(tracer.record(), separators=(',', ':')))
+    except (IOError, OSError):
+        pass